@@ -1,9 +1,11 @@
+from .base import StageAgent
 from .product import SeniorPreSalesConsultantAgent, ProductManagerAgent, DesignerAgent
 from .engineer import ArchitectAgent, DeveloperAgent
 from .quality import ReviewerAgent
 from .technical import TechnicalAgent
 
 __all__ = [
+    'StageAgent',
     'SeniorPreSalesConsultantAgent',
     'ProductManagerAgent',
     'DesignerAgent',
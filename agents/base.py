@@ -0,0 +1,42 @@
+"""
+Agent 基礎類別
+"""
+from crewai import Agent
+
+from utils.context_budget import get_context_budget
+from utils.doc_index import get_doc_index
+from utils.llm_monitor import get_llm_monitor
+from utils.run_cache import get_run_cache
+
+class StageAgent(Agent):
+    """
+    可由任務自訂執行方式的 Agent
+
+    - 階段輸入（任務描述、模型、上下文與相關配置）與上次執行相同時直接重用上次的輸出（見 utils.run_cache）
+    - 任務帶有 runner（見 tasks.stage_task.StageTask）時，由 runner(agent, task, context) 執行並返回結果文字，
+      runner 返回 None 時使用 Agent 的預設執行方式
+    """
+
+    def execute_task(self, task, context=None, tools=None):
+        run_cache = get_run_cache()
+        monitor_info = get_llm_monitor().agents.get(self.role, {})
+        agent_key = monitor_info.get("agent")
+        settings = {
+            "context_budget": get_context_budget().budgets.get(agent_key),
+            "retrieval_top_k": get_doc_index().top_k.get(agent_key, 0),
+        }
+        input_hash = run_cache.input_hash(task, monitor_info.get("model"), context, settings)
+        cached = run_cache.lookup(task, input_hash)
+        if cached is not None:
+            return cached
+        result = self._execute_stage(task, context, tools)
+        run_cache.store(task, input_hash, result)
+        return result
+
+    def _execute_stage(self, task, context=None, tools=None):
+        runner = getattr(task, "runner", None)
+        if runner is not None:
+            result = runner(self, task, context)
+            if result is not None:
+                return result
+        return super().execute_task(task, context=context, tools=tools)
@@ -4,9 +4,11 @@
 """
 from crewai import Agent
 
+from .base import StageAgent
+
 def ArchitectAgent(llm) -> Agent:
     """架構工程師 Agent - 負責定義資料庫結構、API規格及外部系統整合邏輯"""
-    return Agent(
+    return StageAgent(
         role='架構工程師 (Architect Engineer)',
         goal='設計完整的系統架構，包括資料庫結構、API規格及外部系統整合邏輯，產出系統設計圖',
         backstory="""你是一位資深的系統架構師，專注於設計可擴展且高效的系統架構。
@@ -20,7 +22,7 @@ def ArchitectAgent(llm) -> Agent:
 
 def DeveloperAgent(llm) -> Agent:
     """開發工程師 Agent - 根據系統設計撰寫程式碼並實作業務邏輯"""
-    return Agent(
+    return StageAgent(
         role='開發工程師 (Developer)',
         goal='根據系統設計撰寫高品質的程式碼，實作完整的業務邏輯和功能',
         backstory="""你是一位全端開發工程師，精通多種程式語言和框架。
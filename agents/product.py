@@ -4,9 +4,11 @@
 """
 from crewai import Agent
 
+from .base import StageAgent
+
 def SeniorPreSalesConsultantAgent(llm) -> Agent:
     """資深售前顧問 Agent - 負責與客戶互動，澄清軟體需求"""
-    return Agent(
+    return StageAgent(
         role='資深售前顧問 (Senior Pre-sales Consultant)',
         goal='與客戶（用戶）互動，通過結構化問題澄清軟體需求，確保需求明確且完整',
         backstory="""你是一位資深的售前顧問，擁有豐富的軟體專案需求分析經驗。
@@ -21,7 +23,7 @@ def SeniorPreSalesConsultantAgent(llm) -> Agent:
 
 def ProductManagerAgent(llm) -> Agent:
     """產品經理 Agent - 負責將澄清後的需求轉化為技術功能點與用戶路徑，產出完整的 PRD"""
-    return Agent(
+    return StageAgent(
         role='產品經理 (Product Manager)',
         goal='根據澄清後的需求，產出完整的 PRD (Product Requirements Document) 需求規格書',
         backstory="""你是一位經驗豐富的產品經理，專注於將用戶需求轉化為可執行的產品規格。
@@ -35,7 +37,7 @@ def ProductManagerAgent(llm) -> Agent:
 
 def DesignerAgent(llm) -> Agent:
     """設計師 Agent - 負責 UI/UX 美編設計"""
-    return Agent(
+    return StageAgent(
         role='UI/UX 設計師 (Designer)',
         goal='設計美觀且易用的軟體系統用戶介面，提供完整的 UI/UX 設計方案',
         backstory="""你是一位專業的 UI/UX 設計師，專注於創建直觀且美觀的用戶介面。
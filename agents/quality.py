@@ -4,9 +4,11 @@
 """
 from crewai import Agent
 
+from .base import StageAgent
+
 def ReviewerAgent(llm) -> Agent:
     """代碼評審與測試工程師 Agent - 負責 Code Review 和產品測試"""
-    return Agent(
+    return StageAgent(
         role='代碼評審與測試工程師 (Reviewer Testor)',
         goal='進行 Code Review 確保程式碼品質與安全性，並執行產品測試產出測試報告',
         backstory="""你是一位資深的品質保證工程師，專注於程式碼品質和產品測試。
@@ -1,8 +1,10 @@
 from crewai import Agent
 
+from .base import StageAgent
+
 def TechnicalAgent(llm) -> Agent:
     """技術支援 Agent - 負責技術支援與客戶服務"""
-    return Agent(
+    return StageAgent(
         role='技術支援工程師 (Technical Support)',
         goal='提供技術支援與客戶服務，協助解決技術問題和用戶疑問',
         backstory="""你是一位專業的技術支援工程師，專注於協助用戶解決技術問題。
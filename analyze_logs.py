@@ -0,0 +1,20 @@
+"""
+API 調用日誌分析的快捷腳本
+串流讀取 output/api_calls.log 或導出的 api_calls.json，回答常見的效能問題
+
+範例：
+  python analyze_logs.py summary
+  python analyze_logs.py slowest --top 5 output/api_calls.log
+  python analyze_logs.py retry-rate --index output/api_calls.log
+  python analyze_logs.py errors output/api_calls.json
+"""
+import sys
+import os
+
+# 添加當前目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.log_analytics import main
+
+if __name__ == "__main__":
+    sys.exit(main())
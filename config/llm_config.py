@@ -56,6 +56,12 @@ LLMType = Literal["api", "local"]
 # - {CONFIG_KEY}_LOCAL_MODEL     -> 例如: PRE_SALES_CONSULTANT_LOCAL_MODEL
 # - {CONFIG_KEY}_RETRY_TIMES     -> 例如: PRE_SALES_CONSULTANT_RETRY_TIMES
 # - {CONFIG_KEY}_RETRY_DELAY     -> 例如: PRE_SALES_CONSULTANT_RETRY_DELAY
+# - {CONFIG_KEY}_TASK_TIMEOUT    -> 例如: DEVELOPER_TASK_TIMEOUT
+# - {CONFIG_KEY}_STALL_TIMEOUT   -> 例如: DEVELOPER_STALL_TIMEOUT
+# - {CONFIG_KEY}_REQUEST_TIMEOUT -> 例如: DEVELOPER_REQUEST_TIMEOUT
+# - {CONFIG_KEY}_CONTEXT_BUDGET  -> 例如: REVIEWER_CONTEXT_BUDGET
+# - {CONFIG_KEY}_RETRIEVAL_TOP_K -> 例如: DEVELOPER_RETRIEVAL_TOP_K
+# - {CONFIG_KEY}_PRIORITY        -> 例如: DEVELOPER_PRIORITY
 # ============================================================================
 DEFAULT_LLM_CONFIG: Dict[str, Dict] = {
     "pre_sales_consultant": {
@@ -67,6 +73,12 @@ DEFAULT_LLM_CONFIG: Dict[str, Dict] = {
         "retry_backoff": 1.5,  # 指數退避倍數
         "max_retry_delay": 60,  # 最大重試延遲（秒）
         "auto_fallback": True,  # 自動降級到 local model
+        "task_timeout": 1800,  # 單個任務（階段）的牆鐘時間上限（秒），超過則標記為逾時並中止
+        "stall_timeout": 180,  # LLM 串流調用無任何進展的上限（秒），超過則中止並重試或降級（非串流調用只受 request_timeout 限制）
+        "request_timeout": 600,  # 單個 HTTP 請求的超時（秒）
+        "context_budget": 16000,  # 上游任務輸出（context）的 Token 預算，超出時摘要或按章節裁剪（0 表示不限制）
+        "retrieval_top_k": 0,  # 另外檢索其他前序文件最相關的 N 個章節（直接上游輸出總是完整傳入，0 表示不檢索）
+        "priority": "high",  # LLM 調用排程的階段優先級（high / normal / low，KANO_SCHEDULER=1 時生效）
     },
     "product_manager": {
         "type": "api",  # "api" 或 "local"
@@ -77,6 +89,12 @@ DEFAULT_LLM_CONFIG: Dict[str, Dict] = {
         "retry_backoff": 1.5,  # 指數退避倍數
         "max_retry_delay": 60,  # 最大重試延遲（秒）
         "auto_fallback": True,  # 自動降級到 local model
+        "task_timeout": 1800,
+        "stall_timeout": 180,
+        "request_timeout": 600,
+        "context_budget": 16000,
+        "retrieval_top_k": 0,
+        "priority": "normal",
     },
     "designer": {
         "type": "api",
@@ -87,6 +105,12 @@ DEFAULT_LLM_CONFIG: Dict[str, Dict] = {
         "retry_backoff": 1.5,
         "max_retry_delay": 60,
         "auto_fallback": True,
+        "task_timeout": 1800,
+        "stall_timeout": 180,
+        "request_timeout": 600,
+        "context_budget": 16000,
+        "retrieval_top_k": 0,
+        "priority": "normal",
     },
     "architect": {
         "type": "api",
@@ -97,6 +121,12 @@ DEFAULT_LLM_CONFIG: Dict[str, Dict] = {
         "retry_backoff": 1.5,
         "max_retry_delay": 60,
         "auto_fallback": True,
+        "task_timeout": 1800,
+        "stall_timeout": 180,
+        "request_timeout": 600,
+        "context_budget": 24000,
+        "retrieval_top_k": 0,
+        "priority": "normal",
     },
     "developer": {
         "type": "api",
@@ -107,6 +137,12 @@ DEFAULT_LLM_CONFIG: Dict[str, Dict] = {
         "retry_backoff": 1.5,
         "max_retry_delay": 60,
         "auto_fallback": True,
+        "task_timeout": 3600,
+        "stall_timeout": 180,
+        "request_timeout": 600,
+        "context_budget": 24000,
+        "retrieval_top_k": 12,
+        "priority": "low",
     },
     "reviewer": {
         "type": "local",  # 使用 local model
@@ -117,6 +153,12 @@ DEFAULT_LLM_CONFIG: Dict[str, Dict] = {
         "retry_backoff": 1.5,
         "max_retry_delay": 30,
         "auto_fallback": False,  # Local model 不需要降級
+        "task_timeout": 2400,
+        "stall_timeout": 600,
+        "request_timeout": 900,
+        "context_budget": 8000,  # Local model 的上下文窗口較小
+        "retrieval_top_k": 16,
+        "priority": "normal",
     },
     "technical": {
         "type": "local",  # 使用 local model
@@ -127,6 +169,12 @@ DEFAULT_LLM_CONFIG: Dict[str, Dict] = {
         "retry_backoff": 1.5,
         "max_retry_delay": 30,
         "auto_fallback": False,  # Local model 不需要降級
+        "task_timeout": 2400,
+        "stall_timeout": 600,
+        "request_timeout": 900,
+        "context_budget": 8000,
+        "retrieval_top_k": 16,
+        "priority": "normal",
     },
 }
 
@@ -170,6 +218,33 @@ def get_llm_config(role: str) -> Dict:
     elif "max_retry_delay" not in config:
         config["max_retry_delay"] = 60.0  # 預設值
     
+    # 允許從環境變數覆蓋逾時設定（設為 0 表示不限制）
+    for timeout_name, default_timeout in (("task_timeout", 1800.0), ("stall_timeout", 180.0), ("request_timeout", 600.0)):
+        timeout_key = f"{role.upper()}_{timeout_name.upper()}"
+        if os.getenv(timeout_key):
+            config[timeout_name] = float(os.getenv(timeout_key))
+        elif timeout_name not in config:
+            config[timeout_name] = default_timeout
+    
+    # 允許從環境變數覆蓋上下文 Token 預算（設為 0 表示不限制）
+    budget_key = f"{role.upper()}_CONTEXT_BUDGET"
+    if os.getenv(budget_key):
+        config["context_budget"] = int(os.getenv(budget_key))
+    elif "context_budget" not in config:
+        config["context_budget"] = 16000  # 預設值
+    
+    top_k_key = f"{role.upper()}_RETRIEVAL_TOP_K"
+    if os.getenv(top_k_key):
+        config["retrieval_top_k"] = int(os.getenv(top_k_key))
+    elif "retrieval_top_k" not in config:
+        config["retrieval_top_k"] = 0  # 預設傳入完整上游輸出
+    
+    priority_key = f"{role.upper()}_PRIORITY"
+    if os.getenv(priority_key):
+        config["priority"] = os.getenv(priority_key).lower()
+    elif "priority" not in config:
+        config["priority"] = "normal"  # 預設優先級
+    
     fallback_key = f"{role.upper()}_AUTO_FALLBACK"
     if os.getenv(fallback_key):
         config["auto_fallback"] = os.getenv(fallback_key).lower() == "true"
@@ -14,11 +14,29 @@ from agents import (
 from tasks.tasks import create_tasks
 from config import get_llm_for_role, get_llm_config
 from utils.api_logger import get_api_logger
+from utils.llm_monitor import register_llm_monitor, get_llm_monitor
+from utils.tracing import get_tracer, traced
+from utils.stream_bus import is_streaming_enabled
+from utils.cancellation import install_cancellation, cancellation_step_callback
+from utils.watchdog import get_watchdog, install_watchdog
+from utils.continuation import _wrap_openai_client, install_continuation
+from utils.llm_scheduler import install_scheduler
+from utils.quota_ledger import install_quota_ledger
+from utils.key_pool import apply_primary_keys, install_key_pool
+from utils.context_budget import get_context_budget
+from utils.doc_index import get_doc_index
+from utils.run_cache import reset_run_cache, content_hash
+from utils.warmup import get_warmup, is_warmup_enabled, prewarm_connection, preload_ollama_model
+from utils.presales_digest import get_presales_digester, is_digest_enabled, DIGEST_MODEL_ENV
 import os
 from dotenv import load_dotenv
 import requests
+import importlib.util
+import json
 import logging
+import threading
 import time
+from typing import Dict
 
 load_dotenv()
 
@@ -29,6 +47,7 @@ logger = setup_logger("crew_advanced", logging.INFO)
 # 初始化 API 日誌記錄器
 api_logger = get_api_logger()
 
+@traced(cat="setup")
 def check_ollama_available() -> bool:
     """
     檢查 Ollama 是否可用（包括服務運行和模組可導入）
@@ -40,10 +59,8 @@ def check_ollama_available() -> bool:
     
     詳細說明請參考：OLLAMA_SETUP_GUIDE.md
     """
-    # 檢查模組是否可導入
-    try:
-        from langchain_community.llms import Ollama
-    except ImportError:
+    # 檢查模組是否已安裝（只查找不導入：langchain_community 導入耗時，實際建立 local model 時才導入）
+    if importlib.util.find_spec("langchain_community") is None:
         logger.debug("langchain_community 模組不可用（可能未安裝：pip install langchain-community）")
         return False
     
@@ -74,7 +91,8 @@ def check_ollama_available() -> bool:
         logger.debug(f"Ollama 服務檢查失敗: {e}")
         return False
 
-def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unknown"):
+@traced(cat="setup", arg_names=("agent_name", "model_name", "llm_type"))
+def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unknown", request_timeout: float = None, api_key: str = None):
     """
     根據模型名稱和類型創建 LLM 實例
     
@@ -82,6 +100,8 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
         model_name: 模型名稱（如 "gemini/gemini-2.0-flash" 或 "ollama/llama3.2:3b"）
         llm_type: LLM 類型（"api" 或 "local"）
         agent_name: Agent 名稱（用於日誌記錄）
+        request_timeout: 單個 HTTP 請求的超時（秒，None 使用客戶端預設值）
+        api_key: 使用的 API Key（None 使用環境變數中的 Key；API Key 池以其他 Key 建立實例時指定）
     
     Returns:
         LLM 實例或模型名稱字串（如果 CrewAI 支援）
@@ -104,6 +124,7 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
                 model=model_name,
                 base_url="http://localhost:11434",
                 temperature=0.7,
+                timeout=request_timeout,
             )
         except (ImportError, ConnectionError) as e:
             # 如果無法使用 Ollama，不應該返回字串，而是拋出錯誤
@@ -120,13 +141,14 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
             model = model_name.replace("gemini/", "")
             try:
                 from langchain_google_genai import ChatGoogleGenerativeAI
-                google_api_key = os.getenv("GOOGLE_API_KEY")
+                google_api_key = api_key or os.getenv("GOOGLE_API_KEY")
                 if not google_api_key:
                     raise ValueError("未設定 GOOGLE_API_KEY")
                 llm_instance = ChatGoogleGenerativeAI(
                     model=model,
                     google_api_key=google_api_key,
                     temperature=0.7,
+                    timeout=request_timeout,
                 )
                 # 記錄 API 實例創建（實際調用會在任務執行時發生）
                 api_logger.log_call(
@@ -147,13 +169,15 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
             model = model_name.replace("openai/", "")
             try:
                 from langchain_openai import ChatOpenAI
-                openai_api_key = os.getenv("OPENAI_API_KEY")
+                openai_api_key = api_key or os.getenv("OPENAI_API_KEY")
                 if not openai_api_key:
                     raise ValueError("未設定 OPENAI_API_KEY")
                 llm_instance = ChatOpenAI(
                     model=model,
                     openai_api_key=openai_api_key,
                     temperature=0.7,
+                    streaming=is_streaming_enabled(),
+                    timeout=request_timeout,
                 )
                 # 記錄 API 實例創建
                 api_logger.log_call(
@@ -179,7 +203,7 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
                 # 重要：根據測試，CrewAI 的 OpenAICompletion 支持 base_url 參數
                 # 但不會從環境變數讀取，所以我們直接使用 OpenAICompletion
                 from crewai.llms.providers.openai.completion import OpenAICompletion
-                deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
+                deepseek_api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
                 if not deepseek_api_key:
                     raise ValueError("未設定 DEEPSEEK_API_KEY")
                 
@@ -190,6 +214,8 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
                     api_key=deepseek_api_key,
                     base_url="https://api.deepseek.com/v1",  # DeepSeek API endpoint
                     temperature=0.7,
+                    stream=is_streaming_enabled(),  # 逐 Token 輸出（經由 LLMStreamChunkEvent 轉發到串流匯流排）
+                    timeout=request_timeout,
                 )
                 
                 # 驗證實例配置
@@ -226,7 +252,7 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
                 # 如果無法導入 OpenAICompletion，回退到 ChatOpenAI
                 try:
                     from langchain_openai import ChatOpenAI
-                    deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
+                    deepseek_api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
                     if not deepseek_api_key:
                         raise ValueError("未設定 DEEPSEEK_API_KEY")
                     
@@ -239,6 +265,8 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
                         openai_api_key=deepseek_api_key,
                         base_url="https://api.deepseek.com/v1",
                         temperature=0.7,
+                        streaming=is_streaming_enabled(),
+                        timeout=request_timeout,
                     )
                     
                     api_logger.log_call(
@@ -256,65 +284,184 @@ def create_llm_instance(model_name: str, llm_type: str, agent_name: str = "unkno
     # 預設返回原始模型名稱（讓 CrewAI 自行處理）
     return model_name
 
-def create_kano_crew_advanced(user_requirements_text: str = None):
-    """創建通用型軟體開發團隊 - 進階配置
+def _api_key_factory(role_key: str, config: Dict):
+    """建立 API Key 池以其他 Key 使用的 LLM 實例的函數（與原本的實例同樣記錄 finish reason 與串流進展）"""
+    def factory(api_key: str):
+        llm = create_llm_instance(config["model"], config["type"], role_key, config["request_timeout"], api_key=api_key)
+        _wrap_openai_client(llm)
+        return llm
+    return factory
+
+def _local_fallback_factory(role_key: str, config: Dict):
+    """建立停滯降級用的 local model（Ollama）實例的函數"""
+    def factory():
+        llm = create_llm_instance(config["local_model"], "local", role_key, config["request_timeout"])
+        install_quota_ledger(llm, role_key, model=config["local_model"], llm_type="local")
+        install_cancellation(llm)
+        install_continuation(llm, role_key, config)
+        install_scheduler(llm, role_key, model=config["local_model"], llm_type="local", priority=config["priority"])
+        return llm
+    return factory
+
+class KanoCrew(Crew):
+    """
+    控制上游任務輸出如何傳給下游任務的 Crew
+    - 所有 Agent：完整的上游輸出（task.context，超出上下文 Token 預算時壓縮）
+    - 配置了 retrieval_top_k 的 Agent：另加其他前序文件的目錄與檢索出的最相關章節
+    """
+    
+    def _get_context(self, task, task_outputs):
+        upstream = task.context if isinstance(task.context, list) else None
+        if not upstream:
+            return super()._get_context(task, task_outputs)
+        role = getattr(task.agent, "role", None)
+        agent_key = get_llm_monitor().agents.get(role, {}).get("agent")
+        
+        documents = [
+            (getattr(context_task, "name", None) or "context", context_task.output.raw)
+            for context_task in upstream
+            if getattr(context_task, "output", None) is not None
+        ]
+        doc_index = get_doc_index()
+        top_k = doc_index.top_k.get(agent_key, 0)
+        if top_k:
+            # 其他已完成的前序任務輸出只取檢索章節（索引內容未變時不重建）
+            earlier = [
+                (completed_task.name, completed_task.output.raw) for completed_task in self.tasks
+                if completed_task is not task and completed_task not in upstream
+                and getattr(completed_task, "output", None) is not None
+            ]
+            query = f"{task.description}\n{task.expected_output}"
+            documents = doc_index.stage_documents(query, top_k, documents, earlier)
+        return get_context_budget().build_context(agent_key, documents)
+
+def _context_summarizer_factory(model_name: str, agent_name: str = "context_summarizer"):
+    """建立摘要用廉價模型實例的函數（KANO_CONTEXT_SUMMARY_MODEL / KANO_PRESALES_DIGEST_MODEL）"""
+    llm_type = "local" if model_name.startswith("ollama/") else "api"
     
+    def factory():
+        llm = create_llm_instance(model_name, llm_type, agent_name)
+        install_cancellation(llm)
+        return llm
+    return factory
+
+def _chain_callbacks(*callbacks):
+    """將多個 Crew 回調合併為一個（依序調用）"""
+    callbacks = [callback for callback in callbacks if callback]
+    
+    def chained(*args, **kwargs):
+        for callback in callbacks:
+            callback(*args, **kwargs)
+    return chained
+
+# 常駐服務（server.daemon）在多次執行之間重用 LLM 實例及其連線池：(模型, 類型, Agent, 超時) -> 實例
+_llm_pool: Dict[tuple, object] = {}
+_llm_pool_enabled = False
+
+def enable_llm_pool(enabled: bool = True):
+    """啟用 / 停用 LLM 實例重用（停用時清空已建立的實例）"""
+    global _llm_pool_enabled
+    _llm_pool_enabled = enabled
+    if not enabled:
+        _llm_pool.clear()
+
+def clear_llm_pool():
+    """清空重用的 LLM 實例（例如取消執行時連線已被關閉）"""
+    _llm_pool.clear()
+
+def _get_llm_instance(model_name: str, llm_type: str, agent_name: str, request_timeout: float = None):
+    """建立 LLM 實例（啟用重用時返回相同配置的既有實例）"""
+    if not _llm_pool_enabled:
+        return create_llm_instance(model_name, llm_type, agent_name, request_timeout)
+    key = (model_name, llm_type, agent_name, request_timeout)
+    if key not in _llm_pool:
+        _llm_pool[key] = create_llm_instance(model_name, llm_type, agent_name, request_timeout)
+    return _llm_pool[key]
+
+# Role 鍵 -> 顯示名稱
+ROLES = {
+    "pre_sales_consultant": "pre_sales_consultant",
+    "product_manager": "product_manager",
+    "designer": "designer",
+    "architect": "architect",
+    "developer": "developer",
+    "reviewer": "reviewer",
+    "technical": "technical",
+}
+
+# 背景預熱與開始執行時的建立不並行（兩者都會設定全局的監控與預算配置）
+_prepare_lock = threading.Lock()
+
+def llm_config_fingerprint() -> str:
+    """影響 Agent 建立的配置指紋（背景預熱的結果只在配置未變更時取用）"""
+    configs = {role_key: get_llm_config(role_key) for role_key in ROLES}
+    # OPENAI_API_KEY 會在建立時被改寫為 DeepSeek Key，不納入指紋
+    env = {
+        name: content_hash(os.getenv(name, ""))
+        for name in ("GOOGLE_API_KEY", "GOOGLE_API_KEYS", "DEEPSEEK_API_KEY", "DEEPSEEK_API_KEYS", "KANO_CONTEXT_SUMMARY_MODEL")
+    }
+    return content_hash(json.dumps([configs, env], sort_keys=True, default=str))
+
+@traced(cat="setup")
+def prepare_agents(prewarm: bool = False) -> Dict:
+    """
+    建立所有 Agent 及其 LLM 實例，並安裝監控、取消、續寫、逾時與上下文預算配置
+
     Args:
-        user_requirements_text: 用戶通過交互式問卷提供的需求文本（可選）
+        prewarm: 是否預先建立 API 連線並把 local model 載入 Ollama（背景預熱時使用）
+
+    Returns:
+        {"llm_configs": {role_key: 實際使用的配置}, "agents": {role_key: Agent}}
     """
+    with _prepare_lock:
+        return _prepare_agents(prewarm)
+
+def _prepare_agents(prewarm: bool) -> Dict:
+    # 環境設定（API Key、Ollama 探測、DeepSeek 環境變數）
+    with get_tracer().span("環境設定", cat="setup"):
+        # 檢查必要的 API Key（只設定了多個 Key 時以第一個為準）
+        apply_primary_keys()
+        google_api_key = os.getenv("GOOGLE_API_KEY")
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
+        ollama_available = check_ollama_available()
     
-    # 檢查必要的 API Key
-    google_api_key = os.getenv("GOOGLE_API_KEY")
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-    ollama_available = check_ollama_available()
+        # 檢查哪些角色需要使用 DeepSeek API
+        roles_using_deepseek = []
+        for role_key in ["pre_sales_consultant", "product_manager", "designer", "architect", "developer"]:
+            config = get_llm_config(role_key)
+            if config["type"] == "api" and config["api_model"].startswith("deepseek/"):
+                roles_using_deepseek.append(role_key)
     
-    # 檢查哪些角色需要使用 DeepSeek API
-    roles_using_deepseek = []
-    for role_key in ["pre_sales_consultant", "product_manager", "designer", "architect", "developer"]:
-        config = get_llm_config(role_key)
-        if config["type"] == "api" and config["api_model"].startswith("deepseek/"):
-            roles_using_deepseek.append(role_key)
+        # 設置環境變數
+        if google_api_key:
+            os.environ["GOOGLE_API_KEY"] = google_api_key
     
-    # 設置環境變數
-    if google_api_key:
-        os.environ["GOOGLE_API_KEY"] = google_api_key
-    
-    # 如果有角色使用 DeepSeek API，強制設置 DeepSeek 相關環境變數
-    if roles_using_deepseek and deepseek_api_key:
-        # 重要：必須在創建 LLM 實例之前設置環境變數
-        # 強制覆蓋任何現有的 OPENAI_API_KEY 和 OPENAI_API_BASE
-        os.environ["OPENAI_API_BASE"] = "https://api.deepseek.com/v1"
-        os.environ["OPENAI_API_KEY"] = deepseek_api_key
-        os.environ["DEEPSEEK_API_KEY"] = deepseek_api_key
-        logger.info(f"✓ 檢測到使用 DeepSeek API 的角色: {', '.join(roles_using_deepseek)}")
-        logger.info(f"✓ 已設置 OPENAI_API_BASE = https://api.deepseek.com/v1")
-        logger.info(f"✓ 已設置 OPENAI_API_KEY = DEEPSEEK_API_KEY")
-        # 驗證環境變數設置
-        actual_base = os.getenv("OPENAI_API_BASE")
-        actual_key_prefix = os.getenv("OPENAI_API_KEY", "")[:15] + "..." if len(os.getenv("OPENAI_API_KEY", "")) > 15 else os.getenv("OPENAI_API_KEY", "")
-        logger.info(f"✓ 驗證: OPENAI_API_BASE = {actual_base}")
-        logger.info(f"✓ 驗證: OPENAI_API_KEY = {actual_key_prefix}")
-    else:
-        # 如果沒有使用 DeepSeek，則使用原本的設置
-        if openai_api_key:
-            os.environ["OPENAI_API_KEY"] = openai_api_key
-        if deepseek_api_key:
+        # 如果有角色使用 DeepSeek API，強制設置 DeepSeek 相關環境變數
+        if roles_using_deepseek and deepseek_api_key:
+            # 重要：必須在創建 LLM 實例之前設置環境變數
+            # 強制覆蓋任何現有的 OPENAI_API_KEY 和 OPENAI_API_BASE
+            os.environ["OPENAI_API_BASE"] = "https://api.deepseek.com/v1"
+            os.environ["OPENAI_API_KEY"] = deepseek_api_key
             os.environ["DEEPSEEK_API_KEY"] = deepseek_api_key
+            logger.info(f"✓ 檢測到使用 DeepSeek API 的角色: {', '.join(roles_using_deepseek)}")
+            logger.info(f"✓ 已設置 OPENAI_API_BASE = https://api.deepseek.com/v1")
+            logger.info(f"✓ 已設置 OPENAI_API_KEY = DEEPSEEK_API_KEY")
+            # 驗證環境變數設置
+            actual_base = os.getenv("OPENAI_API_BASE")
+            actual_key_prefix = os.getenv("OPENAI_API_KEY", "")[:15] + "..." if len(os.getenv("OPENAI_API_KEY", "")) > 15 else os.getenv("OPENAI_API_KEY", "")
+            logger.info(f"✓ 驗證: OPENAI_API_BASE = {actual_base}")
+            logger.info(f"✓ 驗證: OPENAI_API_KEY = {actual_key_prefix}")
+        else:
+            # 如果沒有使用 DeepSeek，則使用原本的設置
+            if openai_api_key:
+                os.environ["OPENAI_API_KEY"] = openai_api_key
+            if deepseek_api_key:
+                os.environ["DEEPSEEK_API_KEY"] = deepseek_api_key
     
     # 獲取每個 Role 的 LLM 配置
-    roles = {
-        "pre_sales_consultant": "pre_sales_consultant",
-        "product_manager": "product_manager",
-        "designer": "designer",
-        "architect": "architect",
-        "developer": "developer",
-        "reviewer": "reviewer",
-        "technical": "technical",
-    }
-    
     llm_configs = {}
-    for role_key, role_name in roles.items():
+    for role_key, role_name in ROLES.items():
         config = get_llm_config(role_key)
         llm_type = config["type"]
         
@@ -341,6 +488,15 @@ def create_kano_crew_advanced(user_requirements_text: str = None):
             "type": llm_type,
             "retry_times": config["retry_times"],
             "retry_delay": config["retry_delay"],
+            "task_timeout": config["task_timeout"],
+            "stall_timeout": config["stall_timeout"],
+            "request_timeout": config["request_timeout"] or None,
+            "local_model": config["local_model"],
+            "context_budget": config["context_budget"],
+            "retrieval_top_k": config["retrieval_top_k"],
+            "priority": config["priority"],
+            # 停滯時降級到 local model（僅 API model 且 Ollama 可用時）
+            "auto_fallback": llm_type == "api" and config.get("auto_fallback", False) and ollama_available,
         }
     
     # 創建所有 Agents（使用各自的 LLM 配置）
@@ -361,13 +517,13 @@ def create_kano_crew_advanced(user_requirements_text: str = None):
         logger.info("✓ 在創建 LLM 實例前，已確保環境變數設置正確")
     
     # 為每個 Agent 創建 LLM 實例（記錄 Agent 名稱用於日誌）
-    pre_sales_llm = create_llm_instance(pre_sales_config["model"], pre_sales_config["type"], "pre_sales_consultant")
-    product_manager_llm = create_llm_instance(llm_configs["product_manager"]["model"], llm_configs["product_manager"]["type"], "product_manager")
-    designer_llm = create_llm_instance(llm_configs["designer"]["model"], llm_configs["designer"]["type"], "designer")
-    architect_llm = create_llm_instance(llm_configs["architect"]["model"], llm_configs["architect"]["type"], "architect")
-    developer_llm = create_llm_instance(llm_configs["developer"]["model"], llm_configs["developer"]["type"], "developer")
-    reviewer_llm = create_llm_instance(llm_configs["reviewer"]["model"], llm_configs["reviewer"]["type"], "reviewer")
-    technical_llm = create_llm_instance(llm_configs["technical"]["model"], llm_configs["technical"]["type"], "technical")
+    pre_sales_llm = _get_llm_instance(pre_sales_config["model"], pre_sales_config["type"], "pre_sales_consultant", pre_sales_config["request_timeout"])
+    product_manager_llm = _get_llm_instance(llm_configs["product_manager"]["model"], llm_configs["product_manager"]["type"], "product_manager", llm_configs["product_manager"]["request_timeout"])
+    designer_llm = _get_llm_instance(llm_configs["designer"]["model"], llm_configs["designer"]["type"], "designer", llm_configs["designer"]["request_timeout"])
+    architect_llm = _get_llm_instance(llm_configs["architect"]["model"], llm_configs["architect"]["type"], "architect", llm_configs["architect"]["request_timeout"])
+    developer_llm = _get_llm_instance(llm_configs["developer"]["model"], llm_configs["developer"]["type"], "developer", llm_configs["developer"]["request_timeout"])
+    reviewer_llm = _get_llm_instance(llm_configs["reviewer"]["model"], llm_configs["reviewer"]["type"], "reviewer", llm_configs["reviewer"]["request_timeout"])
+    technical_llm = _get_llm_instance(llm_configs["technical"]["model"], llm_configs["technical"]["type"], "technical", llm_configs["technical"]["request_timeout"])
     
     # 重要：在創建 Agent 之前，再次確保環境變數已設置
     # 因為 CrewAI 的 OpenAICompletion 會在 Agent 創建時重新讀取環境變數
@@ -384,13 +540,84 @@ def create_kano_crew_advanced(user_requirements_text: str = None):
     reviewer = ReviewerAgent(reviewer_llm)
     technical = TechnicalAgent(technical_llm)
     
+    # 註冊 LLM 調用監控（按 Agent / 模型 / 提供者 / 任務記錄延遲直方圖）
+    agents_by_key = {
+        "pre_sales_consultant": (pre_sales_consultant, pre_sales_config),
+        "product_manager": (product_manager, llm_configs["product_manager"]),
+        "designer": (designer, llm_configs["designer"]),
+        "architect": (architect, llm_configs["architect"]),
+        "developer": (developer, llm_configs["developer"]),
+        "reviewer": (reviewer, llm_configs["reviewer"]),
+        "technical": (technical, llm_configs["technical"]),
+    }
+    register_llm_monitor({
+        agent.role: {"agent": role_key, "model": config["model"], "type": config["type"]}
+        for role_key, (agent, config) in agents_by_key.items()
+    })
+    
+    # 配置了多個 API Key 時按輪替分配調用，被限流或配額用盡的 Key 暫停使用（安裝在最內層）
+    for role_key, (agent, config) in agents_by_key.items():
+        install_key_pool(getattr(agent, "llm", None), role_key, config["model"], config["type"], _api_key_factory(role_key, config))
+    
+    # 多個 worker 共用提供者配額時經過共用配額帳本（設定了 KANO_QUOTA_RPM / TPM / DAILY）；
+    # 安裝在 Key 池之上、續寫與停滯重試之內，續寫、重試與備援的每次請求都預留一筆
+    for role_key, (agent, config) in agents_by_key.items():
+        install_quota_ledger(getattr(agent, "llm", None), role_key, model=config["model"], llm_type=config["type"])
+    
+    # 讓每個 Agent 的 LLM 調用可被 GUI 停止按鈕 / Ctrl+C 中斷，並自動續寫被截斷的輸出
+    for role_key, (agent, config) in agents_by_key.items():
+        install_cancellation(getattr(agent, "llm", None))
+        install_continuation(getattr(agent, "llm", None), role_key, config)
+    
+    # 階段逾時與停滯監控（安裝在取消之後，位於外層）
+    watchdog = get_watchdog()
+    for role_key, (agent, config) in agents_by_key.items():
+        watchdog.configure(role_key, config["task_timeout"], config["stall_timeout"])
+        install_watchdog(
+            getattr(agent, "llm", None),
+            role_key,
+            model=config["model"],
+            llm_type=config["type"],
+            fallback_factory=_local_fallback_factory(role_key, config) if config["auto_fallback"] else None,
+        )
+    
+    # 多個執行共用提供者時按優先級與租戶排隊（KANO_SCHEDULER=1，安裝在最外層，排隊時間不計入停滯）
+    for role_key, (agent, config) in agents_by_key.items():
+        install_scheduler(getattr(agent, "llm", None), role_key, model=config["model"], llm_type=config["type"], priority=config["priority"])
+    
+    # 上游任務輸出的 Token 預算（超出時摘要或按章節裁剪）
+    # 配置了 retrieval_top_k 的 Agent 另外取得其他前序文件的相關章節
+    context_budget = get_context_budget()
+    doc_index = get_doc_index()
+    for role_key, (agent, config) in agents_by_key.items():
+        context_budget.configure(role_key, config["context_budget"], config["model"])
+        doc_index.configure(role_key, config["retrieval_top_k"])
+    summary_model = os.getenv("KANO_CONTEXT_SUMMARY_MODEL")
+    context_budget.set_summarizer(_context_summarizer_factory(summary_model) if summary_model else None)
+    
+    # 預先建立 API 連線並把 local model 載入 Ollama（不等待完成）
+    if prewarm:
+        for role_key, (agent, config) in agents_by_key.items():
+            if config["type"] == "local":
+                target, args = preload_ollama_model, (config["model"],)
+            else:
+                target, args = prewarm_connection, (getattr(agent, "llm", None),)
+            threading.Thread(target=target, args=args, name=f"kano-prewarm-{role_key}", daemon=True).start()
+    
+    return {
+        "llm_configs": llm_configs,
+        "agents": {role_key: agent for role_key, (agent, _) in agents_by_key.items()},
+    }
+
+def _print_llm_config(llm_configs: Dict):
+    """顯示每個 Role 實際使用的 LLM 配置與降級情況"""
     # 顯示 LLM 配置
     print("\n" + "="*70)
     print("LLM 配置（每個 Role 獨立配置）")
     print("="*70)
     print(f"{'Role':<20} {'Type':<8} {'Model':<35} {'Retry':<10} {'Status':<10}")
     print("-" * 70)
-    for role_key, role_name in roles.items():
+    for role_key, role_name in ROLES.items():
         config = llm_configs[role_key]
         original_config = get_llm_config(role_key)
         
@@ -414,7 +641,7 @@ def create_kano_crew_advanced(user_requirements_text: str = None):
     
     # 檢查是否有降級情況
     downgraded_roles = []
-    for role_key, role_name in roles.items():
+    for role_key, role_name in ROLES.items():
         original_config = get_llm_config(role_key)
         if original_config["type"] == "local" and llm_configs[role_key]["type"] == "api":
             downgraded_roles.append(role_name)
@@ -429,6 +656,63 @@ def create_kano_crew_advanced(user_requirements_text: str = None):
         print("  3. 或將這些角色的配置改為使用 API model")
     
     print()
+
+def start_crew_warmup() -> bool:
+    """
+    在背景預熱 Crew（應用啟動、問卷填寫前調用；KANO_WARMUP=0 時不預熱）
+
+    Returns:
+        是否啟動了新的預熱
+    """
+    if not is_warmup_enabled():
+        return False
+    return get_warmup().start(lambda: prepare_agents(prewarm=True), llm_config_fingerprint())
+
+def enable_presales_digest() -> bool:
+    """
+    啟用問卷類別的預先摘要（KANO_PRESALES_DIGEST=1 時；應在問卷開始前調用）
+
+    Returns:
+        是否已啟用
+    """
+    if not is_digest_enabled():
+        return False
+    config = get_llm_config("pre_sales_consultant")
+    model = (
+        os.getenv(DIGEST_MODEL_ENV)
+        or os.getenv("KANO_CONTEXT_SUMMARY_MODEL")
+        or (config["api_model"] if config["type"] == "api" else config["local_model"])
+    )
+    get_presales_digester().set_llm_factory(_context_summarizer_factory(model, "presales_digest"))
+    logger.info(f"✓ 已啟用問卷類別預先摘要（模型: {model}）")
+    return True
+
+@traced(cat="setup")
+def create_kano_crew_advanced(user_requirements_text: str = None, step_callback=None, task_callback=None):
+    """創建通用型軟體開發團隊 - 進階配置
+    
+    Args:
+        user_requirements_text: 用戶通過交互式問卷提供的需求文本（可選）
+        step_callback: 每個 Agent 步驟完成後的回調（可選，例如 ProgressReporter.step_callback）
+        task_callback: 每個任務完成後的回調（可選，參數為 TaskOutput）
+    """
+    
+    # 問卷填寫期間已在背景預熱時直接取用（配置有變更時重新建立）
+    prepared = get_warmup().take(llm_config_fingerprint()) or prepare_agents()
+    _print_llm_config(prepared["llm_configs"])
+    
+    agents = prepared["agents"]
+    pre_sales_consultant = agents["pre_sales_consultant"]
+    product_manager = agents["product_manager"]
+    designer = agents["designer"]
+    architect = agents["architect"]
+    developer = agents["developer"]
+    reviewer = agents["reviewer"]
+    technical = agents["technical"]
+    watchdog = get_watchdog()
+    
+    # 增量重跑：記錄問卷各類別的變更，輸入未改變的階段重用上次的輸出
+    reset_run_cache().update_requirements(user_requirements_text)
     
     # 創建所有任務（傳遞用戶需求文本）
     tasks = create_tasks(
@@ -443,7 +727,7 @@ def create_kano_crew_advanced(user_requirements_text: str = None):
     )
     
     # 創建 Crew（配置重試機制）
-    crew = Crew(
+    crew = KanoCrew(
         agents=[
             pre_sales_consultant,
             product_manager,
@@ -457,6 +741,9 @@ def create_kano_crew_advanced(user_requirements_text: str = None):
         process=Process.sequential,
         verbose=True,
         # CrewAI 內建重試機制，但我們也可以通過環境變數配置
+        # 進度回報，並在每一步與每個任務完成後檢查是否已請求取消
+        step_callback=_chain_callbacks(step_callback, cancellation_step_callback, watchdog.check_all_deadlines),
+        task_callback=_chain_callbacks(task_callback, cancellation_step_callback),
     )
     
     # 顯示 API 調用統計（執行前）
@@ -0,0 +1,20 @@
+"""
+KanoAgent 常駐服務客戶端的快捷腳本
+填寫需求問卷後把執行提交給 kano_daemon.py，並即時顯示進度與串流輸出（Ctrl+C 取消執行）
+
+範例：
+  python kano_client.py run
+  python kano_client.py run --requirements output/user_requirements.md --quiet
+  python kano_client.py status
+  python kano_client.py shutdown
+"""
+import sys
+import os
+
+# 添加當前目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.daemon_client import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+"""
+啟動 KanoAgent 常駐服務的快捷腳本
+常駐服務保持 CrewAI / LangChain 的導入、LLM 連線池與 local model 預熱，
+之後以 kano_client.py 提交的執行可以立即開始
+
+範例：
+  python kano_daemon.py
+"""
+import sys
+import os
+
+# 添加當前目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.daemon import main
+
+if __name__ == "__main__":
+    sys.exit(main())
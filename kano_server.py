@@ -0,0 +1,21 @@
+"""
+啟動 KanoAgent HTTP 任務服務的快捷腳本
+內部工具以 HTTP 提交需求，任務保存在 SQLite 佇列中由 worker 程序執行，
+進度以 server-sent events 推送，輸出檔案可透過 API 下載
+
+範例：
+  python kano_server.py
+  python kano_server.py --port 8780 --workers 2
+  curl -X POST http://127.0.0.1:8780/jobs -H "Content-Type: application/json" -d '{"requirements_text": "..."}'
+  curl -N http://127.0.0.1:8780/jobs/<任務 ID>/events
+"""
+import sys
+import os
+
+# 添加當前目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.job_service import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+"""
+啟動 KanoAgent worker 節點的快捷腳本
+從共用任務目錄中的 SQLite 佇列領取 HTTP 任務服務提交的任務，以程序池執行；
+多台機器共用同一個任務目錄時各自執行此腳本即可加入 fleet，LLM 調用經過共用配額帳本不超過提供者的限制
+
+範例：
+  python kano_worker.py --workers 4
+  python kano_server.py --workers 0 --job-dir /mnt/shared/jobs   # 只提供 API
+  python kano_worker.py --workers 4 --job-dir /mnt/shared/jobs   # 每台 worker 機器
+"""
+import sys
+import os
+
+# 添加當前目錄到路徑
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.fleet import main
+
+if __name__ == "__main__":
+    sys.exit(main())
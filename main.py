@@ -3,12 +3,30 @@ KanoAgent - 通用型軟體開發團隊主程式
 使用 CrewAI 實作的智能開發團隊
 支援每個 Role 獨立配置 API/Local Model，並包含重試機制
 """
+import time
+_STARTED = time.perf_counter()
+
 import os
 import sys
+import threading
+
+# KANO_STARTUP_PROFILE=1 時記錄之後每個模組的導入耗時（需在導入其他模組之前啟用）
+from utils.startup_profile import get_startup_profile
+get_startup_profile().started = _STARTED
+get_startup_profile().enable_import_timing()
+
+# CrewAI 與 LLM 提供者套件導入耗時，crew_advanced 在背景預熱或建立 Crew 時才導入
 from dotenv import load_dotenv
-from crew_advanced import create_kano_crew_advanced
 from utils.api_logger import get_api_logger
 from utils.logger_config import setup_logger
+from utils.metrics_exporter import start_metrics_server_from_env
+from utils.tracing import get_tracer, reset_tracer, save_run_trace
+from utils.stream_bus import get_stream_bus, is_streaming_enabled, ConsoleStreamPrinter, CHUNK
+from utils.output_saver import PartialOutputWriter, save_checkpoint
+from utils.cancellation import CancelledError, new_cancel_token
+from utils.progress import ProgressReporter, STAGE_END
+from utils.output_saver import TASK_OUTPUT_NAMES
+from utils.run_cache import get_run_cache
 import logging
 
 # 設置統一日誌系統
@@ -31,22 +49,70 @@ def run_with_gui(
     on_task_end=None,
     on_log=None,
     on_error=None,
+    on_stream=None,
+    on_stage_event=None,
+    cancel_token=None,
+    user_requirements_text=None,
 ):
-    """在 GUI 模式下運行（帶回調函數）"""
+    """
+    在 GUI 模式下運行（帶回調函數）
+
+    on_agent_start / on_agent_end(agent_name, role_key) 與 on_task_start / on_task_end(task_name, task_num, total)
+    由 Crew 的任務事件、step_callback 與 task_callback 觸發；
+    on_stage_event(event) 接收結構化的階段計時事件（見 utils.progress.ProgressReporter）；
+    on_stream(agent_name, task_name, text) 在串流模式下接收 LLM 的逐段輸出；
+    cancel_token 為調用方持有的 CancellationToken，cancel() 後執行會中止並保存檢查點
+    """
     logger.info("開始執行 KanoAgent（GUI 模式）")
+    from crew_advanced import create_kano_crew_advanced
+    new_cancel_token(cancel_token)
+    crew = None
     
     try:
         # 載入環境變數
         load_dotenv()
+        start_metrics_server_from_env()
         
-        # 收集用戶需求（如果已通過 UI 收集，這裡可以跳過）
-        user_requirements_text = None
+        # 進度回報（任務開始 / 步驟 / 任務完成）
+        progress = ProgressReporter(
+            TASK_OUTPUT_NAMES,
+            on_agent_start=on_agent_start,
+            on_agent_end=on_agent_end,
+            on_task_start=on_task_start,
+            on_task_end=on_task_end,
+            on_stage_event=on_stage_event,
+        )
+        
+        # 創建並執行 Crew（需求文本由 UI 收集後傳入，未提供時使用 Agent 模擬對話模式）
+        reset_tracer()
+        if on_log:
+            on_log("正在創建 Crew...", "INFO")
+        crew = create_kano_crew_advanced(
+            user_requirements_text=user_requirements_text,
+            step_callback=progress.step_callback,
+            task_callback=progress.task_callback,
+        )
         
-        # 創建並執行 Crew
-        crew = create_kano_crew_advanced(user_requirements_text=user_requirements_text)
+        # 串流輸出：逐段寫入 output/<任務>.partial.md，並轉發給 GUI
+        stream_bus = get_stream_bus()
+        partial_writer = PartialOutputWriter("output")
+        unsubscribers = [stream_bus.subscribe(partial_writer), progress.attach().detach]
+        if on_stream:
+            unsubscribers.append(stream_bus.subscribe(
+                lambda event: on_stream(event["agent"], event["task"], event["text"]) if event["type"] == CHUNK else None
+            ))
         
         # 執行任務（這裡需要監控執行過程）
-        result = crew.kickoff()
+        api_logger = get_api_logger()
+        api_logger.adjust_gauge("active_crews", 1)
+        try:
+            with get_tracer().span("crew.kickoff", cat="run"):
+                result = crew.kickoff()
+        finally:
+            api_logger.adjust_gauge("active_crews", -1)
+            for unsubscribe in unsubscribers:
+                unsubscribe()
+            partial_writer.close()
         
         # 保存結果
         os.makedirs("output", exist_ok=True)
@@ -60,12 +126,47 @@ def run_with_gui(
         logger.info("執行完成")
         return result
         
+    except CancelledError as e:
+        logger.warning(f"執行已取消：{e}")
+        save_checkpoint(crew, "output", reason=str(e))
+        raise
     except Exception as e:
         error_msg = str(e)
         logger.error(f"執行錯誤：{error_msg}", exc_info=True)
         if on_error:
             on_error(error_msg)
         raise
+    finally:
+        save_run_trace("output")
+
+def _start_background_warmup():
+    """
+    在背景線程中導入 crew_advanced 並開始預熱 Crew（不阻塞問卷 / GUI 視窗的顯示）
+
+    導入失敗時只記錄日誌，建立 Crew 時會重新導入並顯示錯誤
+    """
+    def run():
+        try:
+            with get_startup_profile().phase("導入 crew_advanced（背景）"):
+                import crew_advanced
+            # KANO_PRESALES_DIGEST=1 時每完成一個問卷類別即在背景整理該類別
+            crew_advanced.enable_presales_digest()
+            # 填寫問卷的同時在背景建立 Crew、預先建立連線並載入 local model
+            crew_advanced.start_crew_warmup()
+        except Exception as e:
+            logger.warning(f"背景預熱失敗，將在開始執行時重新建立 Crew: {e}")
+    
+    threading.Thread(target=run, name="kano-import", daemon=True).start()
+
+def _print_stage_event(event):
+    """命令行模式：每個階段完成後打印耗時與調用統計"""
+    if event["event"] != STAGE_END:
+        return
+    print(
+        f"\n✓ 階段 {event['index']}/{event['total']} 完成：{event['task']}"
+        f"（耗時 {event['elapsed']:.1f}s，步數 {event['steps']}，LLM 調用 {event['calls']} 次，"
+        f"Tokens {event['tokens']}，重試 {event['retries']}，失敗 {event['errors']}）"
+    )
 
 def main():
     """主程式入口（命令行模式）"""
@@ -75,6 +176,7 @@ def main():
     
     # 載入環境變數
     load_dotenv()
+    start_metrics_server_from_env()
     
     # 重要：如果有 DEEPSEEK_API_KEY，強制清除並重新設置 OPENAI_API_KEY
     # 這可以防止系統使用錯誤的 OpenAI API key
@@ -124,12 +226,19 @@ def main():
     print("  ✓ 指數退避策略處理 API 過載")
     print("  ✓ 智能錯誤處理")
     
+    # 填寫問卷的同時在背景導入 CrewAI、建立 Crew、預先建立連線並載入 local model
+    _start_background_warmup()
+    
     # 步驟 1: 收集用戶需求（交互式問卷）
     print("\n" + "="*70)
     print("步驟 1: 需求收集（客戶問卷）")
     print("="*70)
     from utils.user_interaction import interactive_requirements_collection
-    user_requirements_text = interactive_requirements_collection()
+    from utils.presales_digest import get_presales_digester
+    get_startup_profile().mark_first_interaction("問卷")
+    user_requirements_text = interactive_requirements_collection(
+        on_category_complete=get_presales_digester().submit_category,
+    )
     
     if not user_requirements_text:
         print("\n⚠️  未收集到用戶需求，將使用 Agent 模擬對話模式")
@@ -142,10 +251,35 @@ def main():
     print("="*70 + "\n")
     
     # 創建並執行 Crew（傳遞用戶需求）
-    crew = create_kano_crew_advanced(user_requirements_text=user_requirements_text)
+    # 問卷時間不計入追蹤，從 Crew 建立開始記錄
+    reset_tracer()
+    cancel_token = new_cancel_token()
+    progress = ProgressReporter(TASK_OUTPUT_NAMES, on_stage_event=_print_stage_event)
+    from crew_advanced import create_kano_crew_advanced
+    crew = create_kano_crew_advanced(
+        user_requirements_text=user_requirements_text,
+        step_callback=progress.step_callback,
+        task_callback=progress.task_callback,
+    )
+    
+    # 串流輸出：即時打印到控制台，並逐段寫入 output/<任務>.partial.md
+    stream_bus = get_stream_bus()
+    partial_writer = PartialOutputWriter("output")
+    unsubscribers = [stream_bus.subscribe(partial_writer), progress.attach().detach]
+    if is_streaming_enabled():
+        unsubscribers.append(stream_bus.subscribe(ConsoleStreamPrinter()))
     
+    api_logger = get_api_logger()
     try:
-        result = crew.kickoff()
+        api_logger.adjust_gauge("active_crews", 1)
+        try:
+            with get_tracer().span("crew.kickoff", cat="run"):
+                result = crew.kickoff()
+        finally:
+            api_logger.adjust_gauge("active_crews", -1)
+            for unsubscribe in unsubscribers:
+                unsubscribe()
+            partial_writer.close()
         
         print("\n" + "="*60)
         print("專案完成！")
@@ -172,14 +306,39 @@ def main():
             print("\n⚠️  無法自動提取任務輸出，完整結果已保存在 output/result.txt")
             print("   提示：請檢查 crew.tasks 是否包含 output 屬性")
         
+        reused_stages = get_run_cache().reused
+        if reused_stages:
+            print(f"\n♻️  輸入未改變、重用上次輸出的階段：{'、'.join(reused_stages)}")
+        
         # 顯示 API 調用統計
-        api_logger = get_api_logger()
         api_logger.print_summary()
         
         # 導出 JSON 報告
         json_file = api_logger.export_to_json()
         print(f"API 調用詳細記錄已導出至: {json_file}")
         
+        # 導出執行追蹤
+        trace_file = save_run_trace("output")
+        if trace_file:
+            print(f"執行追蹤已導出至: {trace_file}（可用 chrome://tracing 或 https://ui.perfetto.dev 開啟）")
+        
+    except (CancelledError, KeyboardInterrupt) as e:
+        # Ctrl+C：取消標記會關閉進行中的 HTTP 連線，並讓背景的 LLM 調用停止
+        reason = str(e) if isinstance(e, CancelledError) else "用戶中斷執行（Ctrl+C）"
+        cancel_token.cancel(reason)
+        print("\n" + "="*70)
+        print("⚠️  執行已取消")
+        print("="*70)
+        saved_outputs = save_checkpoint(crew, "output", reason=reason)
+        if saved_outputs:
+            print("\n✓ 已保存已完成的任務輸出：")
+            for task_name, filepath in saved_outputs.items():
+                print(f"  - {task_name}: {filepath}")
+        print("  未完成任務的部分輸出保留在 output/*.partial.md")
+        print("  檢查點摘要：output/checkpoint.json")
+        api_logger.export_to_json()
+        save_run_trace("output")
+        
     except Exception as e:
         error_msg = str(e)
         
@@ -265,8 +424,14 @@ def main_gui():
         from ui.main_window import MainWindow
         import tkinter as tk
         
+        load_dotenv()
+        start_metrics_server_from_env()
+        # 確認模型配置與收集需求的同時在背景預熱 Crew
+        _start_background_warmup()
+        
         root = tk.Tk()
         app = MainWindow(root)
+        root.after_idle(get_startup_profile().mark_first_interaction, "GUI 視窗")
         root.mainloop()
     except ImportError as e:
         logger.error(f"無法導入 GUI 模組：{e}")
@@ -0,0 +1,512 @@
+"""
+階段執行器（StageTask.runner）
+把單個階段拆成多個較小的 LLM 調用，在有界線程池中並行執行後彙整
+"""
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config import DEFAULT_LLM_CONFIG, get_llm_config
+from utils.chunking import pack_units, split_code_units
+from utils.context_budget import estimate_tokens, get_context_budget, split_sections, trim_sections
+from utils.doc_index import get_doc_index
+from utils.llm_invoke import invoke_llm
+from utils.llm_monitor import get_llm_monitor
+from utils.parallel import run_parallel
+from utils.presales_digest import get_presales_digester
+from utils.retry_handler import RetryHandler
+from utils.tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：分塊 Code Review 的並行數與每塊的 Token 上限
+REVIEW_WORKERS_ENV = "KANO_REVIEW_WORKERS"
+REVIEW_CHUNK_TOKENS_ENV = "KANO_REVIEW_CHUNK_TOKENS"
+
+DEFAULT_REVIEW_WORKERS = 2
+DEFAULT_REVIEW_CHUNK_TOKENS = 2500
+
+# 環境變數：分片開發的並行數
+DEV_WORKERS_ENV = "KANO_DEV_WORKERS"
+DEFAULT_DEV_WORKERS = 4
+
+# 開發分片：(鍵, 標題, 負責內容, 對應架構文件章節標題的關鍵字)，合併時按此順序排列
+DEV_SHARDS: List[Tuple[str, str, str, Tuple[str, ...]]] = [
+    ("database", "資料庫模型與遷移腳本",
+     "ORM 模型定義、資料庫遷移腳本、種子資料腳本（如需要）",
+     ("資料庫", "數據庫", "資料表", "數據模型", "資料模型", "database", "schema", "table", "migration", "orm")),
+    ("backend", "後端 API 與核心業務邏輯",
+     "所有 API 端點、錯誤處理與驗證、認證與授權、業務規則與數據處理、歷史記錄和日誌、單元測試",
+     ("api", "後端", "服務", "業務", "邏輯", "認證", "授權", "安全", "backend", "service", "auth")),
+    ("frontend", "前端應用程式",
+     "主要頁面、用戶介面組件、狀態管理、與後端 API 的整合程式碼",
+     ("前端", "介面", "頁面", "畫面", "組件", "frontend", "ui", "client", "app")),
+    ("integration", "外部系統整合",
+     "外部系統的 API 客戶端或 SDK 整合、數據格式轉換、錯誤處理和重試機制",
+     ("整合", "集成", "第三方", "外部", "integration", "webhook", "payment", "支付")),
+    ("config", "配置檔案與部署",
+     "依賴管理檔案、環境配置檔案、Docker 配置（如適用）、README 與 API 文檔",
+     ("部署", "配置", "環境", "監控", "運維", "deploy", "docker", "config", "ci/cd", "devops")),
+]
+
+_DEV_SHARD_PROMPT = """{description}
+
+---
+本階段由多位開發工程師按模組並行完成。**你只負責：{title}**
+負責內容：{scope}
+其他模組（{others}）由其他工程師同時實作，請嚴格遵守系統設計文件中的介面約定（API 路徑、資料表與欄位名稱、環境變數名稱），不要實作其他模組。
+
+輸出格式：每個檔案以 `### 檔案路徑` 標題開頭（例如 `### backend/app/main.py`），後接完整的程式碼區塊；檔案之間不要重複。
+
+系統設計文件（與本模組相關的章節）：
+{architecture}
+{context}"""
+
+# 環境變數：PRD 分章節並行生成（預設關閉）與並行數
+PRD_PARALLEL_ENV = "KANO_PRD_PARALLEL"
+PRD_WORKERS_ENV = "KANO_PRD_WORKERS"
+DEFAULT_PRD_WORKERS = 5
+
+_PRD_OUTLINE_PROMPT = """{description}
+
+---
+在撰寫完整 PRD 之前，請先產出大綱，供多位產品經理分章節並行撰寫。
+第一行以「# 」開頭寫出產品名稱，接著用 3-5 句話說明產品定位（所有章節共用）。
+然後為下列每個章節各寫一段摘要（3-6 個要點：該章節要涵蓋的具體功能、角色、數據與約束，使用統一的名稱），
+每個章節以「## 編號. 章節標題」開頭，編號與標題必須與下列清單一致：
+{sections}
+
+需求澄清文檔：
+{context}"""
+
+_PRD_SECTION_PROMPT = """你是產品經理，正在與其他產品經理並行撰寫同一份 PRD 需求規格書，你只負責其中一個章節。
+
+PRD 大綱（所有章節共用，請使用其中的產品名稱、角色名稱與功能名稱）：
+{outline}
+
+**你負責的章節：{number}. {title}**
+本章節必須涵蓋：
+{items}
+
+要求：以「## {number}. {title}」開頭，使用 Markdown，內容詳盡具體（不少於 300 字），只撰寫本章節，不要重複其他章節的內容。
+
+需求澄清文檔：
+{context}"""
+
+_PRD_STITCH_PROMPT = """以下是由多人並行撰寫的 PRD 各章節。請檢查章節之間的名稱是否一致（產品名稱、用戶角色、功能模組、數據實體）。
+只輸出需要統一的名稱，每行一條，格式為：
+原用詞 => 統一用詞
+沒有需要統一的名稱時只輸出「無」。
+
+{document}"""
+
+_PRD_SECTION_PATTERN = re.compile(r"^(\d+)\.\s+\*\*(.+?)\*\*\s*\n((?:[ \t]+.*\n?)*)", re.MULTILINE)
+_STITCH_LINE_PATTERN = re.compile(r"^\s*[-*]?\s*(.+?)\s*=>\s*(.+?)\s*$", re.MULTILINE)
+_INLINE_CODE_PATTERN = re.compile(r"(`[^`\n]*`)")
+# 統一用詞（非英數字）的最少字數
+MIN_STITCH_TERM_CHARS = 3
+
+_PRESALES_MERGE_PROMPT = """{description}
+
+客戶填寫問卷的同時，各類別的回答已分別整理為需求澄清文檔的章節（見下方）。
+請不要重寫這些章節，只需補充跨類別的內容，以「## 」為章節標題依序輸出：
+1. 需求概述（產品定位與核心目標，3-5 句）
+2. 功能需求優先級總表
+3. 跨類別的矛盾點、潛在風險與待確認事項
+4. 成功標準與驗收條件
+
+各類別的整理結果：
+{digests}"""
+
+_FILE_HEADING_PATTERN = re.compile(r"^###\s+`?([^`\n]+?)`?\s*$", re.MULTILINE)
+
+_REVIEW_MAP_PROMPT = """你正在對一個專案的程式碼進行分塊 Code Review（第 {index}/{total} 塊，包含：{titles}）。
+只審查以下程式碼，逐條列出發現的問題，每條格式為：
+- [嚴重度：高/中/低] 檔案 - 問題描述 - 改進建議
+
+審查範圍：程式碼品質、安全性、效能、程式碼風格、潛在錯誤、最佳實踐遵循情況。
+沒有問題的檔案以一行註明「未發現問題」。不要重複貼出程式碼。
+
+{chunk}"""
+
+_REVIEW_MERGE_PROMPT = """以下是多個程式碼分塊的 Code Review 發現。請合併為一份問題清單：
+去除重複的問題，保留所有不同的問題及其嚴重度、檔案與改進建議，不要添加新的問題。
+
+{findings}"""
+
+_REVIEW_REDUCE_PROMPT = """{description}
+
+程式碼已按檔案 / 模組分為 {total} 塊分別審查，以下是各塊的審查發現。
+請將它們彙整為最終的代碼評審報告：合併重複問題、按嚴重度排序，涵蓋上述所有報告項目，並給出整體評估。
+預期輸出：{expected_output}
+{context}
+各分塊的審查發現：
+{findings}"""
+
+def _agent_key(agent) -> str:
+    role = getattr(agent, "role", None)
+    return get_llm_monitor().agents.get(role, {}).get("agent", role or "unknown")
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"環境變數 {name} 不是整數，使用預設值 {default}")
+        return default
+
+def _upstream_text(task) -> str:
+    """任務 context 中上游任務的完整輸出"""
+    outputs = [
+        context_task.output.raw
+        for context_task in (task.context if isinstance(task.context, list) else [])
+        if getattr(context_task, "output", None) is not None
+    ]
+    return "\n\n".join(outputs)
+
+def _earlier_outputs(task) -> List[Tuple[str, str]]:
+    """直接上游之前的前序任務輸出（沿 context 向上追溯，不含直接上游）：[(任務名稱, 輸出文字)]"""
+    direct = task.context if isinstance(task.context, list) else []
+    seen = {id(context_task) for context_task in direct}
+    pending = [parent for context_task in direct for parent in (getattr(context_task, "context", None) or [])]
+    outputs = []
+    while pending:
+        earlier_task = pending.pop(0)
+        if id(earlier_task) in seen:
+            continue
+        seen.add(id(earlier_task))
+        if getattr(earlier_task, "output", None) is not None:
+            outputs.append((earlier_task.name, earlier_task.output.raw))
+        pending.extend(getattr(earlier_task, "context", None) or [])
+    return outputs
+
+def _related_context(agent, task) -> str:
+    """
+    前序文件（PRD、架構…）中與任務最相關的章節，供分片 / 分塊執行時參考
+
+    只在 Agent 配置了 retrieval_top_k 時檢索；直接上游的輸出已由分片 / 分塊本身傳入，不重複
+    """
+    doc_index = get_doc_index()
+    top_k = doc_index.top_k.get(_agent_key(agent), 0)
+    earlier = _earlier_outputs(task)
+    if not top_k or not earlier:
+        return ""
+    documents = doc_index.stage_documents(f"{task.description}\n{task.expected_output}", top_k, [], earlier)
+    return "".join(text for _, text in documents)
+
+def _call_llm(agent, task, prompt: str) -> str:
+    """以 Agent 的 LLM 調用一次提示（按 Role 配置重試過載錯誤）"""
+    agent_key = _agent_key(agent)
+    config = get_llm_config(agent_key) if agent_key in DEFAULT_LLM_CONFIG else {}
+    handler = RetryHandler(
+        max_retries=config.get("retry_times", 3),
+        delay=config.get("retry_delay", 2.0),
+        backoff=config.get("retry_backoff", 1.5),
+        max_delay=config.get("max_retry_delay", 60.0),
+        agent_name=agent_key,
+    )
+    return handler.execute(invoke_llm, agent.llm, prompt, from_task=task, from_agent=agent)
+
+def _merge_findings(agent, task, findings: List[str], max_tokens: int, workers: int, model: Optional[str]) -> List[str]:
+    """審查發現總量超過上限時分組合併（可多輪），直到能放進一次彙整調用"""
+    while len(findings) > 1 and estimate_tokens("\n\n".join(findings), model) > max_tokens:
+        groups = pack_units([(str(i), text) for i, text in enumerate(findings)], max_tokens, model)
+        if len(groups) == len(findings):
+            # 每組只有一份發現，無法再合併，直接裁剪
+            return [trim_sections(text, max_tokens // len(findings), model) for text in findings]
+        findings = run_parallel(
+            lambda group: _call_llm(agent, task, _REVIEW_MERGE_PROMPT.format(findings=group[1])),
+            groups, workers, name="review-merge",
+        )
+    return findings
+
+def map_reduce_review(agent, task, context: Optional[str] = None) -> Optional[str]:
+    """
+    分塊 Code Review
+
+    map：將開發輸出按檔案 / 模組切分並打包為不超過 KANO_REVIEW_CHUNK_TOKENS 的分塊，在有界線程池中分別審查；
+    reduce：將各塊的發現彙整為最終的代碼評審報告（Agent 配置了 retrieval_top_k 時附上前序文件的檢索章節）。
+    程式碼只有一塊時返回 None（使用 Agent 的預設執行）
+    """
+    code = _upstream_text(task)
+    agent_key = _agent_key(agent)
+    model = get_context_budget().budgets.get(agent_key, {}).get("model")
+    max_tokens = _env_int(REVIEW_CHUNK_TOKENS_ENV, DEFAULT_REVIEW_CHUNK_TOKENS)
+    workers = max(1, _env_int(REVIEW_WORKERS_ENV, DEFAULT_REVIEW_WORKERS))
+    chunks = pack_units(split_code_units(code, max_tokens, model), max_tokens, model)
+    if len(chunks) <= 1:
+        return None
+
+    total = len(chunks)
+    logger.info(f"🔍 分塊 Code Review：{total} 塊，並行數 {workers}")
+
+    def review_chunk(item):
+        index, (titles, chunk) = item
+        with get_tracer().span(f"Code Review 分塊 {index}/{total}", cat="map", task=task.name):
+            findings = _call_llm(agent, task, _REVIEW_MAP_PROMPT.format(
+                index=index, total=total, titles="、".join(titles), chunk=chunk,
+            ))
+        return f"### 分塊 {index}：{'、'.join(titles)}\n{findings.strip()}"
+
+    findings = run_parallel(review_chunk, list(enumerate(chunks, 1)), workers, name="review-map")
+    findings = _merge_findings(agent, task, findings, max_tokens, workers, model)
+
+    # context 即已分塊審查的程式碼（直接上游）；彙整時改附 PRD / 架構等前序文件的檢索章節
+    earlier = _related_context(agent, task)
+    related = f"\n前序文件（PRD、架構設計）的相關章節：\n{trim_sections(earlier, max_tokens // 2, model)}\n" if earlier else ""
+    with get_tracer().span("Code Review 彙整", cat="reduce", task=task.name):
+        return _call_llm(agent, task, _REVIEW_REDUCE_PROMPT.format(
+            description=task.description,
+            total=total,
+            expected_output=task.expected_output,
+            context=related,
+            findings="\n\n".join(findings),
+        ))
+
+def _title_matches(title: str, keyword: str) -> bool:
+    """章節標題是否包含關鍵字（英文關鍵字按整詞匹配，避免 "ui" 匹配到 "guide"）"""
+    if keyword.isascii():
+        return re.search(rf"(?<![a-z]){re.escape(keyword)}(?![a-z])", title) is not None
+    return keyword in title
+
+def _assign_sections(architecture: str) -> Tuple[Dict[str, str], List[str]]:
+    """
+    按章節標題的關鍵字把架構文件的章節分配給開發分片
+
+    標題未匹配任何分片的子章節（標題層級較深者）繼承所屬上層章節的分片；文件標題（唯一的最上層標題）不被繼承。
+    未匹配也未繼承分片的章節視為共用（例如總覽、技術選型）
+
+    Returns:
+        (分片鍵 -> 該分片的架構文字, 分配到章節的分片鍵)；分片文字按文件順序包含共用章節與分配給該分片的章節
+    """
+    sections = [
+        (heading, body, len(heading) - len(heading.lstrip("#")) if heading else 0)
+        for heading, body in split_sections(architecture)
+    ]
+    levels = [level for _, _, level in sections if level]
+    title_level = min(levels) if levels and levels.count(min(levels)) == 1 else 0
+    parts = {key: [] for key, _, _, _ in DEV_SHARDS}
+    assigned = set()
+    # 上層章節：[(標題層級, 分配的分片鍵)]
+    parents: List[Tuple[int, List[str]]] = []
+    for heading, body, level in sections:
+        section = (heading + "\n" + body) if heading else body
+        while parents and parents[-1][0] >= level:
+            parents.pop()
+        title = heading.lower()
+        matched = [key for key, _, _, keywords in DEV_SHARDS if any(_title_matches(title, keyword) for keyword in keywords)]
+        if not matched and parents:
+            matched = parents[-1][1]
+        if heading:
+            parents.append((level, [] if level == title_level else matched))
+        assigned.update(matched)
+        for key in parts:
+            if not matched or key in matched:
+                parts[key].append(section)
+    return {key: "".join(sections) for key, sections in parts.items()}, [key for key in parts if key in assigned]
+
+def _merge_shards(results: List[Tuple[str, str]]) -> str:
+    """按分片順序合併各分片輸出，並在開頭加入檔案索引（同一路徑只在索引中列出一次）"""
+    files, seen = [], set()
+    for _, output in results:
+        for path in _FILE_HEADING_PATTERN.findall(output):
+            if path not in seen:
+                seen.add(path)
+                files.append(path)
+    parts = ["# 程式碼實作", "", "## 檔案索引"]
+    parts.extend(f"- {path}" for path in files)
+    for title, output in results:
+        parts.extend(["", f"## {title}", "", output.strip()])
+    return "\n".join(parts) + "\n"
+
+def sharded_development(agent, task, context: Optional[str] = None) -> Optional[str]:
+    """
+    分片開發
+
+    按架構文件的章節把開發階段拆為資料庫 / 後端 / 前端 / 外部整合 / 配置等獨立分片並行生成，
+    再按固定的分片順序合併為程式碼實作文件。架構文件沒有可分配的章節時返回 None（使用 Agent 的預設執行）。
+    各分片另附 PRD 等前序文件的檢索章節（Agent 配置了 retrieval_top_k 時）
+    """
+    architecture = _upstream_text(task)
+    documents, assigned = _assign_sections(architecture)
+    shards = [shard for shard in DEV_SHARDS if shard[0] in assigned or shard[0] in ("backend", "config")]
+    if len(assigned) < 2:
+        return None
+
+    agent_key = _agent_key(agent)
+    budget_config = get_context_budget().budgets.get(agent_key, {})
+    model = budget_config.get("model")
+    budget = budget_config.get("budget") or 0
+    workers = max(1, _env_int(DEV_WORKERS_ENV, DEFAULT_DEV_WORKERS))
+    logger.info(f"🧩 分片開發：{'、'.join(title for _, title, _, _ in shards)}，並行數 {workers}")
+    # context 即完整的架構文件（直接上游），各分片只取分配的章節；另附前序文件的檢索章節
+    earlier = _related_context(agent, task)
+
+    def develop_shard(shard):
+        key, title, scope, _ = shard
+        sections = documents[key]
+        others = "、".join(other_title for other_key, other_title, _, _ in DEV_SHARDS if other_key != key)
+        related = f"\n前序文件（PRD 等）的相關章節：\n{earlier}\n" if earlier else ""
+        if budget:
+            sections = trim_sections(sections, budget * 2 // 3, model)
+            related = trim_sections(related, budget // 3, model)
+        with get_tracer().span(f"開發分片 {title}", cat="map", task=task.name):
+            output = _call_llm(agent, task, _DEV_SHARD_PROMPT.format(
+                description=task.description, title=title, scope=scope, others=others,
+                architecture=sections, context=related,
+            ))
+        return title, output
+
+    return _merge_shards(run_parallel(develop_shard, shards, workers, name="dev-shard"))
+
+def _prd_sections(description: str) -> List[Tuple[str, str, str]]:
+    """從 PRD 任務描述中解析編號章節：[(編號, 標題, 要點)]"""
+    return [
+        (number, title.strip(), items.rstrip())
+        for number, title, items in _PRD_SECTION_PATTERN.findall(description)
+    ]
+
+def _outline_briefs(outline: str) -> Dict[str, str]:
+    """大綱中各章節的摘要：編號 -> 摘要"""
+    briefs = {}
+    for heading, body in split_sections(outline):
+        match = re.match(r"^##\s+(\d+)\.", heading)
+        if match:
+            briefs[match.group(1)] = body.strip()
+    return briefs
+
+def _term_pattern(term: str) -> re.Pattern:
+    """統一用詞的匹配：英數字開頭 / 結尾的用詞按整詞匹配（避免匹配到識別字或單字的一部分）"""
+    prefix = r"(?<![A-Za-z0-9_])" if re.match(r"[A-Za-z0-9_]", term) else ""
+    suffix = r"(?![A-Za-z0-9_])" if re.search(r"[A-Za-z0-9_]$", term) else ""
+    return re.compile(prefix + re.escape(term) + suffix)
+
+def _replace_outside_code(text: str, replacements: List[Tuple[re.Pattern, str]]) -> str:
+    """替換程式碼區塊與行內程式碼以外的文字"""
+    lines, in_fence = [], False
+    for line in text.splitlines(keepends=True):
+        if line.lstrip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+        elif not in_fence:
+            parts = _INLINE_CODE_PATTERN.split(line)
+            for i in range(0, len(parts), 2):
+                for pattern, unified in replacements:
+                    parts[i] = pattern.sub(lambda _: unified, parts[i])
+            line = "".join(parts)
+        lines.append(line)
+    return "".join(lines)
+
+def _apply_stitch(sections: List[str], stitch: str) -> List[str]:
+    """
+    按統一用詞表替換各章節中的名稱
+
+    只替換程式碼以外的文字；英數字用詞按整詞匹配，中文用詞至少 MIN_STITCH_TERM_CHARS 個字
+    （過短的用詞容易出現在其他詞語之中，不替換）
+    """
+    replacements = [
+        (original.strip("「」`\"'"), unified.strip("「」`\"'"))
+        for original, unified in _STITCH_LINE_PATTERN.findall(stitch)
+    ]
+    replacements = [
+        (_term_pattern(original), unified) for original, unified in replacements
+        if original != unified and (len(original) >= MIN_STITCH_TERM_CHARS or (original.isascii() and len(original) >= 2))
+    ]
+    if not replacements:
+        return sections
+    return [_replace_outside_code(section, replacements) for section in sections]
+
+def parallel_prd(agent, task, context: Optional[str] = None) -> Optional[str]:
+    """
+    PRD 分章節並行生成（設定 KANO_PRD_PARALLEL=1 時啟用）
+
+    1. 大綱：一次調用產出產品定位與各章節摘要
+    2. 章節：以大綱與需求澄清文檔為共用上下文，在有界線程池中並行撰寫各章節
+    3. 統一：一次輕量調用找出章節間不一致的名稱，替換後按章節編號合併
+    未啟用或任務描述中沒有編號章節時返回 None（使用 Agent 的預設執行）
+    """
+    if os.getenv(PRD_PARALLEL_ENV, "0").lower() not in ("1", "true", "yes"):
+        return None
+    sections = _prd_sections(task.description)
+    if len(sections) < 2:
+        return None
+
+    agent_key = _agent_key(agent)
+    budget_config = get_context_budget().budgets.get(agent_key, {})
+    model = budget_config.get("model")
+    budget = budget_config.get("budget") or 0
+    context = context or ""
+    shared_context = trim_sections(context, budget // 2, model) if budget else context
+    workers = max(1, _env_int(PRD_WORKERS_ENV, DEFAULT_PRD_WORKERS))
+    logger.info(f"📝 PRD 分章節並行生成：{len(sections)} 個章節，並行數 {workers}")
+
+    with get_tracer().span("PRD 大綱", cat="map", task=task.name):
+        outline = _call_llm(agent, task, _PRD_OUTLINE_PROMPT.format(
+            description=task.description,
+            sections="\n".join(f"{number}. {title}" for number, title, _ in sections),
+            context=shared_context,
+        ))
+    briefs = _outline_briefs(outline)
+    outline_text = outline.strip()
+
+    def write_section(section):
+        number, title, items = section
+        if number in briefs:
+            items = f"{items}\n\n大綱中的本章節摘要：\n{briefs[number]}"
+        with get_tracer().span(f"PRD 章節 {number}", cat="map", task=task.name):
+            text = _call_llm(agent, task, _PRD_SECTION_PROMPT.format(
+                outline=outline_text, number=number, title=title, items=items, context=shared_context,
+            ))
+        text = text.strip()
+        if not text.startswith("#"):
+            text = f"## {number}. {title}\n\n{text}"
+        return text
+
+    written = run_parallel(write_section, sections, workers, name="prd-section")
+
+    document = "\n\n".join(written)
+    with get_tracer().span("PRD 統一名稱", cat="reduce", task=task.name):
+        stitch = _call_llm(agent, task, _PRD_STITCH_PROMPT.format(
+            document=trim_sections(document, budget, model) if budget else document,
+        ))
+    written = _apply_stitch(written, stitch)
+
+    # 大綱的第一個章節（「# 產品名稱」與產品定位）作為文件開頭
+    heading, overview = split_sections(outline_text)[0]
+    if not heading.startswith("# "):
+        heading, overview = "# ", ""
+    parts = [heading.rstrip() + " PRD 需求規格書" if "PRD" not in heading else heading.rstrip()]
+    if overview.strip():
+        parts.append(overview.strip())
+    parts.extend(written)
+    return "\n\n".join(parts) + "\n"
+
+def presales_from_digests(agent, task, context: Optional[str] = None, requirements_text: Optional[str] = None) -> Optional[str]:
+    """
+    由問卷各類別的預先摘要合併需求澄清文檔（設定 KANO_PRESALES_DIGEST=1 時啟用）
+
+    各類別在使用者作答期間已於背景整理為文檔章節（utils.presales_digest），
+    這裡只等待尚未完成的類別，再以一次調用補充跨類別的概述、優先級、風險與驗收條件。
+    未啟用或沒有問卷回答時返回 None（使用 Agent 的預設執行）
+    """
+    digester = get_presales_digester()
+    if not requirements_text or not digester.configured:
+        return None
+    with get_tracer().span("等待類別摘要", cat="map", task=task.name):
+        digests = digester.collect(requirements_text)
+    if not digests:
+        return None
+    logger.info(f"📝 需求澄清：合併 {len(digests)} 個類別的預先摘要")
+
+    digest_text = "\n\n".join(text for _, text in digests)
+    with get_tracer().span("需求澄清跨類別分析", cat="reduce", task=task.name):
+        analysis = _call_llm(agent, task, _PRESALES_MERGE_PROMPT.format(description=task.description, digests=digest_text))
+
+    # 概述（第一個章節）放在各類別之前，其餘跨類別章節放在之後
+    sections = [(heading + "\n" + body).strip() for heading, body in split_sections(analysis) if heading.startswith("#")]
+    overview, rest = (sections[0], sections[1:]) if sections else ("", [analysis.strip()])
+    parts = ["# 需求澄清文檔"]
+    if overview:
+        parts.append(overview)
+    parts.append(digest_text)
+    parts.extend(part for part in rest if part)
+    return "\n\n".join(parts) + "\n"
@@ -0,0 +1,21 @@
+"""
+可自訂執行方式的任務
+"""
+from typing import Any, Callable, Optional
+
+from crewai import Task
+from pydantic import Field
+
+class StageTask(Task):
+    """
+    帶有 runner 的任務
+
+    runner(agent, task, context) -> Optional[str]：由 agents.base.StageAgent 調用，
+    用於把一個階段拆成多個並行的 LLM 調用（例如分塊 Code Review），返回 None 時使用 Agent 的預設執行
+    """
+
+    runner: Optional[Callable[..., Any]] = Field(
+        default=None,
+        exclude=True,
+        description="自訂執行函數 runner(agent, task, context)",
+    )
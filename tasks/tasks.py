@@ -1,3 +1,5 @@
+from functools import partial
+
 from crewai import Task
 from agents import (
     SeniorPreSalesConsultantAgent,
@@ -9,6 +11,9 @@ from agents import (
     TechnicalAgent,
 )
 from config.presales_questions import format_questions_for_agent
+from utils.output_saver import TASK_OUTPUT_NAMES
+from .stage_task import StageTask
+from .runners import map_reduce_review, parallel_prd, presales_from_digests, sharded_development
 
 def create_tasks(
     pre_sales_consultant,
@@ -101,15 +106,18 @@ def create_tasks(
 - 專案約束（時程、預算、資源）
 - 成功標準與驗收條件"""
     
-    # 任務 0: 資深售前顧問 - 需求澄清
-    requirements_clarification_task = Task(
+    # 任務 0: 資深售前顧問 - 需求澄清（KANO_PRESALES_DIGEST=1 時合併問卷期間預先整理的各類別摘要）
+    requirements_clarification_task = StageTask(
+        name=TASK_OUTPUT_NAMES[0],
         description=task_description,
         agent=pre_sales_consultant,
         expected_output="完整的需求澄清文檔（Markdown 格式），包含所有澄清後的需求信息，結構清晰、內容詳盡，字數不少於 1500 字",
+        runner=partial(presales_from_digests, requirements_text=user_requirements_text),
     )
     
-    # 任務 1: 產品經理 - 產出 PRD
-    prd_task = Task(
+    # 任務 1: 產品經理 - 產出 PRD（KANO_PRD_PARALLEL=1 時按章節並行生成）
+    prd_task = StageTask(
+        name=TASK_OUTPUT_NAMES[1],
         description="""作為產品經理，你的任務是根據資深售前顧問提供的需求澄清文檔，產出完整的 PRD (Product Requirements Document) 需求規格書。
 
 **輸入：** 需求澄清文檔（來自資深售前顧問）
@@ -189,10 +197,12 @@ def create_tasks(
         agent=product_manager,
         expected_output="完整的 PRD 需求規格書文件（Markdown 格式），包含所有功能點、用戶路徑、技術約束條件的詳細描述，結構清晰、內容完整，字數不少於 3000 字",
         context=[requirements_clarification_task],
+        runner=parallel_prd,
     )
     
     # 任務 2: 設計師 - UI/UX 設計
     design_task = Task(
+        name=TASK_OUTPUT_NAMES[2],
         description="""作為 UI/UX 設計師，你的任務是根據 PRD 文件設計軟體系統的用戶介面與用戶體驗。
 
 請產出完整的 UI/UX 設計方案，必須包含以下內容：
@@ -230,6 +240,7 @@ def create_tasks(
     
     # 任務 3: 架構工程師 - 系統設計
     architecture_task = Task(
+        name=TASK_OUTPUT_NAMES[3],
         description="""作為架構工程師，你的任務是根據 PRD 和設計方案，設計完整的系統架構。
 
 請產出完整的系統設計文件，必須包含以下內容：
@@ -284,8 +295,9 @@ def create_tasks(
         context=[prd_task, design_task],
     )
     
-    # 任務 4: 開發工程師 - 程式碼實作
-    development_task = Task(
+    # 任務 4: 開發工程師 - 程式碼實作（按架構文件章節分為資料庫 / 後端 / 前端 / 整合 / 配置分片並行生成）
+    development_task = StageTask(
+        name=TASK_OUTPUT_NAMES[4],
         description="""作為開發工程師，你的任務是根據系統設計文件，撰寫完整的程式碼實作。
 
 請根據 PRD 和系統設計文件，實作以下內容：
@@ -332,10 +344,12 @@ def create_tasks(
         agent=developer,
         expected_output="完整的程式碼實作，包含後端 API、前端應用、資料庫腳本、外部系統整合程式碼和配置檔案，所有程式碼必須可執行，並符合 PRD 中的所有功能需求",
         context=[architecture_task],
+        runner=sharded_development,
     )
     
-    # 任務 5: 評審工程師 - Code Review
-    review_task = Task(
+    # 任務 5: 評審工程師 - Code Review（程式碼較長時按檔案 / 模組分塊並行審查後彙整）
+    review_task = StageTask(
+        name=TASK_OUTPUT_NAMES[5],
         description="""對開發完成的程式碼進行 Code Review。
         產出代碼評審報告包括：
         1. 程式碼品質評估
@@ -347,10 +361,12 @@ def create_tasks(
         agent=reviewer,
         expected_output="詳細的代碼評審報告，包含所有發現的問題和改進建議",
         context=[development_task],
+        runner=map_reduce_review,
     )
     
     # 任務 6: 測試工程師 - 產品測試
     test_task = Task(
+        name=TASK_OUTPUT_NAMES[6],
         description="""對開發完成的產品進行全面測試。
         產出測試報告包括：
         1. 測試計劃與策略
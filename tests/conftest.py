@@ -0,0 +1,16 @@
+"""測試共用設定：API 日誌與日誌目錄寫入暫存目錄，不寫入專案的 output/ 與 logs/"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import api_logger, logger_config
+
+@pytest.fixture(autouse=True)
+def _isolated_logs(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger_config, "LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setattr(api_logger, "_api_logger", api_logger.APILogger(str(tmp_path / "output" / "api_calls.log")))
+    yield
+    api_logger.reset_api_logger()
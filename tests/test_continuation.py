@@ -0,0 +1,74 @@
+"""utils.continuation：暫時性錯誤後的退避與續寫"""
+import os
+import sys
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cancellation import new_cancel_token
+from utils.continuation import install_continuation
+from utils.watchdog import StageTimeoutError, StallTimeoutError
+
+class _ScriptedLLM:
+    """按腳本回應的假 LLM：每次請求串流輸出指定片段，之後可拋出錯誤"""
+
+    def __init__(self, script):
+        self.stream = True
+        self.script = list(script)
+        self.requests = []
+        completions = types.SimpleNamespace(create=self._create)
+        self.client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+
+    def _create(self, **kwargs):
+        self.requests.append((time.monotonic(), kwargs["messages"]))
+        text, error = self.script.pop(0)
+
+        def chunks():
+            if text:
+                delta = types.SimpleNamespace(content=text)
+                finish = None if error else "stop"
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta, finish_reason=finish)])
+            if error:
+                raise error
+        return chunks()
+
+    def call(self, messages, **kwargs):
+        return "".join(
+            chunk.choices[0].delta.content
+            for chunk in self.client.chat.completions.create(messages=messages, stream=True)
+        )
+
+RETRY = {"retry_delay": 0.5, "retry_backoff": 1.5, "max_retry_delay": 60}
+
+@pytest.fixture(autouse=True)
+def _token():
+    new_cancel_token()
+
+def test_transient_error_backs_off_before_continuing():
+    head = "甲" * 300
+    llm = _ScriptedLLM([(head, ConnectionError("503 Service Unavailable")), ("乙乙", None)])
+    install_continuation(llm, "writer", RETRY)
+    assert llm.call("寫一份文件") == head + "乙乙"
+    (first, _), (second, messages) = llm.requests
+    assert second - first >= 0.5 * 0.8
+    assert messages[-2] == {"role": "assistant", "content": head}
+
+def test_continuation_without_new_text_stops():
+    error = ConnectionError("503 Service Unavailable")
+    llm = _ScriptedLLM([("甲" * 300, error), ("", error), ("", error), ("", error)])
+    install_continuation(llm, "writer", {"retry_delay": 0.1})
+    with pytest.raises(ConnectionError):
+        llm.call("寫一份文件")
+    assert len(llm.requests) == 2
+
+@pytest.mark.parametrize("error_class", [StageTimeoutError, StallTimeoutError])
+def test_watchdog_timeouts_are_not_continued(error_class):
+    error = error_class("writer 超過 task_timeout / stall_timeout=30s")
+    llm = _ScriptedLLM([("甲" * 300, error), ("乙乙", None)])
+    install_continuation(llm, "writer", {"retry_delay": 0.1})
+    with pytest.raises(error_class):
+        llm.call("寫一份文件")
+    assert len(llm.requests) == 1
@@ -0,0 +1,38 @@
+"""utils.doc_index：下游任務上下文的組合"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.context_budget import ContextBudgetManager
+from utils.doc_index import DocIndex
+
+TEST_TASK_QUERY = "根據開發輸出的程式碼撰寫測試案例與測試報告，涵蓋單元測試、整合測試與邊界條件"
+
+def _prd(sections: int = 40) -> str:
+    return "# PRD\n" + "\n".join(
+        f"## 功能 {i} 測試與驗收\n功能 {i} 的需求說明，包含測試案例、驗收條件與邊界條件。" for i in range(sections)
+    )
+
+def _code(files: int = 30) -> str:
+    return "# 開發輸出\n" + "\n".join(
+        f"### src/module_{i}.py\n```python\ndef handler_{i}(request):\n    return {{'status': {i}}}\n```" for i in range(files)
+    )
+
+def test_upstream_code_is_kept_whole_with_retrieval():
+    index = DocIndex()
+    code = _code()
+    documents = index.stage_documents(TEST_TASK_QUERY, 8, [("開發任務", code)], [("PRD 任務", _prd()), ("開發任務", code)])
+    context = ContextBudgetManager().build_context("tester", documents)
+    assert sum(f"def handler_{i}(request)" in context for i in range(30)) == 30
+    assert "前序階段文件目錄" in context
+    assert "【PRD 任務】" in context
+    # 直接上游輸出不重複出現在檢索章節中
+    assert "【開發任務】" not in context
+
+def test_no_retrieval_without_top_k_or_earlier_documents():
+    index = DocIndex()
+    upstream = [("開發任務", _code(3))]
+    assert index.stage_documents(TEST_TASK_QUERY, 0, upstream, [("PRD 任務", _prd(3))]) == upstream
+    assert index.stage_documents(TEST_TASK_QUERY, 8, upstream, []) == upstream
+    assert not index.documents
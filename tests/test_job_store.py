@@ -0,0 +1,23 @@
+"""utils.job_store：任務的領取、心跳與結束記錄"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.job_store import FAILED, QUEUED, RUNNING, SUCCEEDED, JobStore
+
+def test_finish_after_lost_lease_does_not_overwrite_new_owner(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = store.submit("需求")["id"]
+    store.claim(worker_pid=111)
+
+    # 租約逾時：任務放回佇列並由另一個 worker 領取
+    assert store.requeue(job_id, "心跳逾時", max_attempts=3) == QUEUED
+    store.claim(worker_pid=222)
+
+    assert not store.finish(job_id, FAILED, "舊 worker 的結果", worker_pid=111)
+    job = store.get(job_id)
+    assert job["status"] == RUNNING and job["worker_pid"] == 222
+
+    assert store.finish(job_id, SUCCEEDED, worker_pid=222)
+    assert store.get(job_id)["status"] == SUCCEEDED
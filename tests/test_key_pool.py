@@ -0,0 +1,42 @@
+"""utils.key_pool：API Key 的輪替、冷卻與暫停"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cancellation import new_cancel_token
+from utils.key_pool import AllKeysExhaustedError, KeyPool
+
+QUOTA_ERROR = Exception("429 quota exceeded for this API key")
+RATE_LIMIT_ERROR = Exception("429 rate limit exceeded, too many requests")
+
+@pytest.fixture(autouse=True)
+def _env(monkeypatch):
+    monkeypatch.setenv("KANO_KEY_PARK", "3600")
+    monkeypatch.setenv("KANO_KEY_COOLDOWN", "60")
+    new_cancel_token()
+
+def test_rotates_keys():
+    pool = KeyPool("deepseek", ["key-a", "key-b"])
+    assert [pool.acquire().key for _ in range(3)] == ["key-a", "key-b", "key-a"]
+
+def test_rate_limited_key_is_not_counted_as_exhausted():
+    pool = KeyPool("deepseek", ["key-a", "key-b"])
+    a, b = pool.acquire(), pool.acquire()
+    assert pool.report_error(a, QUOTA_ERROR) and a.parked
+    assert pool.report_error(b, RATE_LIMIT_ERROR) and not b.parked
+
+    # key-a 已暫停、key-b 在本次調用中被限流：交由外層重試，而不是視為所有 Key 都已用盡
+    assert pool.acquire(exclude={b.key}) is None
+
+def test_all_keys_parked_raises():
+    pool = KeyPool("deepseek", ["key-a", "key-b"])
+    a, b = pool.acquire(), pool.acquire()
+    pool.report_error(a, QUOTA_ERROR)
+    pool.report_error(b, QUOTA_ERROR)
+    with pytest.raises(AllKeysExhaustedError):
+        pool.acquire()
+    with pytest.raises(AllKeysExhaustedError):
+        pool.acquire(exclude={b.key})
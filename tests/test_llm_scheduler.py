@@ -0,0 +1,49 @@
+"""utils.llm_scheduler：調用名額的分配與歸還"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.llm_scheduler import LLMScheduler
+
+def test_release_owner_frees_slots_of_dead_worker():
+    scheduler = LLMScheduler(concurrency={"deepseek": 1})
+    held = scheduler.enqueue("deepseek", "a", owner=101)
+    queued = scheduler.enqueue("deepseek", "a", owner=101)
+    other = scheduler.enqueue("deepseek", "b", owner=202)
+    assert scheduler.wait(held, timeout=0)
+    assert not scheduler.wait(other, timeout=0)
+
+    # 持有名額的 worker 結束：它持有與等待中的號碼牌都被歸還，名額交給其他 worker
+    assert scheduler.release_owner(101) == 2
+    assert scheduler.wait(other, timeout=0)
+    assert scheduler.wait(queued, timeout=0)  # 已歸還的號碼牌不阻擋調用
+    assert scheduler.release_owner(101) == 0
+
+def _batch_scheduler():
+    return LLMScheduler(concurrency={"ollama": 4}, batch_providers=("ollama",), batch_limit=3)
+
+def test_batch_limit_ignored_without_other_models():
+    scheduler = _batch_scheduler()
+    tickets = [scheduler.enqueue("ollama", model="qwen") for _ in range(6)]
+    assert [scheduler.wait(ticket, timeout=0) for ticket in tickets] == [True] * 4 + [False] * 2
+
+    # 沒有其他模型排隊時，空出的名額直接交給同一模型的請求
+    scheduler.release(tickets[0])
+    scheduler.release(tickets[1])
+    assert scheduler.wait(tickets[4], timeout=0) and scheduler.wait(tickets[5], timeout=0)
+
+def test_batch_switches_model_after_limit_and_drain():
+    scheduler = _batch_scheduler()
+    first = [scheduler.enqueue("ollama", model="qwen") for _ in range(3)]
+    other = scheduler.enqueue("ollama", model="llama")
+    extra = scheduler.enqueue("ollama", model="qwen")
+    assert all(scheduler.wait(ticket, timeout=0) for ticket in first)
+    # 已連續分配 3 次且有其他模型排隊：不再分配目前模型，等待其調用結束後切換
+    assert not scheduler.wait(other, timeout=0) and not scheduler.wait(extra, timeout=0)
+    for ticket in first[:2]:
+        scheduler.release(ticket)
+    assert not scheduler.wait(other, timeout=0)
+    scheduler.release(first[2])
+    assert scheduler.wait(other, timeout=0)
+    assert not scheduler.wait(extra, timeout=0)
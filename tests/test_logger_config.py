@@ -0,0 +1,27 @@
+"""utils.logger_config：共用監聽線程的輸出級別"""
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import logger_config
+
+def test_later_lower_level_reaches_sink_handlers():
+    try:
+        logger_config.setup_logger("kano.test.info", logging.INFO)
+        assert all(handler.level == logging.INFO for handler in logger_config._listener.handlers)
+
+        debug_logger = logger_config.setup_logger("kano.test.debug", logging.DEBUG)
+        assert all(handler.level == logging.DEBUG for handler in logger_config._listener.handlers)
+        assert debug_logger.isEnabledFor(logging.DEBUG)
+        # 其他 logger 仍按自身的級別過濾
+        assert not logging.getLogger("kano.test.info").isEnabledFor(logging.DEBUG)
+
+        # 同一 logger 以較低級別重新設置
+        again = logger_config.setup_logger("kano.test.info", logging.DEBUG)
+        assert all(handler.level == logging.DEBUG for handler in again.handlers)
+    finally:
+        logger_config.shutdown_logging()
+        for name in ("kano.test.info", "kano.test.debug"):
+            logging.getLogger(name).handlers.clear()
@@ -0,0 +1,29 @@
+"""utils.metrics_exporter：Prometheus 文字格式"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.api_logger import METRIC_CALL_LATENCY, APILogger
+from utils.metrics_exporter import render_prometheus
+
+def test_histogram_dimensions_use_separate_metrics(tmp_path):
+    api_logger = APILogger(str(tmp_path / "api_calls.log"))
+    api_logger.record_latency(METRIC_CALL_LATENCY, 1.2, agent="architect", model="deepseek-chat", provider="deepseek", task="架構")
+    api_logger.record_latency(METRIC_CALL_LATENCY, 3.0, agent="developer", model="deepseek-chat", provider="deepseek", task="開發")
+    text = render_prometheus(api_logger)
+
+    # 同一指標內各序列的 count 合計等於調用次數，不重複計算
+    for name in ("kano_llm_call_latency_seconds", "kano_llm_call_latency_by_agent_seconds",
+                 "kano_llm_call_latency_by_model_seconds", "kano_llm_call_latency_by_task_seconds"):
+        counts = [float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(f"{name}_count")]
+        assert sum(counts) == 2, name
+    assert 'kano_llm_call_latency_by_agent_seconds_count{agent="developer"} 1' in text
+    assert 'by="' not in text and 'key="' not in text
+
+def test_initialized_records_are_not_requests(tmp_path):
+    api_logger = APILogger(str(tmp_path / "api_calls.log"))
+    api_logger.log_call("architect", "deepseek-chat", "api", status="initialized")
+    api_logger.log_call("architect", "deepseek-chat", "api", status="success", duration=1.0)
+    requests = [line for line in render_prometheus(api_logger).splitlines() if line.startswith("kano_llm_requests_total{")]
+    assert len(requests) == 1 and 'status="success"' in requests[0]
@@ -0,0 +1,36 @@
+"""utils.run_cache：階段輸入指紋"""
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.run_cache import RunCache
+
+def _task():
+    upstream = types.SimpleNamespace(output=types.SimpleNamespace(raw="# PRD\n需求"))
+    return types.SimpleNamespace(name="architecture", description="設計架構", expected_output="架構文件", context=[upstream])
+
+def test_input_hash_covers_context_settings_and_runner_env(tmp_path, monkeypatch):
+    monkeypatch.delenv("KANO_DEV_WORKERS", raising=False)
+    cache = RunCache(str(tmp_path), enabled=True)
+    task = _task()
+    base = cache.input_hash(task, "deepseek-chat", "上游輸出", {"context_budget": 8000, "retrieval_top_k": 12})
+    assert base == cache.input_hash(task, "deepseek-chat", "上游輸出", {"retrieval_top_k": 12, "context_budget": 8000})
+
+    # 檢索的前序章節改變（上游輸出不變）
+    assert base != cache.input_hash(task, "deepseek-chat", "上游輸出\n檢索章節", {"context_budget": 8000, "retrieval_top_k": 12})
+    # 上下文預算改變
+    assert base != cache.input_hash(task, "deepseek-chat", "上游輸出", {"context_budget": 4000, "retrieval_top_k": 12})
+    # 分片設定改變
+    monkeypatch.setenv("KANO_DEV_WORKERS", "2")
+    assert base != cache.input_hash(task, "deepseek-chat", "上游輸出", {"context_budget": 8000, "retrieval_top_k": 12})
+
+def test_lookup_reuses_output_only_for_same_input(tmp_path):
+    cache = RunCache(str(tmp_path), enabled=True)
+    task = _task()
+    first = cache.input_hash(task, "m", "ctx")
+    cache.store(task, first, "架構輸出")
+    reloaded = RunCache(str(tmp_path), enabled=True)
+    assert reloaded.lookup(task, first) == "架構輸出"
+    assert reloaded.lookup(task, cache.input_hash(task, "m", "ctx2")) is None
@@ -0,0 +1,114 @@
+"""tasks.runners：分片開發與分塊 Code Review"""
+import os
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("crewai")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tasks.runners import _assign_sections
+
+ARCHITECTURE = """# 後端系統設計
+
+## 1. 系統概覽
+單體應用。
+
+## 2. 資料庫設計
+使用 PostgreSQL。
+
+### 2.1 用戶表 users
+| 欄位 | 類型 |
+
+### 2.2 訂單表 orders
+| 欄位 | 類型 |
+
+## 3. 技術選型
+Python 3.11。
+
+## 4. 後端 API
+### 4.1 訂單端點
+POST /orders
+"""
+
+def test_nested_sections_follow_parent_shard_in_document_order():
+    documents, assigned = _assign_sections(ARCHITECTURE)
+    assert assigned == ["database", "backend"]
+
+    database = documents["database"]
+    for text in ("## 1. 系統概覽", "## 2. 資料庫設計", "### 2.1 用戶表 users", "### 2.2 訂單表 orders", "## 3. 技術選型"):
+        assert text in database
+    assert "### 4.1 訂單端點" not in database
+    # 共用章節與分配的章節按文件順序排列
+    assert database.index("## 1.") < database.index("### 2.1") < database.index("### 2.2") < database.index("## 3.")
+
+    backend = documents["backend"]
+    assert "### 4.1 訂單端點" in backend and "### 2.1 用戶表 users" not in backend
+    assert backend.index("## 3.") < backend.index("## 4.") < backend.index("### 4.1")
+    # 文件標題匹配後端，但不作為上層章節讓其他章節繼承
+    assert "## 1. 系統概覽" in documents["frontend"] and "# 後端系統設計" not in documents["frontend"]
+
+def _task(name, raw, context=None, **fields):
+    output = types.SimpleNamespace(raw=raw) if raw is not None else None
+    return types.SimpleNamespace(name=name, output=output, context=context or [], **fields)
+
+PRD = """# PRD
+
+## 1. 訂單管理
+用戶可以建立訂單，訂單包含商品與數量。
+
+## 2. 報表
+管理員查看每月營收。
+"""
+
+def test_shards_get_earlier_documents_instead_of_upstream_again(monkeypatch):
+    import tasks.runners as runners
+
+    prompts = []
+    monkeypatch.setattr(runners, "_call_llm", lambda agent, task, prompt: prompts.append(prompt) or "### a.py\n")
+    runners.get_doc_index().configure("shard_tester", 2)
+    prd_task = _task("prd", PRD)
+    architecture_task = _task("architecture", ARCHITECTURE, [prd_task])
+    task = _task("development", None, [architecture_task], description="實作訂單", expected_output="程式碼")
+    agent = types.SimpleNamespace(role="shard_tester")
+
+    runners.sharded_development(agent, task, context=ARCHITECTURE)
+    database_prompt = next(prompt for prompt in prompts if "資料庫模型與遷移腳本" in prompt.split("**你只負責")[1][:30])
+    # 架構文件只出現分配的章節一次，另附 PRD 的檢索章節
+    assert database_prompt.count("### 2.1 用戶表 users") == 1
+    assert "### 4.1 訂單端點" not in database_prompt
+    assert "訂單管理" in database_prompt
+
+def test_review_reduce_gets_earlier_documents_instead_of_code(monkeypatch):
+    import tasks.runners as runners
+
+    prompts = []
+    monkeypatch.setattr(runners, "_call_llm", lambda agent, task, prompt: prompts.append(prompt) or "- 無")
+    monkeypatch.setenv("KANO_REVIEW_CHUNK_TOKENS", "60")
+    runners.get_doc_index().configure("review_tester", 2)
+    code = "".join(f"### app/module_{i}.py\n```python\ndef handler_{i}():\n    return {i}\n```\n\n" for i in range(12))
+    prd_task = _task("prd", PRD)
+    architecture_task = _task("architecture", ARCHITECTURE, [prd_task])
+    development_task = _task("development", code, [architecture_task])
+    task = _task("review", None, [development_task], description="審查訂單程式碼", expected_output="評審報告")
+    agent = types.SimpleNamespace(role="review_tester")
+
+    runners.map_reduce_review(agent, task, context=code)
+    reduce_prompt = prompts[-1]
+    assert "def handler_" not in reduce_prompt
+    assert "前序文件（PRD、架構設計）的相關章節" in reduce_prompt
+
+def test_stitch_replaces_whole_terms_outside_code():
+    from tasks.runners import _apply_stitch
+
+    section = (
+        "## 2. 會員功能\n會員中心提供 UI 與 user 資料，guide 另行說明。\n"
+        "```python\nui = load_user()\n```\n使用 `user_id` 查詢會員中心。\n"
+    )
+    stitch = "會員中心 => 用戶中心\nUI => 介面\nuser => 使用者\n會員 => 用戶"
+    (result,) = _apply_stitch([section], stitch)
+    assert "用戶中心提供 介面 與 使用者 資料，guide 另行說明。" in result
+    # 程式碼區塊與行內程式碼不變；過短的中文用詞（會員）不替換
+    assert "ui = load_user()" in result and "`user_id` 查詢用戶中心" in result
+    assert "## 2. 會員功能" in result
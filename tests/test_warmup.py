@@ -0,0 +1,40 @@
+"""utils.warmup：背景預熱的控制台輸出"""
+import logging
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("requests")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logger_config import MutedThreadFilter
+from utils.warmup import Warmup
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def test_warmup_logs_stay_off_console_until_taken():
+    console = _Collect()
+    console.addFilter(MutedThreadFilter())
+    test_logger = logging.getLogger("kano.test.warmup")
+    test_logger.addHandler(console)
+    test_logger.setLevel(logging.INFO)
+    try:
+        warmup = Warmup()
+        warmup.start(lambda: test_logger.info("建立 Agent") or "ready", "fp")
+        assert warmup.take("fp", timeout=5) == "ready"
+        assert console.messages == []
+
+        # 取用後恢復輸出
+        warmup.start(lambda: "again", "fp2")
+        warmup.take("fp2", timeout=5)
+        test_logger.info("主線程")
+        assert console.messages == ["主線程"]
+    finally:
+        test_logger.removeHandler(console)
@@ -0,0 +1,92 @@
+"""utils.watchdog：按調用記錄進展的停滯監控"""
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cancellation import install_cancellation, new_cancel_token
+from utils.continuation import install_continuation
+from utils.watchdog import StallTimeoutError, get_watchdog, install_watchdog
+
+class _Stream:
+    """逐片段輸出的假串流回應（interval 秒一個片段，closed 後停止）"""
+
+    def __init__(self, chunks, interval):
+        self.chunks, self.interval, self.closed = chunks, interval, threading.Event()
+
+    def __iter__(self):
+        for text in self.chunks:
+            if self.closed.wait(self.interval):
+                raise ConnectionError("stream closed")
+            delta = types.SimpleNamespace(content=text)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta, finish_reason=None)])
+
+    def close(self):
+        self.closed.set()
+
+class _FakeLLM:
+    """以 OpenAI 相容 client 串流調用的假 LLM"""
+
+    def __init__(self, interval, stream=True, chunks=5):
+        self.stream = stream
+        self.streams = []
+        self.interval, self.chunks = interval, chunks
+        completions = types.SimpleNamespace(create=self._create)
+        self.client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+
+    def _create(self, **kwargs):
+        response = _Stream(["x"] * self.chunks, self.interval)
+        self.streams.append(response)
+        return response
+
+    def call(self, messages, **kwargs):
+        if not self.stream:
+            time.sleep(self.interval * self.chunks)
+            return "done"
+        return "".join(
+            chunk.choices[0].delta.content
+            for chunk in self.client.chat.completions.create(messages=messages, stream=True)
+        )
+
+def _install(llm, agent_key, stall_timeout):
+    get_watchdog().configure(agent_key, 0, stall_timeout)
+    install_cancellation(llm)
+    install_continuation(llm)
+    install_watchdog(llm, agent_key, stall_retries=0)
+
+@pytest.fixture(autouse=True)
+def _token():
+    new_cancel_token()
+
+def test_streaming_call_with_progress_is_not_stalled():
+    llm = _FakeLLM(interval=0.3, chunks=5)
+    _install(llm, "stream_ok", stall_timeout=0.8)
+    assert llm.call("hi") == "xxxxx"
+
+def test_non_streaming_call_is_not_checked_for_stall():
+    llm = _FakeLLM(interval=0.3, stream=False, chunks=5)
+    _install(llm, "no_stream", stall_timeout=0.5)
+    assert llm.call("hi") == "done"
+
+def test_stalled_call_is_aborted():
+    llm = _FakeLLM(interval=5.0, chunks=2)
+    _install(llm, "stalled", stall_timeout=0.5)
+    with pytest.raises(StallTimeoutError):
+        llm.call("hi")
+    assert llm.streams and llm.streams[0].closed.is_set()
+
+def test_parallel_calls_do_not_hide_each_others_stall():
+    healthy = _FakeLLM(interval=0.2, chunks=15)
+    stalled = _FakeLLM(interval=5.0, chunks=2)
+    _install(healthy, "shared_agent", stall_timeout=0.8)
+    _install(stalled, "shared_agent", stall_timeout=0.8)
+    worker = threading.Thread(target=healthy.call, args=("hi",))
+    worker.start()
+    with pytest.raises(StallTimeoutError):
+        stalled.call("hi")
+    worker.join()
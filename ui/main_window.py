@@ -10,6 +10,7 @@ from typing import Dict, Optional, Callable
 from datetime import datetime
 import os
 import sys
+import time
 
 # 添加父目錄到路徑
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -19,6 +20,9 @@ from utils.logger_config import get_logger
 
 logger = get_logger()
 
+# 執行中的階段超過此秒數沒有任何步驟或串流輸出時，在階段耗時表中標示為可能停滯
+STALL_WARNING_SECONDS = 120
+
 class MainWindow:
     """主視窗類"""
     
@@ -33,6 +37,12 @@ class MainWindow:
         self.current_task = None
         self.task_progress = 0
         self.total_tasks = 7
+        self.has_error = False
+        # 階段計時：任務名稱 -> {"start": 開始時間, "last_activity": 最近活動時間}
+        self.running_stages = {}
+        # 當前執行的取消標記（停止按鈕使用）
+        self.cancel_token = None
+        self.was_cancelled = False
         
         # 配置數據
         self.config_data = {}
@@ -226,6 +236,24 @@ class MainWindow:
             self.roles_tree.insert("", "end", role_key, text=role_name, 
                                   values=("等待中", "-", "0%"))
         
+        # 階段耗時（每個任務的即時耗時、Token 與重試次數，閒置過久時標示為可能停滯）
+        stages_frame = ttk.LabelFrame(self.monitor_frame, text="階段耗時")
+        stages_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        stage_columns = ("status", "elapsed", "idle", "steps", "calls", "tokens", "retries")
+        self.stages_tree = ttk.Treeview(stages_frame, columns=stage_columns, show="tree headings", height=7)
+        self.stages_tree.heading("#0", text="階段")
+        for column, title in zip(stage_columns, ("狀態", "耗時", "閒置", "步數", "LLM 調用", "Tokens", "重試")):
+            self.stages_tree.heading(column, text=title)
+            self.stages_tree.column(column, width=90, anchor=tk.CENTER)
+        self.stages_tree.column("#0", width=200)
+        self.stages_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        from utils.output_saver import TASK_OUTPUT_NAMES
+        for task_name in TASK_OUTPUT_NAMES:
+            self.stages_tree.insert("", "end", task_name, text=task_name,
+                                    values=("等待中", "-", "-", "-", "-", "-", "-"))
+        
         # 日誌顯示區域
         log_frame = ttk.LabelFrame(self.monitor_frame, text="執行日誌")
         log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -233,6 +261,15 @@ class MainWindow:
         self.log_text = scrolledtext.ScrolledText(log_frame, height=15, wrap=tk.WORD)
         self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         self.log_text.config(state=tk.DISABLED)
+        
+        # 即時輸出區域（串流模式下顯示 Agent 正在生成的內容）
+        stream_frame = ttk.LabelFrame(self.monitor_frame, text="即時輸出")
+        stream_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        self.stream_text = scrolledtext.ScrolledText(stream_frame, height=12, wrap=tk.WORD)
+        self.stream_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.stream_text.config(state=tk.DISABLED)
+        self._stream_key = None
     
     def create_status_bar(self):
         """創建狀態欄"""
@@ -294,6 +331,10 @@ class MainWindow:
                 os.environ[f"{role_key.upper()}_API_MODEL"] = vars_dict["api_model"].get()
                 os.environ[f"{role_key.upper()}_LOCAL_MODEL"] = vars_dict["local_model"].get()
             
+            # 配置有變更時按新配置重新預熱 Crew（未變更時沿用進行中的預熱）
+            from crew_advanced import start_crew_warmup
+            start_crew_warmup()
+            
             messagebox.showinfo("成功", "配置已保存到環境變數！\n\n注意：此配置僅在本次運行中有效。\n如需永久保存，請編輯 .env 文件。")
             logger.info("用戶保存了模型配置")
         except Exception as e:
@@ -351,6 +392,16 @@ class MainWindow:
         self.update_status("執行中...")
         self.update_progress(0)
         
+        # 重置階段耗時表
+        self.running_stages = {}
+        for task_name in self.stages_tree.get_children():
+            self.stages_tree.item(task_name, values=("等待中", "-", "-", "-", "-", "-", "-"))
+        
+        # 在啟動線程前建立取消標記，避免停止按鈕與線程啟動競爭
+        from utils.cancellation import CancellationToken
+        self.cancel_token = CancellationToken()
+        self.was_cancelled = False
+        
         # 在新線程中執行
         thread = threading.Thread(target=self.run_kano_agent, daemon=True)
         thread.start()
@@ -366,15 +417,13 @@ class MainWindow:
         if not messagebox.askyesno("確認停止", "確定要停止執行嗎？"):
             return
         
-        self.is_running = False
-        self.confirm_and_start_button.config(state=tk.NORMAL)
+        # 取消後進行中的 LLM 調用會在 1 秒內中止，按鈕狀態在收到 finished 消息後恢復
         self.stop_button.config(state=tk.DISABLED)
-        self.update_status("已停止")
+        self.update_status("正在停止...")
         logger.info("用戶停止執行")
-        
-        # 注意：由於執行在後台線程中，無法立即停止
-        # 只能設置標誌，實際停止需要等待當前任務完成
-        self.add_log("用戶請求停止執行（將在當前任務完成後停止）", "WARNING")
+        if self.cancel_token:
+            self.cancel_token.cancel("用戶停止執行")
+        self.add_log("用戶請求停止執行，正在中止進行中的調用並保存已完成的輸出...", "WARNING")
     
     def create_requirements_tab(self):
         """創建需求收集標籤頁"""
@@ -409,7 +458,9 @@ class MainWindow:
     def open_requirements_ui(self):
         """打開需求收集界面"""
         from ui.requirements_ui import RequirementsUI
-        req_ui = RequirementsUI(self.root)
+        from utils.presales_digest import get_presales_digester
+        # 離開每個類別的標籤頁時在背景預先整理該類別（KANO_PRESALES_DIGEST=1）
+        req_ui = RequirementsUI(self.root, on_category_complete=get_presales_digester().submit_category)
         result = req_ui.show()
         
         if result:
@@ -464,22 +515,66 @@ class MainWindow:
     
     def run_kano_agent(self):
         """在後台線程中運行 KanoAgent"""
+        from utils.cancellation import CancelledError, new_cancel_token
+        from utils.output_saver import save_checkpoint
+        crew = None
         try:
             # 導入主程式
             from crew_advanced import create_kano_crew_advanced
             from utils.output_saver import extract_and_save_task_outputs
+            from utils.api_logger import get_api_logger
+            from utils.tracing import get_tracer, reset_tracer
+            from utils.stream_bus import get_stream_bus, CHUNK
+            from utils.output_saver import PartialOutputWriter, TASK_OUTPUT_NAMES
+            from utils.progress import ProgressReporter
             import os
             
             # 使用收集到的需求
             user_requirements = self.user_requirements_text
             
+            # 進度回報：任務開始 / 步驟 / 任務完成 -> message_queue
+            progress = ProgressReporter(
+                TASK_OUTPUT_NAMES,
+                on_agent_start=self.on_agent_start,
+                on_agent_end=self.on_agent_end,
+                on_task_start=self.on_task_start,
+                on_task_end=self.on_task_end,
+                on_stage_event=self.on_stage_event,
+            )
+            
             # 創建並執行 Crew
-            self.message_queue.put(("log", "正在創建 Crew...", "INFO"))
-            crew = create_kano_crew_advanced(user_requirements_text=user_requirements)
+            self.message_queue.put(("log", ("正在創建 Crew...", "INFO")))
+            reset_tracer()
+            new_cancel_token(self.cancel_token)
+            crew = create_kano_crew_advanced(
+                user_requirements_text=user_requirements,
+                step_callback=progress.step_callback,
+                task_callback=progress.task_callback,
+            )
+            
+            # 串流輸出：轉發到即時輸出區域，並逐段寫入 output/<任務>.partial.md
+            stream_bus = get_stream_bus()
+            partial_writer = PartialOutputWriter("output")
+            unsubscribers = [
+                stream_bus.subscribe(partial_writer),
+                progress.attach().detach,
+                stream_bus.subscribe(
+                    lambda event: self.on_stream(event["agent"], event["task"], event["text"]) if event["type"] == CHUNK else None
+                ),
+            ]
             
             # 執行任務
-            self.message_queue.put(("log", "開始執行任務...", "INFO"))
-            result = crew.kickoff()
+            self.message_queue.put(("log", ("開始執行任務...", "INFO")))
+            api_logger = get_api_logger()
+            api_logger.adjust_gauge("active_crews", 1)
+            try:
+                with get_tracer().span("crew.kickoff", cat="run"):
+                    result = crew.kickoff()
+            finally:
+                api_logger.adjust_gauge("active_crews", -1)
+                for unsubscribe in unsubscribers:
+                    unsubscribe()
+                partial_writer.close()
             
             # 保存結果
             os.makedirs("output", exist_ok=True)
@@ -489,48 +584,29 @@ class MainWindow:
             # 保存各任務輸出
             extract_and_save_task_outputs(result, crew=crew, output_dir="output")
             
-            self.message_queue.put(("log", "執行完成！", "INFO"))
+            self.message_queue.put(("log", ("執行完成！", "INFO")))
             logger.info("執行完成")
             
-        except KeyboardInterrupt:
-            # 用戶中斷
-            self.message_queue.put(("log", "執行被用戶中斷", "WARNING"))
-            logger.warning("執行被用戶中斷")
-            self.message_queue.put(("error", "執行被用戶中斷"))
+        except (CancelledError, KeyboardInterrupt) as e:
+            # 用戶停止：保存已完成任務的輸出（未完成的保留在 .partial.md）
+            logger.warning(f"執行已取消：{e}")
+            saved_outputs = save_checkpoint(crew, "output", reason=str(e) or "執行被用戶中斷")
+            self.message_queue.put(("cancelled", list(saved_outputs)))
         except Exception as e:
             error_msg = str(e)
             error_type = self._classify_error(error_msg)
             self.message_queue.put(("error", error_msg, error_type))
             logger.error(f"執行錯誤：{error_msg}", exc_info=True)
         finally:
+            from utils.tracing import save_run_trace
+            save_run_trace("output")
             # 無論成功或失敗，都要恢復按鈕狀態
             self.message_queue.put(("finished", None))
     
     def _classify_error(self, error_msg: str) -> str:
         """分類錯誤類型"""
-        error_lower = error_msg.lower()
-        
-        # 配額用盡錯誤
-        if "429" in error_msg and ("quota exceeded" in error_lower or "resource_exhausted" in error_lower):
-            return "quota_exceeded"
-        
-        # API 過載錯誤
-        if "503" in error_msg or ("429" in error_msg and "rate limit" in error_lower):
-            return "api_overload"
-        
-        # 模型不存在
-        if "404" in error_msg or "not_found" in error_lower:
-            return "model_not_found"
-        
-        # 認證錯誤
-        if "401" in error_msg or "unauthorized" in error_lower or "invalid api key" in error_lower:
-            return "auth_error"
-        
-        # 網絡錯誤
-        if "connection" in error_lower or "timeout" in error_lower or "network" in error_lower:
-            return "network_error"
-        
-        return "unknown"
+        from utils.retry_handler import classify_error
+        return classify_error(error_msg)
     
     def on_agent_start(self, agent_name: str, role_key: str):
         """Agent 開始執行回調"""
@@ -556,12 +632,26 @@ class MainWindow:
         """錯誤回調"""
         self.message_queue.put(("error", error))
     
+    def on_stage_event(self, event: Dict):
+        """階段計時事件回調"""
+        self.message_queue.put(("stage", event))
+    
+    def on_stream(self, agent_name: str, task_name: str, text: str):
+        """串流輸出回調"""
+        self.message_queue.put(("stream", (agent_name, task_name, text)))
+    
     def check_queue(self):
         """檢查消息隊列並更新界面"""
+        # 串流片段在本輪合併後一次寫入，避免逐 Token 刷新界面
+        stream_parts = []
         try:
             while True:
                 msg_type, data = self.message_queue.get_nowait()
                 
+                if msg_type == "stream":
+                    stream_parts.append(data)
+                    continue
+                
                 if msg_type == "agent_start":
                     agent_name, role_key = data
                     self.update_role_status(role_key, "執行中", agent_name)
@@ -589,6 +679,9 @@ class MainWindow:
                     message, level = data
                     self.add_log(message, level)
                 
+                elif msg_type == "stage":
+                    self.update_stage(data)
+                
                 elif msg_type == "error":
                     if isinstance(data, tuple):
                         error_msg, error_type = data
@@ -609,6 +702,10 @@ class MainWindow:
                     elif error_type == "auth_error":
                         self.add_log("💡 解決方案：檢查 API Key 是否正確", "INFO")
                 
+                elif msg_type == "cancelled":
+                    self.was_cancelled = True
+                    self.add_log(f"執行已停止，已保存 {len(data)} 個已完成任務的輸出（檢查點：output/checkpoint.json）", "WARNING")
+                
                 elif msg_type == "finished":
                     self.is_running = False
                     # 無論如何都要恢復按鈕狀態
@@ -616,7 +713,10 @@ class MainWindow:
                     self.stop_button.config(state=tk.DISABLED)
                     
                     # 根據是否有錯誤顯示不同的消息
-                    if self.has_error:
+                    if self.was_cancelled:
+                        self.update_status("已停止")
+                        self.was_cancelled = False
+                    elif self.has_error:
                         self.update_status("執行失敗")
                         # 獲取最後的錯誤消息
                         last_error = None
@@ -640,6 +740,19 @@ class MainWindow:
                         self.update_status("執行完成")
                         self.update_progress(100)
                         messagebox.showinfo("完成", "執行已完成！\n\n結果已保存至 output/ 目錄")
+        except queue.Empty:
+            pass
+        
+        if stream_parts:
+            self.append_stream(stream_parts)
+            now = time.time()
+            for _, task_name, _ in stream_parts:
+                if task_name in self.running_stages:
+                    self.running_stages[task_name]["last_activity"] = now
+        self.refresh_running_stages()
+        
+        # 每100ms檢查一次
+        self.root.after(100, self.check_queue)
     
     def _get_error_solution(self, error_msg: str) -> str:
         """根據錯誤消息返回解決方案"""
@@ -687,17 +800,42 @@ class MainWindow:
             )
         
         return "請查看日誌文件了解詳情，或聯繫技術支援。"
-                
-        except queue.Empty:
-            pass
-        
-        # 每100ms檢查一次
-        self.root.after(100, self.check_queue)
+    
+    def update_stage(self, event: Dict):
+        """根據階段事件更新階段耗時表"""
+        task_name = event["task"]
+        if not self.stages_tree.exists(task_name):
+            self.stages_tree.insert("", "end", task_name, text=task_name,
+                                    values=("等待中", "-", "-", "-", "-", "-", "-"))
+        now = time.time()
+        if event["event"] == "stage_end":
+            self.running_stages.pop(task_name, None)
+            self.stages_tree.item(task_name, values=(
+                "完成", f"{event['elapsed']:.1f}s", "-", event["steps"],
+                event["calls"], event["tokens"], event["retries"],
+            ))
+            self.add_log(
+                f"階段完成：{task_name}（耗時 {event['elapsed']:.1f}s，Tokens {event['tokens']}，重試 {event['retries']}）",
+                "INFO",
+            )
+            return
+        stage = self.running_stages.setdefault(task_name, {"start": now - event["elapsed"], "steps": 0})
+        stage["last_activity"] = now
+        stage["steps"] = event["steps"]
+    
+    def refresh_running_stages(self):
+        """刷新執行中階段的耗時與閒置時間（閒置超過 STALL_WARNING_SECONDS 時標示為可能停滯）"""
+        now = time.time()
+        for task_name, stage in self.running_stages.items():
+            idle = now - stage["last_activity"]
+            status = "⚠️ 可能停滯" if idle >= STALL_WARNING_SECONDS else "執行中"
+            self.stages_tree.item(task_name, values=(
+                status, f"{now - stage['start']:.0f}s", f"{idle:.0f}s", stage["steps"], "-", "-", "-",
+            ))
     
     def update_role_status(self, role_key: str, status: str, agent: str):
         """更新 Role 狀態"""
-        item = self.roles_tree.item(role_key)
-        if item:
+        if role_key and self.roles_tree.exists(role_key):
             self.roles_tree.item(role_key, values=(status, agent, f"{self.task_progress}%"))
     
     def update_status(self, status: str):
@@ -717,6 +855,18 @@ class MainWindow:
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
     
+    def append_stream(self, parts):
+        """追加串流輸出（Agent 或任務切換時插入標題）"""
+        self.stream_text.config(state=tk.NORMAL)
+        for agent_name, task_name, text in parts:
+            key = (agent_name, task_name)
+            if key != self._stream_key:
+                self._stream_key = key
+                self.stream_text.insert(tk.END, f"\n>>> [{agent_name}] {task_name or ''}\n")
+            self.stream_text.insert(tk.END, text)
+        self.stream_text.see(tk.END)
+        self.stream_text.config(state=tk.DISABLED)
+    
     def clear_log(self):
         """清空日誌"""
         self.log_text.config(state=tk.NORMAL)
@@ -728,6 +878,8 @@ class MainWindow:
         if self.is_running:
             if messagebox.askyesno("確認退出", "執行正在進行中，確定要退出嗎？"):
                 self.is_running = False
+                if self.cancel_token:
+                    self.cancel_token.cancel("視窗已關閉")
                 self.root.destroy()
         else:
             self.root.destroy()
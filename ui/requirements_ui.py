@@ -4,7 +4,7 @@
 """
 import tkinter as tk
 from tkinter import ttk, messagebox
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 import os
 import sys
 
@@ -19,9 +19,18 @@ logger = get_logger()
 class RequirementsUI:
     """需求收集界面"""
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, on_category_complete: Optional[Callable[[str, Dict], None]] = None):
+        """
+        Args:
+            parent: 父窗口（可選）
+            on_category_complete: 離開一個類別的標籤頁時調用 on_category_complete(category_key, category_data)
+                （可選，例如在背景預先摘要該類別）
+        """
         self.parent = parent
         self.result = None
+        self.on_category_complete = on_category_complete
+        self.category_keys = list(PRESALES_QUESTION_CATEGORIES.keys())
+        self.current_tab = 0
         
         # 創建窗口
         if parent:
@@ -61,6 +70,7 @@ class RequirementsUI:
         # 為每個類別創建標籤頁
         for category_key, category_data in PRESALES_QUESTION_CATEGORIES.items():
             self.create_category_tab(category_key, category_data)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         
         # 按鈕欄
         button_frame = ttk.Frame(self.window)
@@ -187,29 +197,55 @@ class RequirementsUI:
                 self.answers[category_key][question]["var"].set("")
                 self.answers[category_key][question]["entry"].delete(0, tk.END)
     
+    def collect_category(self, category_key: str) -> Optional[Dict]:
+        """收集單個類別的答案（沒有任何答案時返回 None）"""
+        category_data = PRESALES_QUESTION_CATEGORIES[category_key]
+        category_answers = []
+        
+        for question in category_data["questions"]:
+            if question in self.answers[category_key]:
+                answer_data = self.answers[category_key][question]
+                answer = answer_data["var"].get() or answer_data["entry"].get()
+                
+                if answer:
+                    category_answers.append({
+                        "question": question,
+                        "answer": answer
+                    })
+        
+        if not category_answers:
+            return None
+        return {
+            "category_name": category_data["name"],
+            "answers": category_answers
+        }
+    
+    def notify_category_complete(self, category_key: str, category_data: Optional[Dict]):
+        """通知一個類別已完成（回調失敗不影響問卷）"""
+        if not self.on_category_complete or not category_data:
+            return
+        try:
+            self.on_category_complete(category_key, category_data)
+        except Exception as e:
+            logger.warning(f"類別完成回調失敗：{e}")
+    
+    def on_tab_changed(self, event=None):
+        """切換標籤頁時視為已完成上一個類別"""
+        previous_tab = self.current_tab
+        self.current_tab = self.notebook.index(self.notebook.select())
+        if previous_tab != self.current_tab:
+            category_key = self.category_keys[previous_tab]
+            self.notify_category_complete(category_key, self.collect_category(category_key))
+    
     def confirm(self):
         """確認並收集答案"""
         collected_requirements = {}
         
-        for category_key, category_data in PRESALES_QUESTION_CATEGORIES.items():
-            category_answers = []
-            
-            for question in category_data["questions"]:
-                if question in self.answers[category_key]:
-                    answer_data = self.answers[category_key][question]
-                    answer = answer_data["var"].get() or answer_data["entry"].get()
-                    
-                    if answer:
-                        category_answers.append({
-                            "question": question,
-                            "answer": answer
-                        })
-            
-            if category_answers:
-                collected_requirements[category_key] = {
-                    "category_name": category_data["name"],
-                    "answers": category_answers
-                }
+        for category_key in PRESALES_QUESTION_CATEGORIES:
+            category_data = self.collect_category(category_key)
+            if category_data:
+                collected_requirements[category_key] = category_data
+                self.notify_category_complete(category_key, category_data)
         
         if not collected_requirements:
             messagebox.showwarning("警告", "請至少選擇一個需求項目")
@@ -1,5 +1,6 @@
 from .retry_handler import retry_with_delay, RetryHandler
 from .api_logger import APILogger, get_api_logger, reset_api_logger
+from .latency_histogram import LatencyHistogram
 from .user_interaction import (
     interactive_requirements_collection,
     collect_user_requirements,
@@ -18,6 +19,7 @@ __all__ = [
     'APILogger',
     'get_api_logger',
     'reset_api_logger',
+    'LatencyHistogram',
     'interactive_requirements_collection',
     'collect_user_requirements',
     'format_requirements_for_agent',
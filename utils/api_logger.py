@@ -1,17 +1,47 @@
 """
 API 調用日誌記錄器
 記錄每個 API 調用的詳細信息，包括 Agent、模型、時間、Token 使用等
+並維護可跨程序合併的延遲直方圖（端到端延遲、首 Token 延遲、退避等待）
 """
 import time
 import logging
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional
 from collections import defaultdict
 import json
 import os
 
+from .latency_histogram import LatencyHistogram
+
 logger = logging.getLogger(__name__)
 
+# 延遲指標名稱
+METRIC_CALL_LATENCY = "call_latency"   # 端到端調用延遲
+METRIC_TTFT = "time_to_first_token"    # 首 Token 延遲（串流模式）
+METRIC_BACKOFF_WAIT = "backoff_wait"   # 重試退避等待時間
+METRIC_SCHEDULER_WAIT = "scheduler_wait"  # 在 LLM 排程器中等待調用名額的時間
+
+# 直方圖的分組維度
+LATENCY_DIMENSIONS = ("agent", "model", "provider", "task")
+
+def get_provider_name(model: Optional[str], llm_type: Optional[str] = None) -> str:
+    """根據模型名稱推斷提供者（deepseek / gemini / openai / ollama）"""
+    if not model:
+        return "unknown"
+    model_lower = model.lower()
+    if llm_type == "local" or model_lower.startswith("ollama/"):
+        return "ollama"
+    if model_lower.startswith("deepseek"):
+        return "deepseek"
+    if model_lower.startswith("gemini"):
+        return "gemini"
+    if model_lower.startswith("gpt-") or model_lower.startswith("openai/"):
+        return "openai"
+    if "/" in model_lower:
+        return model_lower.split("/", 1)[0]
+    return "unknown"
+
 class APILogger:
     """API 調用日誌記錄器"""
     
@@ -25,6 +55,16 @@ class APILogger:
         self.log_file = log_file or "output/api_calls.log"
         self.calls: List[Dict] = []
         self.stats = defaultdict(int)
+        # 延遲直方圖：{metric: {dimension: {label: LatencyHistogram}}}
+        self.latency: Dict[str, Dict[str, Dict[str, LatencyHistogram]]] = {}
+        # 監控計數器（供 metrics_exporter 使用）
+        self.request_counts = defaultdict(int)  # (agent, model, provider, status) -> 次數
+        self.token_counts = defaultdict(int)    # (agent, model, provider) -> Token 數
+        self.error_counts = defaultdict(int)    # (provider, error_class) -> 次數
+        self.gauges: Dict[str, float] = defaultdict(float)  # 例如 active_crews、queue_depth
+        # 階段狀態：任務名稱 -> {"status": completed / timed_out / failed, "detail": 說明, "timestamp": 時間}
+        self.stages: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
         
         # 確保輸出目錄存在
         os.makedirs(os.path.dirname(self.log_file) if os.path.dirname(self.log_file) else ".", exist_ok=True)
@@ -38,6 +78,9 @@ class APILogger:
         error: Optional[str] = None,
         tokens_used: Optional[int] = None,
         duration: Optional[float] = None,
+        task: Optional[str] = None,
+        provider: Optional[str] = None,
+        ttft: Optional[float] = None,
     ):
         """
         記錄 API 調用
@@ -50,21 +93,47 @@ class APILogger:
             error: 錯誤訊息（如果有）
             tokens_used: 使用的 Token 數量（如果有）
             duration: 調用持續時間（秒）
+            task: 任務（階段）名稱（如果有）
+            provider: 提供者名稱（未提供時根據模型推斷）
+            ttft: 首 Token 延遲（秒，僅串流模式）
         """
+        provider = provider or get_provider_name(model, llm_type)
         call_info = {
             "timestamp": datetime.now().isoformat(),
             "agent": agent_name,
             "model": model,
             "llm_type": llm_type,
+            "provider": provider,
+            "task": task,
             "status": status,
             "error": error,
             "tokens_used": tokens_used,
             "duration": duration,
+            "ttft": ttft,
         }
         
-        self.calls.append(call_info)
-        self.stats[f"{agent_name}_{status}"] += 1
-        self.stats[f"total_{status}"] += 1
+        with self._lock:
+            self.calls.append(call_info)
+            self.stats[f"{agent_name}_{status}"] += 1
+            self.stats[f"total_{status}"] += 1
+            self.request_counts[(agent_name, model, provider, status)] += 1
+            if tokens_used:
+                self.token_counts[(agent_name, model, provider)] += tokens_used
+            if error and status in ("error", "retry"):
+                from .retry_handler import classify_error
+                self.error_counts[(provider, classify_error(error))] += 1
+        
+        # 只有實際完成（成功或失敗）的調用才計入延遲直方圖
+        if status in ("success", "error") and duration is not None:
+            self.record_latency(
+                METRIC_CALL_LATENCY, duration,
+                agent=agent_name, model=model, provider=provider, task=task,
+            )
+        if ttft is not None:
+            self.record_latency(
+                METRIC_TTFT, ttft,
+                agent=agent_name, model=model, provider=provider, task=task,
+            )
         
         # 記錄到日誌
         if status == "success":
@@ -87,6 +156,154 @@ class APILogger:
         # 保存到檔案
         self._save_to_file(call_info)
     
+    def record_latency(
+        self,
+        metric: str,
+        seconds: float,
+        agent: Optional[str] = None,
+        model: Optional[str] = None,
+        provider: Optional[str] = None,
+        task: Optional[str] = None,
+    ):
+        """
+        記錄延遲值到直方圖（同時計入總計與各個維度）
+        
+        Args:
+            metric: 指標名稱（call_latency / time_to_first_token / backoff_wait）
+            seconds: 延遲時間（秒）
+            agent / model / provider / task: 分組維度（未提供的維度不記錄）
+        """
+        labels = {"agent": agent, "model": model, "provider": provider, "task": task}
+        with self._lock:
+            by_dimension = self.latency.setdefault(metric, {})
+            by_dimension.setdefault("all", {}).setdefault("all", LatencyHistogram()).record(seconds)
+            for dimension in LATENCY_DIMENSIONS:
+                label = labels[dimension]
+                if label:
+                    by_dimension.setdefault(dimension, {}).setdefault(label, LatencyHistogram()).record(seconds)
+    
+    def record_backoff(
+        self,
+        seconds: float,
+        agent: Optional[str] = None,
+        model: Optional[str] = None,
+        task: Optional[str] = None,
+    ):
+        """記錄重試退避等待時間"""
+        self.record_latency(
+            METRIC_BACKOFF_WAIT, seconds,
+            agent=agent, model=model,
+            provider=get_provider_name(model) if model else None,
+            task=task,
+        )
+    
+    def set_gauge(self, name: str, value: float):
+        """設置即時指標（例如 queue_depth）"""
+        with self._lock:
+            self.gauges[name] = value
+    
+    def adjust_gauge(self, name: str, delta: float):
+        """增減即時指標（例如 active_crews +1 / -1）"""
+        with self._lock:
+            self.gauges[name] += delta
+    
+    def get_counters(self) -> Dict:
+        """獲取監控計數器的快照"""
+        with self._lock:
+            return {
+                "requests": dict(self.request_counts),
+                "tokens": dict(self.token_counts),
+                "errors": dict(self.error_counts),
+                "gauges": dict(self.gauges),
+            }
+
+    def set_stage_status(self, task: str, status: str, detail: Optional[str] = None):
+        """記錄階段（任務）的最終狀態，例如 timed_out（寫入報告與統計摘要）"""
+        with self._lock:
+            self.stages[task] = {
+                "status": status,
+                "detail": detail,
+                "timestamp": datetime.now().isoformat(),
+            }
+        if status != "completed":
+            logger.warning(f"⏱️ 階段 {task} 狀態: {status}" + (f"（{detail}）" if detail else ""))
+    
+    def get_task_usage(self, task: str) -> Dict[str, int]:
+        """
+        獲取單個任務（階段）的調用統計
+
+        Returns:
+            {"calls": 完成的調用數, "tokens": Token 數, "errors": 失敗次數, "retries": 重試次數}
+        """
+        usage = {"calls": 0, "tokens": 0, "errors": 0, "retries": 0}
+        with self._lock:
+            for call in self.calls:
+                if call.get("task") != task:
+                    continue
+                status = call.get("status")
+                if status in ("success", "error"):
+                    usage["calls"] += 1
+                usage["tokens"] += call.get("tokens_used") or 0
+                if status == "error":
+                    usage["errors"] += 1
+                elif status == "retry":
+                    usage["retries"] += 1
+        return usage
+
+    def get_latency_histograms(self) -> Dict[str, Dict[str, Dict[str, LatencyHistogram]]]:
+        """獲取直方圖的副本（避免在讀取時被其他線程修改）"""
+        with self._lock:
+            snapshot = {}
+            for metric, by_dimension in self.latency.items():
+                for dimension, by_label in by_dimension.items():
+                    for label, hist in by_label.items():
+                        copy = LatencyHistogram()
+                        copy.merge(hist)
+                        snapshot.setdefault(metric, {}).setdefault(dimension, {})[label] = copy
+            return snapshot
+    
+    def get_latency_summary(self) -> Dict:
+        """獲取延遲摘要：{metric: {dimension: {label: {count, p50, p95, p99, ...}}}}"""
+        with self._lock:
+            return {
+                metric: {
+                    dimension: {label: hist.summary() for label, hist in by_label.items()}
+                    for dimension, by_label in by_dimension.items()
+                }
+                for metric, by_dimension in self.latency.items()
+            }
+    
+    def export_latency(self) -> Dict:
+        """導出可合併的直方圖資料"""
+        with self._lock:
+            return {
+                metric: {
+                    dimension: {label: hist.to_dict() for label, hist in by_label.items()}
+                    for dimension, by_label in by_dimension.items()
+                }
+                for metric, by_dimension in self.latency.items()
+            }
+    
+    def merge_latency(self, exported: Dict):
+        """
+        合併其他程序導出的直方圖資料
+        
+        Args:
+            exported: export_latency() 的結果，或 export_to_json() 檔案中的 "latency_histograms"
+        """
+        with self._lock:
+            for metric, by_dimension in exported.items():
+                for dimension, by_label in by_dimension.items():
+                    for label, data in by_label.items():
+                        target = self.latency.setdefault(metric, {}).setdefault(dimension, {})
+                        target.setdefault(label, LatencyHistogram()).merge(LatencyHistogram.from_dict(data))
+    
+    def merge_export_file(self, json_file: str):
+        """合併其他程序以 export_to_json() 導出的檔案中的直方圖"""
+        with open(json_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.merge_latency(data.get("latency_histograms", {}))
+    
     def _save_to_file(self, call_info: Dict):
         """保存調用記錄到檔案"""
         try:
@@ -104,10 +321,11 @@ class APILogger:
             "retry_calls": self.stats["total_retry"],
             "by_agent": {},
             "by_model": defaultdict(int),
+            "latency": self.get_latency_summary(),
         }
         
         # 按 Agent 統計
-        for call in self.calls:
+        for call in list(self.calls):
             agent = call["agent"]
             if agent not in stats["by_agent"]:
                 stats["by_agent"][agent] = {
@@ -117,7 +335,7 @@ class APILogger:
                     "retry": 0,
                 }
             stats["by_agent"][agent]["total"] += 1
-            stats["by_agent"][agent][call["status"]] += 1
+            stats["by_agent"][agent][call["status"]] = stats["by_agent"][agent].get(call["status"], 0) + 1
             
             # 按模型統計
             stats["by_model"][call["model"]] += 1
@@ -148,9 +366,41 @@ class APILogger:
         for model, count in stats["by_model"].items():
             print(f"  {model}: {count} 次")
         
+        self._print_latency_summary(stats["latency"])
+        
+        abnormal_stages = {task: info for task, info in self.stages.items() if info["status"] != "completed"}
+        if abnormal_stages:
+            print("\n未正常完成的階段:")
+            for task, info in abnormal_stages.items():
+                print(f"  {task}: {info['status']}" + (f"（{info['detail']}）" if info.get("detail") else ""))
+        
         print(f"\n詳細日誌已保存至: {self.log_file}")
         print("="*70 + "\n")
     
+    def _print_latency_summary(self, latency: Dict):
+        """打印延遲百分位數"""
+        if not latency:
+            return
+        
+        def fmt(value):
+            return f"{value:.2f}s" if value is not None else "-"
+        
+        titles = {
+            METRIC_CALL_LATENCY: "調用延遲",
+            METRIC_TTFT: "首 Token 延遲",
+            METRIC_BACKOFF_WAIT: "退避等待",
+        }
+        for metric, by_dimension in latency.items():
+            print(f"\n{titles.get(metric, metric)}（p50 / p95 / p99 / max）:")
+            for dimension in ("all",) + LATENCY_DIMENSIONS:
+                for label, summary in by_dimension.get(dimension, {}).items():
+                    name = "總計" if dimension == "all" else f"{dimension}={label}"
+                    print(
+                        f"  {name:<40} n={summary['count']:<5} "
+                        f"{fmt(summary['p50'])} / {fmt(summary['p95'])} / "
+                        f"{fmt(summary['p99'])} / {fmt(summary['max'])}"
+                    )
+    
     def export_to_json(self, output_file: Optional[str] = None) -> str:
         """導出所有調用記錄為 JSON"""
         output_file = output_file or "output/api_calls.json"
@@ -160,6 +410,8 @@ class APILogger:
             json.dump({
                 "calls": self.calls,
                 "stats": self.get_stats(),
+                "latency_histograms": self.export_latency(),
+                "stages": self.stages,
             }, f, ensure_ascii=False, indent=2)
         
         return output_file
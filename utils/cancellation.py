@@ -0,0 +1,212 @@
+"""
+協作式取消
+每次執行建立一個 CancellationToken，GUI 的停止按鈕或 CLI 的 Ctrl+C 調用 cancel() 後：
+- 進行中的 LLM 調用在 1 秒內返回 CancelledError（實際請求在背景線程中由關閉的連線終止）
+- 重試退避的等待立即結束
+- Crew 的 step / task 回調在下一步之前中止執行
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from .llm_hooks import install_call_hook
+
+logger = logging.getLogger(__name__)
+
+# 等待 LLM 調用時檢查取消狀態的間隔（秒）
+POLL_INTERVAL = 0.2
+
+# 當前上下文中對進行中調用的額外檢查（例如逾時監控），等待時與取消狀態一起輪詢
+_call_checks: contextvars.ContextVar = contextvars.ContextVar("kano_call_checks", default=())
+
+@contextmanager
+def supervise_calls(check: Callable[[], None]):
+    """
+    在此範圍內的可中斷調用等待期間定期執行 check()（check 拋出的異常會中止等待並向上傳遞）
+    """
+    reset_token = _call_checks.set(_call_checks.get() + (check,))
+    try:
+        yield
+    finally:
+        _call_checks.reset(reset_token)
+
+# 當前調用的進展記錄：{"last": 最近一次進展的時間, "aborts": [中止進行中請求的函數]}
+# （可中斷調用的背景線程複製 context 後更新同一個 dict）
+_call_progress: contextvars.ContextVar = contextvars.ContextVar("kano_call_progress", default=None)
+
+@contextmanager
+def track_call_progress():
+    """在此範圍內記錄單次調用的進展（串流片段），返回進展記錄"""
+    progress = {"last": time.time(), "aborts": []}
+    reset_token = _call_progress.set(progress)
+    try:
+        yield progress
+    finally:
+        _call_progress.reset(reset_token)
+
+def mark_call_progress(abort: Optional[Callable[[], None]] = None):
+    """記錄當前調用有進展；abort 為中止該請求的函數（例如關閉串流回應）"""
+    progress = _call_progress.get()
+    if progress is None:
+        return
+    progress["last"] = time.time()
+    if abort is not None:
+        progress["aborts"].append(abort)
+
+def abort_call(progress: Dict):
+    """中止進展記錄中登記的進行中請求（只關閉該請求，不關閉 LLM 實例的 client）"""
+    aborts, progress["aborts"] = progress["aborts"], []
+    for abort in aborts:
+        try:
+            abort()
+        except Exception as e:
+            logger.debug(f"中止 LLM 請求失敗: {e}")
+
+class CancelledError(Exception):
+    """執行已被取消"""
+
+    def __init__(self, reason: str = "執行已取消"):
+        super().__init__(reason)
+        self.reason = reason
+
+class CancellationToken:
+    """執行取消標記（線程安全）"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+        # 取消時調用的清理函數（例如關閉 HTTP client），按 key 去重
+        self._closers: Dict[object, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "執行已取消"):
+        """請求取消（重複調用無效）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            closers = list(self._closers.values())
+            self._closers.clear()
+        logger.warning(f"已請求取消執行：{reason}")
+        for closer in closers:
+            try:
+                closer()
+            except Exception as e:
+                logger.debug(f"取消時釋放資源失敗: {e}")
+
+    def raise_if_cancelled(self):
+        """已取消時拋出 CancelledError"""
+        if self._event.is_set():
+            raise CancelledError(self.reason or "執行已取消")
+
+    def wait(self, timeout: float) -> bool:
+        """
+        可被取消中斷的等待（代替 time.sleep）
+
+        Returns:
+            是否已被取消
+        """
+        return self._event.wait(timeout)
+
+    def sleep(self, seconds: float):
+        """等待指定秒數，期間被取消則拋出 CancelledError"""
+        if self.wait(seconds):
+            self.raise_if_cancelled()
+
+    def register_closer(self, closer: Callable[[], None], key: object = None):
+        """註冊取消時要調用的清理函數（已取消時立即調用）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._closers[key if key is not None else closer] = closer
+                return
+        closer()
+
+    def run_interruptible(self, func: Callable, *args, **kwargs):
+        """
+        在背景線程中執行阻塞調用，當前線程每 POLL_INTERVAL 秒檢查一次取消狀態
+
+        取消後立即拋出 CancelledError，背景線程中的調用由已關閉的連線中止或自行結束；
+        supervise_calls() 註冊的檢查也在等待期間執行
+        """
+        self.raise_if_cancelled()
+        result = {}
+        done = threading.Event()
+        context = contextvars.copy_context()
+
+        def target():
+            try:
+                result["value"] = context.run(func, *args, **kwargs)
+            except BaseException as e:
+                result["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=target, name="llm-call", daemon=True).start()
+        checks = _call_checks.get()
+        while not done.wait(POLL_INTERVAL):
+            self.raise_if_cancelled()
+            for check in checks:
+                check()
+        # 取消時關閉連線導致的錯誤也視為取消
+        if "error" in result and self.is_cancelled:
+            raise CancelledError(self.reason or "執行已取消") from result["error"]
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+# 全局實例（當前執行的取消標記）
+_current_token: Optional[CancellationToken] = None
+
+def get_cancel_token() -> CancellationToken:
+    """獲取當前執行的取消標記"""
+    global _current_token
+    if _current_token is None:
+        _current_token = CancellationToken()
+    return _current_token
+
+def new_cancel_token(token: Optional[CancellationToken] = None) -> CancellationToken:
+    """
+    設定新的一次執行的取消標記（每次執行開始時調用）
+
+    Args:
+        token: 調用方預先建立的標記（例如 GUI 在啟動線程前建立，以便停止按鈕使用）
+    """
+    global _current_token
+    _current_token = token or CancellationToken()
+    return _current_token
+
+def close_llm_clients(llm):
+    """關閉 LLM 實例持有的同步 HTTP client，使進行中的請求與串流立即中止"""
+    for attr in ("client", "_client", "http_client"):
+        client = getattr(llm, attr, None)
+        close = getattr(client, "close", None)
+        if callable(close):
+            try:
+                result = close()
+                # 非同步 client 的 close() 返回 coroutine，這裡不處理
+                if hasattr(result, "close") and hasattr(result, "send"):
+                    result.close()
+            except Exception as e:
+                logger.debug(f"關閉 LLM client 失敗: {e}")
+
+def _cancellation_hook(llm, call_next, *args, **kwargs):
+    token = get_cancel_token()
+    token.raise_if_cancelled()
+    token.register_closer(lambda: close_llm_clients(llm), key=id(llm))
+    return token.run_interruptible(call_next, *args, **kwargs)
+
+def install_cancellation(llm) -> bool:
+    """讓 LLM 實例的調用可被當前執行的取消標記中斷"""
+    return install_call_hook(llm, _cancellation_hook, "cancellation")
+
+def cancellation_step_callback(*_args, **_kwargs):
+    """Crew 的 step_callback / task_callback：已取消時在下一步之前中止"""
+    get_cancel_token().raise_if_cancelled()
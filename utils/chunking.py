@@ -0,0 +1,95 @@
+"""
+程式碼輸出的分塊
+開發任務的輸出是夾雜說明文字與程式碼區塊的 Markdown，這裡按檔案 / 模組（標題章節）切分，
+再打包為不超過 Token 上限的分塊，供並行的 map 階段（例如分塊 Code Review）使用
+"""
+import re
+from typing import List, Optional, Tuple
+
+from .context_budget import estimate_tokens, split_sections
+
+# 程式碼區塊外的檔案路徑（例如 `src/app.py`、backend/models/user.ts）
+_FILE_PATTERN = re.compile(r"`?([\w.\-]+(?:/[\w.\-]+)*\.[A-Za-z0-9]{1,8})`?")
+_FENCE_PATTERN = re.compile(r"^\s*(```|~~~)", re.MULTILINE)
+
+def _unit_title(heading: str, body: str) -> str:
+    """分塊標題：標題行文字，沒有標題時使用第一個檔案路徑"""
+    title = heading.lstrip("#").strip().strip("`*")
+    if title:
+        return title
+    match = _FILE_PATTERN.search(body[:500])
+    return match.group(1) if match else "（未命名片段）"
+
+def _split_lines(text: str, max_tokens: int, model: Optional[str]) -> List[str]:
+    """按行切分過長的文字"""
+    pieces, current = [], []
+    current_tokens = 0
+    for line in text.splitlines(keepends=True):
+        line_tokens = estimate_tokens(line, model)
+        if current and current_tokens + line_tokens > max_tokens:
+            pieces.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+def _split_fences(text: str) -> List[str]:
+    """在程式碼區塊結束處切分（每段包含一個完整的程式碼區塊及其前面的說明）"""
+    pieces, start, in_fence = [], 0, False
+    for match in _FENCE_PATTERN.finditer(text):
+        in_fence = not in_fence
+        if not in_fence:
+            end = text.find("\n", match.end())
+            end = len(text) if end == -1 else end + 1
+            pieces.append(text[start:end])
+            start = end
+    if start < len(text) and text[start:].strip():
+        pieces.append(text[start:])
+    return pieces or [text]
+
+def split_code_units(text: str, max_tokens: int, model: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    將開發輸出切分為檔案 / 模組單元
+
+    按 Markdown 標題切分；超過 max_tokens 的單元再按程式碼區塊、最後按行切分
+
+    Returns:
+        [(單元標題, 單元內容)]
+    """
+    units = []
+    for heading, body in split_sections(text):
+        content = (heading + "\n" + body) if heading else body
+        if not content.strip():
+            continue
+        if estimate_tokens(content, model) <= max_tokens:
+            units.append((_unit_title(heading, body), content))
+            continue
+        part = 0
+        for block in _split_fences(content):
+            for piece in _split_lines(block, max_tokens, model) if estimate_tokens(block, model) > max_tokens else [block]:
+                part += 1
+                units.append((f"{_unit_title(heading, piece)}（第 {part} 段）", piece))
+    return units
+
+def pack_units(units: List[Tuple[str, str]], max_tokens: int, model: Optional[str] = None) -> List[Tuple[List[str], str]]:
+    """
+    將相鄰的單元打包為不超過 max_tokens 的分塊
+
+    Returns:
+        [(單元標題列表, 分塊內容)]
+    """
+    chunks = []
+    titles, parts, tokens = [], [], 0
+    for title, content in units:
+        unit_tokens = estimate_tokens(content, model)
+        if parts and tokens + unit_tokens > max_tokens:
+            chunks.append((titles, "\n".join(parts)))
+            titles, parts, tokens = [], [], 0
+        titles.append(title)
+        parts.append(content)
+        tokens += unit_tokens
+    if parts:
+        chunks.append((titles, "\n".join(parts)))
+    return chunks
@@ -0,0 +1,256 @@
+"""
+階段間上下文預算管理
+下游任務經由 context=[...] 取得上游任務的完整輸出（PRD、設計、架構、程式碼…），文件越長，
+每個階段的輸入 Token 成本與延遲越高。這裡按 Agent 配置的預算（Token）壓縮上游文件：
+- 使用本地 tokenizer（tiktoken，未安裝時使用字元估算）估算 Token 數
+- 超出預算的文件優先交給廉價模型摘要（若已配置），否則按 Markdown 章節裁剪（短章節保留原文），保留所有標題
+"""
+import hashlib
+import logging
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancelledError
+from .llm_invoke import invoke_llm
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# 上游文件之間的分隔（與 CrewAI 匯總 context 時使用的分隔一致）
+CONTEXT_DIVIDER = "\n\n----------\n\n"
+
+# 裁剪後附加的省略標記
+TRIM_MARKER = "…（已省略 {count} 字）"
+
+# 中日韓文字（每個字約 1 個 Token）
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+\S", re.MULTILINE)
+
+_SUMMARY_PROMPT = (
+    "請將以下文件壓縮為不超過約 {budget} 個 Token 的摘要。\n"
+    "要求：保留原有的 Markdown 章節標題結構；保留所有需求編號、功能名稱、數據、API、檔案名稱與技術決策；"
+    "刪除重複說明與範例；不要添加原文沒有的內容。\n\n"
+    "文件名稱：{name}\n\n{text}"
+)
+
+_encodings: Dict[str, object] = {}
+
+def _encoding_for(model: Optional[str]):
+    """按模型選擇 tiktoken 編碼（非 OpenAI 模型使用 cl100k_base 近似；首次使用時才導入 tiktoken）"""
+    model_name = (model or "").split("/")[-1]
+    name = "o200k_base" if model_name.startswith(("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")) else "cl100k_base"
+    if name not in _encodings:
+        try:
+            import tiktoken
+            _encodings[name] = tiktoken.get_encoding(name)
+        except ImportError:
+            _encodings[name] = None
+        except Exception as e:
+            logger.debug(f"無法載入 tiktoken 編碼 {name}: {e}")
+            _encodings[name] = None
+    return _encodings[name]
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    估算文字的 Token 數
+
+    Args:
+        text: 文字
+        model: 模型名稱（例如 "deepseek/deepseek-chat"，用於選擇 tokenizer）
+    """
+    if not text:
+        return 0
+    encoding = _encoding_for(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 無 tokenizer：中日韓文字每字約 1 Token，其他字元約 4 字元 1 Token
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _heading_offsets(text: str) -> List[int]:
+    """Markdown 標題行的起始位置（忽略程式碼區塊內以 # 開頭的註解）"""
+    offsets = []
+    in_fence = False
+    position = 0
+    for line in text.splitlines(keepends=True):
+        if line.lstrip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+        elif not in_fence and _HEADING_PATTERN.match(line):
+            offsets.append(position)
+        position += len(line)
+    return offsets
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """
+    按 Markdown 標題切分文件
+
+    Returns:
+        [(標題行, 內容)]，第一個章節的標題行可能為空字串（標題之前的內容）
+    """
+    sections = []
+    starts = _heading_offsets(text)
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(text)
+        block = text[start:end]
+        if _HEADING_PATTERN.match(block):
+            heading, _, body = block.partition("\n")
+        else:
+            heading, body = "", block
+        sections.append((heading, body))
+    return sections
+
+def _truncate(body: str, budget: int, model: Optional[str]) -> str:
+    """將一段內容截斷到預算內（盡量在段落 / 行邊界截斷）"""
+    if estimate_tokens(body, model) <= budget:
+        return body
+    if budget <= 0:
+        kept = ""
+    else:
+        # 按比例估算保留長度，再退到最近的段落或行邊界
+        kept = body[:max(1, len(body) * budget // max(1, estimate_tokens(body, model)))]
+        while kept and estimate_tokens(kept, model) > budget:
+            kept = kept[:int(len(kept) * 0.9)]
+        for boundary in ("\n\n", "\n"):
+            cut = kept.rfind(boundary)
+            if cut > len(kept) // 2:
+                kept = kept[:cut]
+                break
+    omitted = len(body) - len(kept)
+    return kept.rstrip() + "\n" + TRIM_MARKER.format(count=omitted) + "\n\n"
+
+def allocate_budget(sizes: List[int], budget: int) -> List[int]:
+    """分配預算：小於平均份額的項目保留原樣，剩餘預算由較大的項目平分"""
+    allocation = [0] * len(sizes)
+    remaining = budget
+    pending = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    while pending:
+        share = remaining // len(pending)
+        index = pending[0]
+        if sizes[index] > share:
+            for i in pending:
+                allocation[i] = share
+            break
+        allocation[index] = sizes[index]
+        remaining -= sizes[index]
+        pending.pop(0)
+    return allocation
+
+def trim_sections(text: str, budget: int, model: Optional[str] = None) -> str:
+    """
+    按章節裁剪文件到預算內：保留所有標題，短章節保留原文，其餘預算由較長的章節平分
+
+    Args:
+        text: Markdown 文件
+        budget: Token 預算
+        model: 模型名稱（用於估算 Token）
+    """
+    total = estimate_tokens(text, model)
+    if total <= budget:
+        return text
+    sections = split_sections(text)
+    heading_tokens = sum(estimate_tokens(heading, model) + 1 for heading, _ in sections)
+    marker_tokens = estimate_tokens(TRIM_MARKER.format(count=100000), model) + 2
+    body_tokens = [estimate_tokens(body, model) for _, body in sections]
+    # 預留省略標記的空間（最多每個章節一個）
+    body_budget = max(0, budget - heading_tokens - marker_tokens * sum(1 for tokens in body_tokens if tokens))
+    parts = []
+    for (heading, body), share in zip(sections, allocate_budget(body_tokens, body_budget)):
+        if heading:
+            parts.append(heading + "\n")
+        parts.append(_truncate(body, share, model))
+    return "".join(parts)
+
+class ContextBudgetManager:
+    """按 Agent 的 Token 預算壓縮上游任務輸出"""
+
+    def __init__(self):
+        # Agent 配置鍵 -> {"budget": Token 預算（0 表示不限制）, "model": 模型名稱}
+        self.budgets: Dict[str, Dict] = {}
+        # 建立摘要用廉價模型的函數（可選）
+        self.summarizer_factory: Optional[Callable[[], object]] = None
+        self._summarizer = None
+        # (文件雜湊, 預算, 模型) -> 壓縮結果（審查與測試任務共用開發輸出，只壓縮一次）
+        self._cache: Dict[Tuple[str, int, str], str] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, agent_key: str, budget: int, model: Optional[str] = None):
+        """設定 Agent 的上下文 Token 預算"""
+        self.budgets[agent_key] = {"budget": int(budget or 0), "model": model}
+
+    def set_summarizer(self, factory: Optional[Callable[[], object]]):
+        """設定建立摘要模型的函數（None 表示只使用章節裁剪）"""
+        self.summarizer_factory = factory
+        self._summarizer = None
+
+    def _summarize(self, name: str, text: str, budget: int, model: Optional[str]) -> Optional[str]:
+        if self.summarizer_factory is None:
+            return None
+        try:
+            if self._summarizer is None:
+                self._summarizer = self.summarizer_factory()
+            summary = invoke_llm(self._summarizer, _SUMMARY_PROMPT.format(budget=budget, name=name, text=text))
+        except CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"上下文摘要失敗，改用章節裁剪: {e}")
+            return None
+        if not summary or estimate_tokens(summary, model) > budget:
+            # 摘要仍超出預算時以裁剪收尾
+            return trim_sections(summary, budget, model) if summary else None
+        return summary
+
+    def compact_document(self, name: str, text: str, budget: int, model: Optional[str] = None) -> str:
+        """將單個文件壓縮到預算內（摘要優先，失敗或未配置時裁剪）"""
+        key = (hashlib.sha1(text.encode("utf-8")).hexdigest(), budget, model or "")
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        with get_tracer().span("壓縮上下文", cat="context", document=name, budget=budget):
+            result = self._summarize(name, text, budget, model) or trim_sections(text, budget, model)
+        with self._lock:
+            self._cache[key] = result
+        return result
+
+    def build_context(self, agent_key: Optional[str], documents: List[Tuple[str, str]]) -> str:
+        """
+        組合上游文件為下游任務的上下文，總量超出 Agent 預算時壓縮
+
+        Args:
+            agent_key: 下游任務的 Agent 配置鍵
+            documents: [(任務名稱, 輸出文字)]
+        """
+        config = self.budgets.get(agent_key) or {}
+        budget, model = config.get("budget", 0), config.get("model")
+        texts = [text for _, text in documents]
+        if not budget:
+            return CONTEXT_DIVIDER.join(texts)
+        sizes = [estimate_tokens(text, model) for text in texts]
+        total = sum(sizes)
+        if total <= budget:
+            return CONTEXT_DIVIDER.join(texts)
+
+        allocation = allocate_budget(sizes, budget)
+        compacted = []
+        for (name, text), size, share in zip(documents, sizes, allocation):
+            compacted.append(text if size <= share else self.compact_document(name, text, share, model))
+        result = CONTEXT_DIVIDER.join(compacted)
+        logger.info(f"📉 {agent_key} 上下文已壓縮: 約 {total} -> {estimate_tokens(result, model)} Token（預算 {budget}）")
+        return result
+
+# 全局實例
+_context_budget: Optional[ContextBudgetManager] = None
+
+def get_context_budget() -> ContextBudgetManager:
+    """獲取全局上下文預算管理器"""
+    global _context_budget
+    if _context_budget is None:
+        _context_budget = ContextBudgetManager()
+    return _context_budget
+
+def reset_context_budget():
+    """重置全局上下文預算管理器（清除配置與快取）"""
+    global _context_budget
+    _context_budget = None
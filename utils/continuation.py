@@ -0,0 +1,245 @@
+"""
+截斷輸出的自動續寫
+長輸出（「不少於 2500 字」、完整程式碼）經常觸及模型的最大輸出 Token 數而被截斷，
+這裡從 finish reason 判斷截斷，並以「從中斷處繼續」的請求把後續內容接到已生成的部分之後；
+串流中途遇到暫時性錯誤（例如 503）時，同樣保留已生成的內容，按 Role 的重試退避等待後續寫，而不是整個任務重來；
+續寫請求沒有產生新的內容時不再續寫
+"""
+import contextvars
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from .cancellation import POLL_INTERVAL, CancelledError, get_cancel_token, mark_call_progress
+from .llm_hooks import install_call_hook
+from .retry_handler import _record_backoff, calculate_retry_delay, classify_error, is_overload_error
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：單次調用最多續寫的次數（0 表示停用）
+MAX_CONTINUATIONS_ENV = "KANO_MAX_CONTINUATIONS"
+DEFAULT_MAX_CONTINUATIONS = 3
+
+# 已生成的內容少於此字元數時，暫時性錯誤不續寫（交給原有的重試機制）
+MIN_PARTIAL_CHARS = 200
+
+# 表示因長度限制而截斷的 finish reason（OpenAI 相容 API / Gemini / Ollama）
+TRUNCATED_REASONS = {"length", "max_tokens", "MAX_TOKENS"}
+
+CONTINUE_PROMPT = (
+    "你的上一個回覆因長度限制被截斷。請從中斷處直接繼續輸出，"
+    "不要重複已輸出的內容，不要重新開始，也不要加入任何說明。"
+)
+
+# 當前調用的記錄：{"finish_reason": ..., "partial": [串流片段]}
+# （由 hook 在調用前設定為新的 dict，可中斷調用的背景線程複製 context 後寫入同一個 dict）
+_call_record: contextvars.ContextVar = contextvars.ContextVar("kano_call_record", default=None)
+
+def _record(**values):
+    record = _call_record.get()
+    if record is not None:
+        record.update(values)
+
+def _max_continuations() -> int:
+    try:
+        return max(0, int(os.getenv(MAX_CONTINUATIONS_ENV, DEFAULT_MAX_CONTINUATIONS)))
+    except ValueError:
+        return DEFAULT_MAX_CONTINUATIONS
+
+class _StreamRecorder:
+    """包裝串流回應：記錄已收到的內容與最後的 finish reason"""
+
+    def __init__(self, stream, record: Dict):
+        self._stream = stream
+        self._record = record
+
+    def __iter__(self):
+        for chunk in self._stream:
+            mark_call_progress()
+            for choice in getattr(chunk, "choices", None) or []:
+                delta = getattr(getattr(choice, "delta", None), "content", None)
+                if delta:
+                    self._record.setdefault("partial", []).append(delta)
+                if getattr(choice, "finish_reason", None):
+                    self._record["finish_reason"] = choice.finish_reason
+            yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        close = getattr(self._stream, "close", None)
+        if callable(close):
+            close()
+
+def _wrap_openai_client(llm) -> bool:
+    """包裝 OpenAI 相容 client 的 chat.completions.create，記錄 finish reason 與串流內容"""
+    completions = getattr(getattr(getattr(llm, "client", None), "chat", None), "completions", None)
+    create = getattr(completions, "create", None)
+    if not callable(create) or getattr(create, "_kano_recorded", False):
+        return False
+
+    def recorded_create(*args, **kwargs):
+        response = create(*args, **kwargs)
+        record = _call_record.get()
+        if kwargs.get("stream"):
+            # 收到回應標頭即為進展；停滯時由逾時監控關閉此串流
+            mark_call_progress(abort=getattr(response, "close", None))
+            return _StreamRecorder(response, record if record is not None else {})
+        if record is None:
+            return response
+        choices = getattr(response, "choices", None) or []
+        if choices:
+            record["finish_reason"] = getattr(choices[0], "finish_reason", None)
+        return response
+
+    recorded_create._kano_recorded = True
+    try:
+        completions.create = recorded_create
+    except (AttributeError, TypeError):
+        return False
+    return True
+
+def is_stream_recorded(llm) -> bool:
+    """LLM 實例是否以串流方式調用，且串流片段經由包裝的 client 記錄（可逐片段回報進展）"""
+    if not (getattr(llm, "stream", False) or getattr(llm, "streaming", False)):
+        return False
+    completions = getattr(getattr(getattr(llm, "client", None), "chat", None), "completions", None)
+    return bool(getattr(getattr(completions, "create", None), "_kano_recorded", False))
+
+def _result_text(result: Any) -> Optional[str]:
+    if isinstance(result, str):
+        return result
+    content = getattr(result, "content", None)
+    return content if isinstance(content, str) else None
+
+def _result_finish_reason(result: Any) -> Optional[str]:
+    """LangChain 訊息的 finish reason（response_metadata）"""
+    metadata = getattr(result, "response_metadata", None) or {}
+    return metadata.get("finish_reason") or metadata.get("done_reason")
+
+def _with_text(result: Any, text: str) -> Any:
+    """以合併後的文字替換調用結果的內容（保持原返回類型）"""
+    if isinstance(result, str) or result is None:
+        return text
+    try:
+        result.content = text
+        return result
+    except Exception:
+        return text
+
+def join_continuation(previous: str, continuation: str) -> str:
+    """接上續寫內容，去除續寫開頭與已輸出結尾重複的部分"""
+    for size in range(min(len(previous), len(continuation), 300), 19, -1):
+        if previous.endswith(continuation[:size]):
+            return previous + continuation[size:]
+    return previous + continuation
+
+def _continuation_messages(messages: Any, partial: str) -> List[Dict]:
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    return list(messages) + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+
+def _is_transient(error: Exception) -> bool:
+    # 階段逾時與停滯由逾時監控處理（停滯重試 / 降級），不續寫；watchdog 依賴本模組，在此延遲導入
+    from .watchdog import StageTimeoutError, StallTimeoutError
+    if isinstance(error, (StageTimeoutError, StallTimeoutError)):
+        return False
+    message = str(error)
+    return is_overload_error(message) or classify_error(message) == "network_error"
+
+def _backoff(attempt: int, retry: Dict, agent_key: Optional[str]):
+    """暫時性錯誤後按 Role 的重試退避等待再續寫（可被取消；等待期間不算停滯）"""
+    seconds = calculate_retry_delay(
+        attempt, retry.get("retry_delay", 2.0), retry.get("retry_backoff", 1.5), retry.get("max_retry_delay", 60.0)
+    )
+    seconds = max(0.1, seconds + seconds * 0.2 * (random.random() * 2 - 1))
+    token = get_cancel_token()
+    with get_tracer().span("重試退避", cat="retry", agent=agent_key, delay=f"{seconds:.1f}s"):
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            mark_call_progress()
+            token.sleep(min(POLL_INTERVAL, max(deadline - time.time(), 0)))
+    _record_backoff(seconds, agent_key)
+
+def _continuation_hook(agent_key: Optional[str], retry: Dict):
+    def continuation_hook(llm, call_next, *args, **kwargs):
+        limit = _max_continuations()
+        if limit == 0:
+            return call_next(*args, **kwargs)
+        messages = args[0] if args else kwargs.get("messages")
+        rest_args = args[1:]
+        call_kwargs = {key: value for key, value in kwargs.items() if key != "messages"}
+
+        text, result, continuations, transient_errors = "", None, 0, 0
+        current_messages = messages
+        while True:
+            record = {}
+            reset_token = _call_record.set(record)
+            try:
+                result = call_next(current_messages, *rest_args, **call_kwargs)
+                error = None
+            except CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            finally:
+                _call_record.reset(reset_token)
+
+            if error is not None:
+                joined = join_continuation(text, "".join(record.get("partial", [])))
+                # 續寫請求沒有新的內容時不再續寫，交給原有的重試機制
+                if (continuations >= limit or len(joined) < MIN_PARTIAL_CHARS or len(joined) <= len(text)
+                        or not _is_transient(error)):
+                    raise error
+                text = joined
+                reason = f"暫時性錯誤（{str(error)[:80]}）"
+            else:
+                piece = _result_text(result)
+                if piece is None:
+                    return result
+                joined = join_continuation(text, piece)
+                finish_reason = record.get("finish_reason") or _result_finish_reason(result)
+                grew = len(joined) > len(text)
+                text = joined
+                if finish_reason not in TRUNCATED_REASONS or continuations >= limit or not grew:
+                    if finish_reason in TRUNCATED_REASONS:
+                        logger.warning(f"⚠️ 輸出在續寫 {continuations} 次後仍被截斷")
+                    return _with_text(result, text) if continuations else result
+                reason = "輸出長度達到上限"
+
+            continuations += 1
+            logger.info(f"✂️ {reason}，保留已生成的 {len(text)} 字並續寫（{continuations}/{limit}）")
+            get_tracer().instant("續寫截斷輸出", cat="continuation", chars=len(text), reason=reason)
+            if error is not None:
+                _backoff(transient_errors, retry, agent_key)
+                transient_errors += 1
+            current_messages = _continuation_messages(messages, text)
+            # 續寫請求是新的請求，停滯從此時重新計算
+            mark_call_progress()
+
+    return continuation_hook
+
+def install_continuation(llm, agent_key: Optional[str] = None, retry: Optional[Dict] = None) -> bool:
+    """
+    為 LLM 實例安裝截斷續寫
+
+    應安裝在 install_cancellation() 之後、install_watchdog() 之前（每次續寫請求各自可被取消，
+    整個續寫過程由逾時監控作為一次調用監督）
+
+    Args:
+        llm: LLM 實例
+        agent_key: Agent 名稱（用於追蹤與退避記錄）
+        retry: Role 的重試配置（retry_delay / retry_backoff / max_retry_delay），暫時性錯誤後按此退避再續寫
+    """
+    _wrap_openai_client(llm)
+    return install_call_hook(llm, _continuation_hook(agent_key, retry or {}), "continuation")
@@ -0,0 +1,233 @@
+"""
+KanoAgent 常駐服務
+長時間執行的本機服務：啟動時導入 CrewAI 與 LLM 提供者套件並預熱 Crew，在多次執行之間重用 LLM 實例（連線池），
+並定期讓 local model 保持載入在 Ollama 中；客戶端（utils.daemon_client）透過 Unix socket 提交執行並接收進度串流，
+連續執行時不必重新付出導入、建立連線與探測 Ollama 的成本
+
+同一時間只執行一個 Crew（追蹤、逾時監控、增量重跑等都是程序內的全局狀態），其餘請求排隊
+"""
+import argparse
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .cancellation import CancellationToken, CancelledError
+from .daemon_client import daemon_address, read_messages, send_message
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：重新載入 local model 的間隔（秒，0 表示不重新載入）
+KEEPALIVE_ENV = "KANO_DAEMON_KEEPALIVE"
+DEFAULT_KEEPALIVE = 20 * 60
+
+class KanoDaemon:
+    """常駐服務的執行狀態與請求處理"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.runs = 0
+        self.current: Optional[Dict] = None
+        self._run_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.stop_event = threading.Event()
+
+    def prepare(self):
+        """導入 Crew 相關模組、啟用 LLM 實例重用並開始預熱"""
+        from dotenv import load_dotenv
+        load_dotenv()
+        import crew_advanced
+        crew_advanced.enable_llm_pool()
+        crew_advanced.enable_presales_digest()
+        crew_advanced.start_crew_warmup()
+        threading.Thread(target=self._keep_models_loaded, name="kano-keepalive", daemon=True).start()
+
+    def _keep_models_loaded(self):
+        """定期重新載入配置為 local 的模型（Ollama 的 keep_alive 到期後會卸載模型）"""
+        from config import DEFAULT_LLM_CONFIG, get_llm_config
+        from .warmup import preload_ollama_model
+        try:
+            interval = int(os.getenv(KEEPALIVE_ENV, DEFAULT_KEEPALIVE))
+        except ValueError:
+            interval = DEFAULT_KEEPALIVE
+        if interval <= 0:
+            return
+        while not self.stop_event.wait(interval):
+            configs = [get_llm_config(role) for role in DEFAULT_LLM_CONFIG]
+            for model in {config["local_model"] for config in configs if config["type"] == "local"}:
+                preload_ollama_model(model)
+
+    def _warm_ready(self) -> bool:
+        import crew_advanced
+        from .warmup import get_warmup
+        return get_warmup().is_ready(crew_advanced.llm_config_fingerprint())
+
+    def status(self) -> Dict:
+        warm = self._warm_ready()
+        with self._lock:
+            return {
+                "type": "status",
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.started_at, 1),
+                "runs": self.runs,
+                "running": self.current,
+                "queued": self._waiting,
+                "warm": warm,
+            }
+
+    def handle(self, request: Dict, send: Callable[[Dict], None], incoming: Iterator[Dict]):
+        kind = request.get("type")
+        if kind == "status":
+            send(self.status())
+        elif kind == "shutdown":
+            send({"type": "ok"})
+            self.stop_event.set()
+        elif kind == "run":
+            self.run(request, send, incoming)
+        else:
+            send({"type": "error", "message": f"未知的請求類型：{kind}"})
+
+    def run(self, request: Dict, send: Callable[[Dict], None], incoming: Iterator[Dict]):
+        """執行一次 Crew，將進度與串流輸出轉發給客戶端；客戶端取消或斷線時中止執行"""
+        token = CancellationToken()
+        finished = threading.Event()
+
+        def watch_client():
+            for message in incoming:
+                if message.get("type") == "cancel":
+                    token.cancel("客戶端已取消執行")
+                    return
+            # 執行結束後客戶端正常關閉連線，不需取消
+            if not finished.is_set():
+                token.cancel("客戶端已斷線")
+
+        threading.Thread(target=watch_client, name="kano-client-watch", daemon=True).start()
+
+        with self._lock:
+            ahead = self._waiting + (1 if self._run_lock.locked() else 0)
+            self._waiting += 1
+        if ahead:
+            send({"type": "queued", "ahead": ahead})
+        try:
+            while not self._run_lock.acquire(timeout=0.5):
+                if token.is_cancelled:
+                    finished.set()
+                    return
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        import crew_advanced
+        from main import run_with_gui
+        try:
+            if token.is_cancelled:
+                return
+            with self._lock:
+                self.current = {"started_at": time.time()}
+            send({"type": "started", "warm": self._warm_ready()})
+            run_with_gui(
+                on_log=lambda message, level="INFO": send({"type": "log", "level": level, "message": message}),
+                on_stream=lambda agent, task, text: send({"type": "chunk", "agent": agent, "task": task, "text": text}),
+                on_stage_event=lambda event: send(dict(event, type="stage")),
+                cancel_token=token,
+                user_requirements_text=request.get("requirements_text"),
+            )
+            finished.set()
+            send({"type": "result", "output_dir": os.path.abspath("output")})
+        except CancelledError as e:
+            finished.set()
+            # 取消時已關閉 LLM 實例的連線，不再重用
+            crew_advanced.clear_llm_pool()
+            send({"type": "cancelled", "message": str(e)})
+        except Exception as e:
+            finished.set()
+            send({"type": "error", "message": str(e)})
+        finally:
+            finished.set()
+            with self._lock:
+                self.runs += 1
+                self.current = None
+            self._run_lock.release()
+            # 為下一次執行預熱
+            crew_advanced.start_crew_warmup()
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        messages = read_messages(self.rfile)
+        request = next(messages, None)
+        if request is None:
+            return
+        send_lock = threading.Lock()
+
+        def send(message: Dict):
+            with send_lock:
+                try:
+                    send_message(self.wfile, message)
+                except OSError:
+                    # 客戶端已斷線（執行由 watch_client 取消）
+                    pass
+
+        self.server.kano.handle(request, send, messages)
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def _remove_stale_socket(path: str):
+    """移除上次未正常結束留下的 socket 檔案（已有服務在監聽時拋出 RuntimeError）"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"KanoAgent 常駐服務已在執行（{path}）")
+
+def serve(daemon: Optional[KanoDaemon] = None):
+    """啟動常駐服務，直到收到 shutdown 請求或 Ctrl+C"""
+    daemon = daemon or KanoDaemon()
+    family, address = daemon_address()
+    if family == getattr(socket, "AF_UNIX", None):
+        _remove_stale_socket(address)
+        server = _UnixServer(address, _RequestHandler)
+        os.chmod(address, 0o600)
+    else:
+        server = _TCPServer(address, _RequestHandler)
+    server.kano = daemon
+
+    print(f"KanoAgent 常駐服務正在預熱...（{address}）")
+    daemon.prepare()
+    threading.Thread(target=server.serve_forever, name="kano-daemon", daemon=True).start()
+    print("✓ 服務已就緒，使用 python kano_client.py run 提交執行（Ctrl+C 停止）")
+    try:
+        while not daemon.stop_event.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        daemon.stop_event.set()
+    finally:
+        server.shutdown()
+        server.server_close()
+        if family == getattr(socket, "AF_UNIX", None) and os.path.exists(address):
+            os.unlink(address)
+    print("KanoAgent 常駐服務已停止")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argparse.ArgumentParser(description="KanoAgent 常駐服務（保持 CrewAI 導入、LLM 連線與 local model 預熱）").parse_args(argv)
+    try:
+        serve()
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
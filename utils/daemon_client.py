@@ -0,0 +1,147 @@
+"""
+常駐服務的輕量客戶端
+透過本機 Unix socket（不支援時使用 127.0.0.1 TCP）向 utils.daemon 提交執行並接收進度串流；
+只使用標準庫，啟動時不導入 CrewAI / LangChain
+
+協議：每行一個 JSON 物件（UTF-8）
+  客戶端 -> 服務：{"type": "run", "requirements_text": ...} / {"type": "status"} / {"type": "shutdown"}，
+                  執行期間可送出 {"type": "cancel"}（斷線同樣視為取消）
+  服務 -> 客戶端：queued / started / log / stage / chunk / result / cancelled / error / status / ok
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# 環境變數：Unix socket 路徑（不支援 Unix socket 的平台改用 KANO_DAEMON_PORT）
+SOCKET_ENV = "KANO_DAEMON_SOCKET"
+PORT_ENV = "KANO_DAEMON_PORT"
+DEFAULT_PORT = 8765
+
+def daemon_address() -> Tuple[int, Union[str, Tuple[str, int]]]:
+    """服務位址：(address family, Unix socket 路徑或 (host, port))"""
+    if hasattr(socket, "AF_UNIX") and sys.platform != "win32":
+        user = os.getenv("USER") or os.getenv("USERNAME") or "user"
+        path = os.getenv(SOCKET_ENV) or os.path.join(tempfile.gettempdir(), f"kanoagent-{user}.sock")
+        return socket.AF_UNIX, path
+    try:
+        port = int(os.getenv(PORT_ENV, DEFAULT_PORT))
+    except ValueError:
+        port = DEFAULT_PORT
+    return socket.AF_INET, ("127.0.0.1", port)
+
+def send_message(stream, message: Dict):
+    """寫入一則訊息（一行 JSON）"""
+    stream.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+    stream.flush()
+
+def read_messages(stream) -> Iterator[Dict]:
+    """逐行讀取訊息，直到連線關閉"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line.decode("utf-8"))
+        except ValueError:
+            continue
+
+def connect(timeout: Optional[float] = 5.0) -> socket.socket:
+    """連線到常駐服務（服務未啟動時拋出 ConnectionError）"""
+    family, address = daemon_address()
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        sock.close()
+        raise ConnectionError(f"KanoAgent 常駐服務未啟動（{address}），請先執行：python kano_daemon.py") from e
+    sock.settimeout(None)
+    return sock
+
+def request(message: Dict) -> Dict:
+    """送出一則請求並返回第一則回應（status / shutdown）"""
+    with connect() as sock, sock.makefile("rwb") as stream:
+        send_message(stream, message)
+        for response in read_messages(stream):
+            return response
+    return {"type": "error", "message": "服務未回應"}
+
+def _print_event(message: Dict, quiet: bool):
+    kind = message.get("type")
+    if kind == "queued":
+        print(f"⏳ 服務正在執行其他任務，已排隊（前方 {message.get('ahead', 0)} 個）")
+    elif kind == "started":
+        print(f"▶ 開始執行（Crew 已預熱：{'是' if message.get('warm') else '否'}）")
+    elif kind == "log":
+        print(f"[{message.get('level', 'INFO')}] {message.get('message', '')}")
+    elif kind == "chunk" and not quiet:
+        print(message.get("text", ""), end="", flush=True)
+    elif kind == "stage" and message.get("event") == "stage_end":
+        print(
+            f"\n✓ 階段 {message.get('index')}/{message.get('total')} 完成：{message.get('task')}"
+            f"（耗時 {message.get('elapsed', 0):.1f}s，LLM 調用 {message.get('calls', 0)} 次）"
+        )
+
+def run(requirements_text: Optional[str], quiet: bool = False) -> int:
+    """提交一次執行並打印進度，Ctrl+C 取消執行"""
+    with connect() as sock, sock.makefile("rwb") as stream:
+        send_message(stream, {"type": "run", "requirements_text": requirements_text})
+        try:
+            for message in read_messages(stream):
+                _print_event(message, quiet)
+                kind = message.get("type")
+                if kind == "result":
+                    print(f"\n✓ 執行完成，輸出位於：{message.get('output_dir')}")
+                    return 0
+                if kind in ("cancelled", "error"):
+                    print(f"\n❌ 執行{'已取消' if kind == 'cancelled' else '失敗'}：{message.get('message')}")
+                    return 1
+        except KeyboardInterrupt:
+            print("\n⚠️  正在取消執行...")
+            try:
+                send_message(stream, {"type": "cancel"})
+            except OSError:
+                pass
+            return 130
+    print("\n❌ 與服務的連線已中斷")
+    return 1
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="KanoAgent 常駐服務客戶端")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="提交一次執行（預設先填寫需求問卷）")
+    run_parser.add_argument("--requirements", help="需求文本檔案（例如 output/user_requirements.md），不填寫問卷")
+    run_parser.add_argument("--no-questionnaire", action="store_true", help="不提供需求，使用 Agent 模擬對話模式")
+    run_parser.add_argument("--quiet", action="store_true", help="不顯示串流輸出")
+    subparsers.add_parser("status", help="查看服務狀態")
+    subparsers.add_parser("shutdown", help="停止服務")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "status":
+            print(json.dumps(request({"type": "status"}), ensure_ascii=False, indent=2))
+            return 0
+        if args.command == "shutdown":
+            request({"type": "shutdown"})
+            print("✓ 已請求停止服務")
+            return 0
+        # 先確認服務可連線，再讓使用者填寫問卷
+        connect().close()
+        if args.requirements:
+            with open(args.requirements, "r", encoding="utf-8") as f:
+                requirements_text = f.read()
+        elif args.no_questionnaire:
+            requirements_text = None
+        else:
+            from utils.user_interaction import interactive_requirements_collection
+            requirements_text = interactive_requirements_collection() or None
+        return run(requirements_text, quiet=args.quiet)
+    except ConnectionError as e:
+        print(f"❌ {e}")
+        return 1
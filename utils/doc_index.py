@@ -0,0 +1,246 @@
+"""
+階段文件的本地檢索索引
+完成的任務輸出按 Markdown 標題切分為章節並建立 BM25 索引（記憶體中，可選持久化為 JSON），
+下游任務（開發、評審、測試）的直接上游輸出（例如評審 / 測試的程式碼）仍完整傳入，
+其他前序文件（PRD、架構…）只取得與任務描述最相關的 top-k 章節與各文件的目錄
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .context_budget import split_sections
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：設定後索引持久化到該 JSON 檔案（例如 output/doc_index.json）
+DOC_INDEX_ENV = "KANO_DOC_INDEX_FILE"
+
+# BM25 參數
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_LATIN_PATTERN = re.compile(r"[a-z0-9_]+")
+_CJK_RUN_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+")
+_HEADING_LEVEL_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+
+def tokenize(text: str) -> List[str]:
+    """檢索用分詞：英數字按單字，中日韓文字按字元二元組（單字元片段保留單字）"""
+    text = text.lower()
+    terms = _LATIN_PATTERN.findall(text)
+    for run in _CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+def chunk_document(text: str) -> List[Tuple[str, str]]:
+    """
+    按 Markdown 標題切分文件
+
+    Returns:
+        [(章節路徑, 章節全文)]，章節路徑例如 "功能需求 > 會員登入"
+    """
+    chunks = []
+    path: List[Tuple[int, str]] = []
+    for heading, body in split_sections(text):
+        match = _HEADING_LEVEL_PATTERN.match(heading)
+        if match:
+            level = len(match.group(1))
+            path = [(lvl, title) for lvl, title in path if lvl < level] + [(level, match.group(2).strip())]
+        if not heading and not body.strip():
+            continue
+        section_path = " > ".join(title for _, title in path) or "（前言）"
+        chunks.append((section_path, (heading + "\n" + body if heading else body).strip()))
+    return chunks
+
+class DocIndex:
+    """按章節切分的 BM25 文件索引"""
+
+    def __init__(self, persist_path: Optional[str] = None):
+        self.persist_path = persist_path
+        # 文件名稱 -> {"hash": 內容雜湊, "chunks": [{"path", "text"}]}
+        self.documents: Dict[str, Dict] = {}
+        # Agent 配置鍵 -> 檢索的章節數（0 表示不使用檢索，傳入完整上下文）
+        self.top_k: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[Tuple[str, int], int]] = {}
+        self._lengths: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+        if persist_path and os.path.exists(persist_path):
+            self.load(persist_path)
+
+    def configure(self, agent_key: str, top_k: int):
+        """設定 Agent 檢索的章節數"""
+        self.top_k[agent_key] = int(top_k or 0)
+
+    def _index_document(self, name: str):
+        for i, chunk in enumerate(self.documents[name]["chunks"]):
+            key = (name, i)
+            terms = Counter(tokenize(chunk["path"] + "\n" + chunk["text"]))
+            self._lengths[key] = sum(terms.values())
+            for term, freq in terms.items():
+                self._postings.setdefault(term, {})[key] = freq
+
+    def _remove_document(self, name: str):
+        for postings in self._postings.values():
+            for key in [key for key in postings if key[0] == name]:
+                del postings[key]
+        for key in [key for key in self._lengths if key[0] == name]:
+            del self._lengths[key]
+        self.documents.pop(name, None)
+
+    def add_document(self, name: str, text: str) -> bool:
+        """
+        加入或更新文件（內容未變時不重建）
+
+        Returns:
+            是否有更新
+        """
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if self.documents.get(name, {}).get("hash") == digest:
+                return False
+            if name in self.documents:
+                self._remove_document(name)
+            self.documents[name] = {
+                "hash": digest,
+                "chunks": [{"path": path, "text": chunk} for path, chunk in chunk_document(text)],
+            }
+            self._index_document(name)
+        if self.persist_path:
+            self.save(self.persist_path)
+        return True
+
+    def search(self, query: str, top_k: int = 5, documents: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        BM25 檢索
+
+        Args:
+            query: 查詢文字（例如任務描述）
+            top_k: 返回的章節數
+            documents: 只在這些文件中檢索（None 表示全部）
+
+        Returns:
+            [{"document", "index", "path", "text", "score"}]，按分數由高到低
+        """
+        allowed = set(documents) if documents is not None else None
+        with self._lock:
+            keys = [key for key in self._lengths if allowed is None or key[0] in allowed]
+            if not keys:
+                return []
+            avg_length = sum(self._lengths[key] for key in keys) / len(keys)
+            scores: Dict[Tuple[str, int], float] = {}
+            for term in set(tokenize(query)):
+                postings = {key: freq for key, freq in self._postings.get(term, {}).items()
+                            if allowed is None or key[0] in allowed}
+                if not postings:
+                    continue
+                idf = math.log(1 + (len(keys) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, freq in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[key] / (avg_length or 1))
+                    scores[key] = scores.get(key, 0.0) + idf * freq * (BM25_K1 + 1) / (freq + norm)
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            return [
+                dict(self.documents[name]["chunks"][i], document=name, index=i, score=round(score, 3))
+                for (name, i), score in ranked
+            ]
+
+    def table_of_contents(self, documents: Optional[Iterable[str]] = None) -> str:
+        """各文件的章節目錄（Markdown 列表）"""
+        lines = []
+        with self._lock:
+            names = [name for name in self.documents if documents is None or name in set(documents)]
+            for name in names:
+                lines.append(f"- {name}")
+                lines.extend(f"  - {chunk['path']}" for chunk in self.documents[name]["chunks"])
+        return "\n".join(lines)
+
+    def build_context(self, query: str, top_k: int, documents: Optional[Iterable[str]] = None) -> str:
+        """
+        組合檢索上下文：文件目錄 + 最相關的 top-k 章節（按原文件順序排列）
+        """
+        documents = list(documents) if documents is not None else None
+        hits = self.search(query, top_k, documents)
+        order = list(self.documents)
+        hits.sort(key=lambda hit: (order.index(hit["document"]), hit["index"]))
+        parts = [
+            "## 前序階段文件目錄",
+            self.table_of_contents(documents),
+            f"\n## 與本任務最相關的章節（共 {len(hits)} 節，其餘章節見上方目錄）",
+        ]
+        for hit in hits:
+            parts.append(f"\n### 【{hit['document']}】{hit['path']}\n{hit['text']}")
+        return "\n".join(parts)
+
+    def stage_documents(
+        self,
+        query: str,
+        top_k: int,
+        upstream: List[Tuple[str, str]],
+        earlier: List[Tuple[str, str]],
+    ) -> List[Tuple[str, str]]:
+        """
+        組合下游任務的上下文文件：直接上游輸出完整保留，其他前序文件以檢索章節代替
+
+        Args:
+            query: 查詢文字（任務描述與預期輸出）
+            top_k: 檢索的章節數（0 表示不檢索其他前序文件）
+            upstream: 任務 context 中的上游輸出 [(任務名稱, 輸出文字)]
+            earlier: 其他已完成的前序任務輸出 [(任務名稱, 輸出文字)]
+
+        Returns:
+            [(名稱, 文字)]，交由 ContextBudgetManager.build_context 按預算組合
+        """
+        upstream_names = {name for name, _ in upstream}
+        earlier = [(name, text) for name, text in earlier if name not in upstream_names]
+        if not top_k or not earlier:
+            return list(upstream)
+        for name, text in earlier:
+            self.add_document(name, text)
+        return list(upstream) + [("retrieval", self.build_context(query, top_k, [name for name, _ in earlier]))]
+
+    def save(self, path: str):
+        """將索引的文件與章節保存為 JSON（BM25 統計在載入時重建）"""
+        with self._lock:
+            data = {"version": 1, "documents": self.documents}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def load(self, path: str):
+        """從 JSON 載入索引"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"無法載入文件索引 {path}: {e}")
+            return
+        with self._lock:
+            self.documents = data.get("documents", {})
+            self._postings.clear()
+            self._lengths.clear()
+            for name in self.documents:
+                self._index_document(name)
+
+# 全局實例
+_doc_index: Optional[DocIndex] = None
+
+def get_doc_index() -> DocIndex:
+    """獲取全局文件索引（設定 KANO_DOC_INDEX_FILE 時持久化）"""
+    global _doc_index
+    if _doc_index is None:
+        _doc_index = DocIndex(os.getenv(DOC_INDEX_ENV) or None)
+    return _doc_index
+
+def reset_doc_index():
+    """重置全局文件索引"""
+    global _doc_index
+    _doc_index = None
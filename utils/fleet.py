@@ -0,0 +1,330 @@
+"""
+多程序 worker fleet
+從 SQLite 任務佇列（utils.job_store）領取任務，每個任務在獨立的 worker 程序中執行：
+- 同一台機器上以程序池同時執行多個 Crew，不受單一程序的 GIL 與事件循環限制
+- 多台機器共用同一個任務目錄（網路共用目錄，KANO_SQLITE_JOURNAL_MODE=DELETE）時，
+  每台機器執行 python kano_worker.py 即可加入 fleet，HTTP 任務服務可只負責 API（--workers 0）
+- 執行中的任務定期更新心跳；worker 所在的機器當機或斷線時，其他節點在租約（KANO_JOB_LEASE）逾時後將任務放回佇列
+- 所有 worker 的 LLM 調用經過同一個共用配額帳本（utils.quota_ledger，預設為任務目錄下的 quota.db），
+  整個 fleet 的 RPM / TPM / 每日請求數不超過提供者的限制；調用失敗的重試仍由各 worker 的 RetryHandler 處理
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .api_logger import get_api_logger
+from .job_store import CANCELLED, FAILED, QUEUED, SUCCEEDED, JobStore, node_name
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：任務工作目錄與佇列資料庫所在的目錄
+JOB_DIR_ENV = "KANO_JOB_DIR"
+DEFAULT_JOB_DIR = "jobs"
+# 環境變數：同時執行的任務數（worker 程序數）
+JOB_WORKERS_ENV = "KANO_JOB_WORKERS"
+DEFAULT_JOB_WORKERS = 1
+# 環境變數：任務因 worker 中斷而重新執行的最大嘗試次數
+JOB_MAX_ATTEMPTS_ENV = "KANO_JOB_MAX_ATTEMPTS"
+DEFAULT_JOB_MAX_ATTEMPTS = 3
+# 環境變數：執行中任務的心跳租約（秒），超過此時間沒有心跳的任務放回佇列
+JOB_LEASE_ENV = "KANO_JOB_LEASE"
+DEFAULT_JOB_LEASE = 60
+
+# 串流輸出合併寫入的間隔（秒），避免每個 token 寫一筆事件
+CHUNK_FLUSH_INTERVAL = 0.5
+# 執行中任務更新心跳的間隔（秒）
+HEARTBEAT_INTERVAL = 10.0
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+# ---------------------------------------------------------------------------
+# worker 程序
+# ---------------------------------------------------------------------------
+
+class _EventWriter:
+    """將執行進度寫入任務的事件記錄（相同 Agent / 任務的連續串流輸出合併為一筆）"""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self._chunk: Optional[Dict] = None
+        self._chunk_started = 0.0
+        self._lock = threading.Lock()
+
+    def _flush_locked(self):
+        if self._chunk is not None:
+            self.store.add_event(self.job_id, self._chunk)
+            self._chunk = None
+
+    def flush(self, force: bool = True):
+        with self._lock:
+            if force or (self._chunk is not None and time.monotonic() - self._chunk_started >= CHUNK_FLUSH_INTERVAL):
+                self._flush_locked()
+
+    def add(self, event: Dict):
+        with self._lock:
+            self._flush_locked()
+            self.store.add_event(self.job_id, event)
+
+    def chunk(self, agent: str, task: str, text: str):
+        with self._lock:
+            if self._chunk is not None and (self._chunk["agent"], self._chunk["task"]) == (agent, task):
+                self._chunk["text"] += text
+            else:
+                self._flush_locked()
+                self._chunk = {"type": "chunk", "agent": agent, "task": task, "text": text}
+                self._chunk_started = time.monotonic()
+        self.flush(force=False)
+
+def run_job(job_id: str, db_path: str, work_dir: str):
+    """
+    worker 程序的入口：在任務的工作目錄中執行一次 Crew 並記錄結果
+
+    取消請求、心跳與父程序是否仍在執行由監看線程檢查；父程序已結束或任務已被其他 worker 接手時中止執行但不記錄結果
+    （前者任務保持執行中狀態，由下次啟動的服務放回佇列）
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+    from .cancellation import CancellationToken, CancelledError
+    from .llm_scheduler import set_run_context
+
+    store = JobStore(db_path)
+    job = store.get(job_id)
+    set_run_context(job["tenant"], job["priority"])
+    events = _EventWriter(store, job_id)
+    token = CancellationToken()
+    stopped = threading.Event()
+    orphaned = threading.Event()
+    parent_pid = os.getppid()
+
+    def watch():
+        last_heartbeat = time.monotonic()
+        while not stopped.wait(CHUNK_FLUSH_INTERVAL):
+            events.flush(force=False)
+            if os.getppid() != parent_pid:
+                orphaned.set()
+                token.cancel("worker fleet 已停止")
+                return
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                last_heartbeat = time.monotonic()
+                if not store.heartbeat(job_id, os.getpid()):
+                    orphaned.set()
+                    token.cancel("心跳逾時，任務已由其他 worker 接手")
+                    return
+            if store.is_cancel_requested(job_id):
+                token.cancel("已透過 HTTP API 取消任務")
+                return
+
+    def finish(status: str, error: Optional[str], event: Dict):
+        # 監看線程每 HEARTBEAT_INTERVAL 才檢查一次租約：只在任務仍由本 worker 執行時記錄結果
+        if store.finish(job_id, status, error, worker_pid=os.getpid()):
+            events.add(event)
+        else:
+            logger.warning(f"任務 {job_id} 的租約已逾時並由其他 worker 接手，不記錄本次結果（{status}）")
+
+    threading.Thread(target=watch, name="kano-job-watch", daemon=True).start()
+    events.add({"type": "started", "attempt": job["attempts"], "pid": os.getpid(), "node": node_name()})
+    try:
+        from main import run_with_gui
+        run_with_gui(
+            on_log=lambda message, level="INFO": events.add({"type": "log", "level": level, "message": message}),
+            on_stream=events.chunk,
+            on_stage_event=lambda event: events.add(dict(event, type="stage")),
+            cancel_token=token,
+            user_requirements_text=job["requirements_text"],
+        )
+        finish(SUCCEEDED, None, {"type": "result", "artifacts": list_artifacts(work_dir)})
+    except KeyboardInterrupt:
+        # 以 Ctrl+C 停止時整個程序組都會收到 SIGINT，任務保持執行中狀態
+        return
+    except CancelledError as e:
+        if orphaned.is_set():
+            return
+        finish(CANCELLED, str(e), {"type": "cancelled", "message": str(e)})
+    except Exception as e:
+        finish(FAILED, str(e), {"type": "error", "message": str(e)})
+    finally:
+        stopped.set()
+        events.flush()
+
+def list_artifacts(work_dir: str) -> List[Dict]:
+    """任務工作目錄中 output/ 下的輸出檔案（不含增量重跑的快取）"""
+    output_dir = os.path.join(work_dir, "output")
+    artifacts = []
+    for root, dirs, files in os.walk(output_dir):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            artifacts.append({
+                "name": os.path.relpath(path, output_dir).replace(os.sep, "/"),
+                "size": stat.st_size,
+                "modified": stat.st_mtime,
+            })
+    return artifacts
+
+# ---------------------------------------------------------------------------
+# 程序池
+# ---------------------------------------------------------------------------
+
+class WorkerPool:
+    """本節點的 worker 程序池：領取任務、啟動與回收 worker，並將心跳逾時的任務放回佇列"""
+
+    def __init__(
+        self,
+        job_dir: Optional[str] = None,
+        workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        lease: Optional[float] = None,
+    ):
+        self.job_dir = os.path.abspath(job_dir or os.getenv(JOB_DIR_ENV, DEFAULT_JOB_DIR))
+        self.workers = max(0, workers if workers is not None else _env_int(JOB_WORKERS_ENV, DEFAULT_JOB_WORKERS))
+        self.max_attempts = max(1, max_attempts if max_attempts is not None else _env_int(JOB_MAX_ATTEMPTS_ENV, DEFAULT_JOB_MAX_ATTEMPTS))
+        self.lease = max(3 * HEARTBEAT_INTERVAL, lease if lease is not None else _env_int(JOB_LEASE_ENV, DEFAULT_JOB_LEASE))
+        self.db_path = os.path.join(self.job_dir, "jobs.db")
+        self.store = JobStore(self.db_path)
+        # Crew 程序內的全局狀態不能在 fork 後共用，worker 一律以 spawn 啟動
+        self._mp = multiprocessing.get_context("spawn")
+        self._processes: Dict[str, multiprocessing.process.BaseProcess] = {}
+        # 執行中的任務 ID（由調度線程整體替換，其他線程直接讀取）
+        self.running: List[str] = []
+        # 本程序提供的共用 LLM 排程器位址（prepare_environment 啟動後設定）
+        self.scheduler_address: Optional[str] = None
+
+    def work_dir(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, job_id)
+
+    def prepare_environment(self) -> Optional[str]:
+        """
+        設定 worker 繼承的環境變數：共用配額帳本預設放在任務目錄下；
+        啟用 LLM 調用排程時，本節點所有 worker 的調用在此程序的同一個排程器中排隊
+
+        Returns:
+            排程器的位址（未啟用時為 None）
+        """
+        from .llm_scheduler import (
+            SCHEDULER_ADDRESS_ENV,
+            get_llm_scheduler,
+            is_local_batch_enabled,
+            is_scheduler_enabled,
+            serve_scheduler,
+        )
+        from .quota_ledger import LEDGER_ENV
+        os.environ.setdefault(LEDGER_ENV, os.path.join(self.job_dir, "quota.db"))
+        if not is_scheduler_enabled():
+            return None
+        address = self.scheduler_address = serve_scheduler()
+        os.environ[SCHEDULER_ADDRESS_ENV] = address
+        local_slots = get_llm_scheduler().concurrency.get("ollama", 1)
+        if is_local_batch_enabled() and 0 < self.workers < local_slots:
+            print(f"⚠️  local model 批次模式的並行數為 {local_slots}，但只有 {self.workers} 個 worker，Ollama 的並行槽位無法用滿")
+        return address
+
+    def recover(self) -> List[str]:
+        """將本節點上次仍在執行中的任務放回佇列"""
+        recovered = self.store.recover(self.max_attempts)
+        for job_id in recovered:
+            self.store.add_event(job_id, {"type": "requeued", "message": "服務重新啟動"})
+        return recovered
+
+    def _record_requeue(self, job_id: str, status: str):
+        if status == QUEUED:
+            self.store.add_event(job_id, {"type": "requeued", "message": self.store.get(job_id)["error"]})
+        elif status == FAILED:
+            self.store.add_event(job_id, {"type": "error", "message": self.store.get(job_id)["error"]})
+
+    def _release_slots(self, pid: Optional[int]):
+        """歸還已結束的 worker 在共用排程器中持有的名額（worker 在調用中途結束時不會自行歸還）"""
+        if not self.scheduler_address or pid is None:
+            return
+        from .llm_scheduler import get_llm_scheduler
+        get_llm_scheduler().release_owner(pid)
+
+    def _reap(self):
+        """回收已結束的 worker；結束時任務仍由它執行表示 worker 崩潰，放回佇列"""
+        for job_id, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self._processes[job_id]
+            self._release_slots(process.pid)
+            reason = f"worker 程序異常結束（exit code {process.exitcode}）"
+            self._record_requeue(job_id, self.store.requeue(job_id, reason, self.max_attempts, worker_pid=process.pid))
+
+    def dispatch(self):
+        """回收 worker、處理心跳逾時的任務，並在有空閒 worker 時領取新任務"""
+        self._reap()
+        for job_id in self.store.requeue_stale(self.lease, self.max_attempts):
+            self._record_requeue(job_id, QUEUED)
+        while len(self._processes) < self.workers:
+            job = self.store.claim()
+            if job is None:
+                break
+            process = self._mp.Process(
+                target=run_job,
+                args=(job["id"], self.db_path, self.work_dir(job["id"])),
+                name=f"kano-job-{job['id']}",
+            )
+            process.start()
+            self.store.set_worker(job["id"], process.pid)
+            self._processes[job["id"]] = process
+            logger.info(f"▶ 開始執行任務 {job['id']}（第 {job['attempts']} 次，worker pid {process.pid}）")
+        self.running = list(self._processes)
+        api_logger = get_api_logger()
+        api_logger.set_gauge("queue_depth", self.store.count(QUEUED))
+        api_logger.set_gauge("active_crews", len(self._processes))
+
+    def stop(self):
+        """停止所有 worker（執行中的任務保持執行中狀態，下次啟動時放回佇列）"""
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            process.join(timeout=10)
+            self._release_slots(process.pid)
+        self._processes.clear()
+
+def run_fleet(pool: WorkerPool, stop_event: Optional[threading.Event] = None, poll_interval: float = 1.0):
+    """持續從共用佇列領取任務，直到 stop_event 被設定或 Ctrl+C"""
+    stop_event = stop_event or threading.Event()
+    recovered = pool.recover()
+    if recovered:
+        print(f"↻ 已將 {len(recovered)} 個中斷的任務放回佇列：{', '.join(recovered)}")
+    pool.prepare_environment()
+    print(f"✓ KanoAgent worker 節點 {node_name()} 已啟動（worker {pool.workers} 個，任務目錄 {pool.job_dir}）")
+    try:
+        while True:
+            pool.dispatch()
+            if stop_event.wait(poll_interval):
+                break
+    finally:
+        pool.stop()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="KanoAgent worker 節點（從共用的任務佇列領取並執行任務）")
+    parser.add_argument("--workers", type=int, help=f"本節點同時執行的任務數（預設 {JOB_WORKERS_ENV} 或 {DEFAULT_JOB_WORKERS}）")
+    parser.add_argument("--job-dir", help=f"共用的任務目錄（預設 {JOB_DIR_ENV} 或 {DEFAULT_JOB_DIR}）")
+    parser.add_argument("--lease", type=float, help=f"任務心跳租約秒數（預設 {JOB_LEASE_ENV} 或 {DEFAULT_JOB_LEASE}）")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    from dotenv import load_dotenv
+    load_dotenv()
+    pool = WorkerPool(job_dir=args.job_dir, workers=args.workers, lease=args.lease)
+    if pool.workers < 1:
+        print("❌ worker 數必須至少為 1")
+        return 1
+    try:
+        run_fleet(pool)
+    except KeyboardInterrupt:
+        pass
+    print(f"KanoAgent worker 節點 {node_name()} 已停止（執行中的任務將在下次啟動或租約逾時後繼續）")
+    return 0
@@ -0,0 +1,322 @@
+"""
+HTTP 任務服務
+以 asyncio 提供 HTTP API，讓內部工具提交需求並取得 KanoAgent 的執行結果：
+- 提交的任務保存在 SQLite 佇列（utils.job_store），由可配置數量的 worker 程序（utils.fleet）依序領取執行；
+  其他機器可共用同一個任務目錄並以 python kano_worker.py 加入執行
+- 每個任務在各自的工作目錄（<KANO_JOB_DIR>/<任務 ID>/）中執行，輸出、檢查點與日誌互不干擾
+- worker 程序崩潰或服務重新啟動時，中斷的任務自動放回佇列；重新執行時 run_cache 重用已完成階段的輸出
+- 進度（日誌、階段事件、串流輸出）以 server-sent events 推送，客戶端斷線後可從 Last-Event-ID 續讀
+
+Crew 的追蹤、逾時監控、取消等都是程序內的全局狀態，因此每個 worker 是獨立的程序（每次執行一個任務）
+
+API：
+  POST /jobs                          提交任務（JSON：{"requirements_text": ..., "tenant": ..., "priority": ...}，
+                                      或直接以文字作為需求並以 ?tenant=&priority= 指定）
+  GET  /jobs                          任務列表（?status=queued/running/...）
+  GET  /jobs/<id>                     任務狀態與各階段進度
+  POST /jobs/<id>/cancel              取消任務
+  GET  /jobs/<id>/events              進度串流（text/event-stream）
+  GET  /jobs/<id>/artifacts           輸出檔案列表
+  GET  /jobs/<id>/artifacts/<檔名>    下載輸出檔案
+  GET  /health、GET /metrics          服務狀態、Prometheus 指標
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from http import HTTPStatus
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .fleet import DEFAULT_JOB_DIR, DEFAULT_JOB_WORKERS, JOB_DIR_ENV, JOB_WORKERS_ENV, WorkerPool, list_artifacts
+from .job_store import FINISHED_STATUSES, QUEUED, RUNNING
+from .llm_scheduler import PRIORITIES, get_llm_scheduler
+from .quota_ledger import get_quota_ledger, is_ledger_enabled
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：HTTP 監聽位址
+JOB_HOST_ENV = "KANO_JOB_HOST"
+JOB_PORT_ENV = "KANO_JOB_PORT"
+DEFAULT_JOB_PORT = 8780
+
+# SSE 輪詢新事件的間隔與保持連線的註解間隔（秒）
+SSE_POLL_INTERVAL = 0.5
+SSE_KEEPALIVE = 15.0
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+# ---------------------------------------------------------------------------
+# 服務
+# ---------------------------------------------------------------------------
+
+class JobService:
+    """任務佇列的調度（本節點的 worker 程序池）與 HTTP API"""
+
+    def __init__(self, job_dir: Optional[str] = None, workers: Optional[int] = None, max_attempts: Optional[int] = None):
+        self.pool = WorkerPool(job_dir=job_dir, workers=workers, max_attempts=max_attempts)
+        self.job_dir = self.pool.job_dir
+        self.store = self.pool.store
+        self._wakeup: Optional[asyncio.Event] = None
+        self.scheduler_address: Optional[str] = None
+
+    @property
+    def workers(self) -> int:
+        return self.pool.workers
+
+    @property
+    def running(self) -> List[str]:
+        return self.pool.running
+
+    def work_dir(self, job_id: str) -> str:
+        return self.pool.work_dir(job_id)
+
+    # ---- 調度 ----
+
+    async def _dispatch_loop(self):
+        while True:
+            await asyncio.to_thread(self.pool.dispatch)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def stop_workers(self):
+        """停止所有 worker（執行中的任務保持執行中狀態，下次啟動時放回佇列）"""
+        self.pool.stop()
+
+    # ---- 任務資訊 ----
+
+    def job_info(self, job_id: str) -> Optional[Dict]:
+        """任務狀態、各階段進度與輸出檔案"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        stages: Dict[str, Dict] = {}
+        for event in self.store.events(job_id, limit=10000, types=["started", "stage"]):
+            if event["type"] == "started":
+                # 重新執行時以新的一次嘗試為準
+                stages.clear()
+                continue
+            if event.get("event") == "stage_start":
+                stages[event["task"]] = {"task": event["task"], "index": event["index"], "status": RUNNING, "agent": event.get("agent")}
+            elif event.get("event") == "stage_end":
+                stage = stages.setdefault(event["task"], {"task": event["task"], "index": event["index"]})
+                stage.update({
+                    "status": "completed",
+                    "agent": event.get("agent"),
+                    "elapsed": event.get("elapsed"),
+                    "calls": event.get("calls"),
+                    "tokens": event.get("tokens"),
+                })
+        artifacts = {artifact["name"] for artifact in list_artifacts(self.work_dir(job_id))}
+        for stage in stages.values():
+            base = stage["task"].replace(" ", "_").replace("/", "_").replace("\\", "_")
+            stage["artifact"] = next((name for name in (f"{base}.md", f"{base}.partial.md") if name in artifacts), None)
+        job.pop("worker_pid", None)
+        job.pop("heartbeat_at", None)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["stages"] = sorted(stages.values(), key=lambda stage: stage["index"])
+        job["artifacts"] = sorted(artifacts)
+        return job
+
+    # ---- HTTP ----
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """處理一個 HTTP/1.1 請求（回應後關閉連線）"""
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length") or 0))
+            await self.route(method.upper(), urlsplit(target), headers, body, writer)
+        except (ValueError, asyncio.IncompleteReadError):
+            await _respond_json(writer, HTTPStatus.BAD_REQUEST, {"error": "無法解析的請求"})
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            logger.error(f"處理 HTTP 請求時發生錯誤: {e}", exc_info=True)
+            await _respond_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+    async def route(self, method: str, url, headers: Dict[str, str], body: bytes, writer: asyncio.StreamWriter):
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        query = parse_qs(url.query)
+
+        if parts == ["health"] and method == "GET":
+            queued = await asyncio.to_thread(self.store.count, QUEUED)
+            health = {"status": "ok", "workers": self.workers, "running": self.running, "queued": queued}
+            if self.scheduler_address:
+                health["scheduler"] = get_llm_scheduler().stats()
+            if is_ledger_enabled():
+                health["quota"] = await asyncio.to_thread(lambda: get_quota_ledger().usage())
+            return await _respond_json(writer, HTTPStatus.OK, health)
+        if parts == ["metrics"] and method == "GET":
+            from .metrics_exporter import render_prometheus
+            return await _respond(writer, HTTPStatus.OK, render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        if parts == ["jobs"] and method == "POST":
+            return await self._submit(headers, query, body, writer)
+        if parts == ["jobs"] and method == "GET":
+            status = (query.get("status") or [None])[0]
+            return await _respond_json(writer, HTTPStatus.OK, {"jobs": await asyncio.to_thread(self.store.list, status)})
+        if len(parts) < 2 or parts[0] != "jobs":
+            return await _respond_json(writer, HTTPStatus.NOT_FOUND, {"error": "找不到路徑"})
+
+        job_id, rest = parts[1], parts[2:]
+        if await asyncio.to_thread(self.store.get, job_id) is None:
+            return await _respond_json(writer, HTTPStatus.NOT_FOUND, {"error": f"找不到任務 {job_id}"})
+        if not rest and method == "GET":
+            return await _respond_json(writer, HTTPStatus.OK, await asyncio.to_thread(self.job_info, job_id))
+        if rest == ["cancel"] and method == "POST":
+            status = await asyncio.to_thread(self.store.request_cancel, job_id)
+            return await _respond_json(writer, HTTPStatus.ACCEPTED, {"id": job_id, "status": status})
+        if rest == ["events"] and method == "GET":
+            after = headers.get("last-event-id") or (query.get("after") or ["0"])[0]
+            return await self._stream_events(job_id, int(after), writer)
+        if rest == ["artifacts"] and method == "GET":
+            artifacts = await asyncio.to_thread(list_artifacts, self.work_dir(job_id))
+            return await _respond_json(writer, HTTPStatus.OK, {"artifacts": artifacts})
+        if len(rest) >= 2 and rest[0] == "artifacts" and method == "GET":
+            return await self._send_artifact(job_id, "/".join(rest[1:]), writer)
+        return await _respond_json(writer, HTTPStatus.NOT_FOUND, {"error": "找不到路徑"})
+
+    async def _submit(self, headers: Dict[str, str], query: Dict[str, List[str]], body: bytes, writer: asyncio.StreamWriter):
+        text = body.decode("utf-8")
+        options = {key: values[0] for key, values in query.items() if key in ("tenant", "priority")}
+        if headers.get("content-type", "").startswith("application/json"):
+            payload = json.loads(text or "{}")
+            payload = payload if isinstance(payload, dict) else {}
+            requirements_text = payload.get("requirements_text")
+            options.update({key: payload[key] for key in ("tenant", "priority") if payload.get(key)})
+        else:
+            requirements_text = text
+        priority = options.get("priority")
+        if priority is not None and priority not in PRIORITIES:
+            return await _respond_json(writer, HTTPStatus.BAD_REQUEST, {"error": f"priority 必須是 {' / '.join(PRIORITIES)}"})
+        job = await asyncio.to_thread(self.store.submit, requirements_text or None, options.get("tenant"), priority)
+        self._wakeup.set()
+        return await _respond_json(writer, HTTPStatus.ACCEPTED, {
+            "id": job["id"],
+            "status": job["status"],
+            "links": {name: f"/jobs/{job['id']}{suffix}" for name, suffix in (("self", ""), ("events", "/events"), ("artifacts", "/artifacts"))},
+        })
+
+    async def _stream_events(self, job_id: str, after: int, writer: asyncio.StreamWriter):
+        """以 server-sent events 推送任務事件，任務結束且事件發送完畢後關閉"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+        )
+        await writer.drain()
+        last_sent = time.monotonic()
+        while True:
+            # 先讀取狀態再讀取事件：worker 在記錄結束狀態之前寫入最後的事件
+            job = await asyncio.to_thread(self.store.get, job_id)
+            events = await asyncio.to_thread(self.store.events, job_id, after)
+            for event in events:
+                after = event.pop("seq")
+                data = json.dumps(event, ensure_ascii=False)
+                writer.write(f"id: {after}\nevent: {event['type']}\ndata: {data}\n\n".encode("utf-8"))
+            if events:
+                await writer.drain()
+                last_sent = time.monotonic()
+                continue
+            if job["status"] in FINISHED_STATUSES:
+                data = json.dumps({"id": job_id, "status": job["status"], "error": job["error"]}, ensure_ascii=False)
+                writer.write(f"event: end\ndata: {data}\n\n".encode("utf-8"))
+                await writer.drain()
+                return
+            if time.monotonic() - last_sent >= SSE_KEEPALIVE:
+                writer.write(b": keep-alive\n\n")
+                await writer.drain()
+                last_sent = time.monotonic()
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+
+    async def _send_artifact(self, job_id: str, name: str, writer: asyncio.StreamWriter):
+        output_dir = os.path.realpath(os.path.join(self.work_dir(job_id), "output"))
+        path = os.path.realpath(os.path.join(output_dir, name))
+        if os.path.commonpath([output_dir, path]) != output_dir or not os.path.isfile(path):
+            return await _respond_json(writer, HTTPStatus.NOT_FOUND, {"error": f"找不到輸出檔案 {name}"})
+        with open(path, "rb") as f:
+            content = f.read()
+        content_type = {
+            ".md": "text/markdown; charset=utf-8",
+            ".json": "application/json",
+            ".txt": "text/plain; charset=utf-8",
+            ".log": "text/plain; charset=utf-8",
+        }.get(os.path.splitext(path)[1], "application/octet-stream")
+        return await _respond(writer, HTTPStatus.OK, content, content_type)
+
+    async def serve(self, host: str, port: int):
+        self._wakeup = asyncio.Event()
+        recovered = await asyncio.to_thread(self.pool.recover)
+        if recovered:
+            print(f"↻ 已將 {len(recovered)} 個中斷的任務放回佇列：{', '.join(recovered)}")
+        self.scheduler_address = self.pool.prepare_environment()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        dispatcher = asyncio.create_task(self._dispatch_loop())
+        print(f"✓ KanoAgent 任務服務已啟動：http://{host}:{port}（worker {self.workers} 個，工作目錄 {self.job_dir}）")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+
+async def _respond(writer: asyncio.StreamWriter, status: HTTPStatus, body: bytes, content_type: str):
+    writer.write(
+        f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+async def _respond_json(writer: asyncio.StreamWriter, status: HTTPStatus, payload: Dict):
+    body = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    await _respond(writer, status, body, "application/json; charset=utf-8")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="KanoAgent HTTP 任務服務（SQLite 任務佇列 + worker 程序）")
+    parser.add_argument("--host", default=os.getenv(JOB_HOST_ENV, "127.0.0.1"), help="監聽位址（預設 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=_env_int(JOB_PORT_ENV, DEFAULT_JOB_PORT), help=f"監聽埠（預設 {DEFAULT_JOB_PORT}）")
+    parser.add_argument(
+        "--workers", type=int,
+        help=f"本節點同時執行的任務數（預設 {JOB_WORKERS_ENV} 或 {DEFAULT_JOB_WORKERS}；0 表示只提供 API，由 kano_worker.py 執行）",
+    )
+    parser.add_argument("--job-dir", help=f"任務工作目錄（預設 {JOB_DIR_ENV} 或 {DEFAULT_JOB_DIR}）")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    from dotenv import load_dotenv
+    load_dotenv()
+    service = JobService(job_dir=args.job_dir, workers=args.workers)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"❌ 無法啟動任務服務：{e}")
+        return 1
+    finally:
+        service.stop_workers()
+    print("KanoAgent 任務服務已停止（執行中的任務將在下次啟動時繼續）")
+    return 0
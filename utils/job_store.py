@@ -0,0 +1,306 @@
+"""
+任務佇列的持久化儲存
+以 SQLite（WAL 模式）保存 HTTP 任務服務（utils.job_service）的任務與進度事件：
+- 任務的提交、領取與完成都是單一交易，服務或 worker 程序崩潰後佇列不會遺失或重複領取
+- 進度事件（日誌、階段事件、串流輸出）按序號追加，SSE 客戶端可用 Last-Event-ID 從中斷處續讀
+- 服務啟動時將上次仍在執行中的任務放回佇列（重新執行時由 run_cache 重用已完成階段的輸出）
+- 多個 worker 程序或共用同一任務目錄的多台機器（utils.fleet）可同時領取任務；執行中的任務定期更新心跳，
+  心跳逾時（worker 所在的機器當機或斷線）的任務由其他 worker 放回佇列
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 任務狀態
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+# 環境變數：SQLite 日誌模式（預設 WAL；任務目錄位於網路共用目錄時 WAL 不可用，改用 DELETE）
+JOURNAL_MODE_ENV = "KANO_SQLITE_JOURNAL_MODE"
+# 環境變數：節點名稱（預設為主機名稱，同一台機器上的服務與 worker 程序使用相同名稱）
+NODE_ENV = "KANO_NODE_NAME"
+
+def node_name() -> str:
+    return os.getenv(NODE_ENV) or socket.gethostname()
+
+def connect_sqlite(db_path: str) -> sqlite3.Connection:
+    """開啟可在多個程序間共用的 SQLite 連線（自動提交，交易以 BEGIN IMMEDIATE 明確開始）"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode={os.getenv(JOURNAL_MODE_ENV) or 'WAL'}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    requirements_text TEXT,
+    tenant TEXT,
+    priority TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    worker_node TEXT,
+    heartbeat_at REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+# 後來加入的欄位（開啟舊的資料庫時補上）
+_ADDED_COLUMNS = {"tenant": "TEXT", "priority": "TEXT", "worker_node": "TEXT", "heartbeat_at": "REAL"}
+
+# 領取任務的順序：執行優先級（high / normal / low），相同時先提交的先執行
+_PRIORITY_ORDER = "CASE priority WHEN 'high' THEN 0 WHEN 'low' THEN 2 ELSE 1 END, created_at"
+
+class JobStore:
+    """SQLite 任務佇列（每個線程使用各自的連線，可在多個程序中同時開啟）"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, column_type in _ADDED_COLUMNS.items():
+            if name not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect_sqlite(self.db_path)
+        return conn
+
+    def _connect(self) -> "_Transaction":
+        return _Transaction(self._connection())
+
+    def submit(self, requirements_text: Optional[str], tenant: Optional[str] = None, priority: Optional[str] = None) -> Dict:
+        """加入一個任務（tenant / priority 為 LLM 調用排程使用的租戶與執行優先級），返回任務記錄"""
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, requirements_text, tenant, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, requirements_text, tenant, priority, time.time()),
+            )
+        return self.get(job_id)
+
+    def claim(self, worker_pid: Optional[int] = None, node: Optional[str] = None) -> Optional[Dict]:
+        """領取優先級最高、最早加入的排隊任務並標記為執行中（node 為領取的節點）；沒有排隊任務時返回 None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT id FROM jobs WHERE status = ? ORDER BY {_PRIORITY_ORDER} LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1, worker_pid = ?, worker_node = ?, "
+                "heartbeat_at = ? WHERE id = ?",
+                (RUNNING, now, worker_pid, node or node_name(), now, row["id"]),
+            )
+        return self.get(row["id"])
+
+    def set_worker(self, job_id: str, worker_pid: int):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET worker_pid = ?, heartbeat_at = ? WHERE id = ?", (worker_pid, time.time(), job_id))
+
+    def heartbeat(self, job_id: str, worker_pid: int, node: Optional[str] = None) -> bool:
+        """
+        更新執行中任務的心跳時間
+
+        Returns:
+            任務是否仍由此 worker 執行（心跳逾時後已被放回佇列或由其他 worker 領取時為 False）
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND worker_pid = ? AND worker_node = ?",
+                (time.time(), job_id, RUNNING, worker_pid, node or node_name()),
+            )
+        return cursor.rowcount > 0
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        error: Optional[str] = None,
+        worker_pid: Optional[int] = None,
+        node: Optional[str] = None,
+    ) -> bool:
+        """
+        記錄任務結束（succeeded / failed / cancelled）
+        指定 worker_pid 時只在任務仍由本節點的該 worker 執行時記錄（與 heartbeat 相同的條件）
+
+        Returns:
+            是否已記錄（租約逾時後任務已被放回佇列或由其他 worker 領取時為 False）
+        """
+        query = "UPDATE jobs SET status = ?, finished_at = ?, error = ?, worker_pid = NULL WHERE id = ?"
+        params = [status, time.time(), error, job_id]
+        if worker_pid is not None:
+            query += " AND status = ? AND worker_pid = ? AND worker_node = ?"
+            params += [RUNNING, worker_pid, node or node_name()]
+        with self._connect() as conn:
+            cursor = conn.execute(query, params)
+        return cursor.rowcount > 0
+
+    def requeue(self, job_id: str, reason: str, max_attempts: int, worker_pid: Optional[int] = None) -> str:
+        """
+        將中斷的執行中任務放回佇列（已達最大嘗試次數時標記為失敗）
+        指定 worker_pid 時只處理仍由本節點的該 worker 執行的任務
+
+        Returns:
+            任務的新狀態
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, attempts, cancel_requested, worker_pid, worker_node FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None or row["status"] != RUNNING:
+                return row["status"] if row is not None else FAILED
+            if worker_pid is not None and (row["worker_pid"], row["worker_node"]) != (worker_pid, node_name()):
+                return row["status"]
+            if row["cancel_requested"]:
+                status, error = CANCELLED, reason
+            elif row["attempts"] >= max_attempts:
+                status, error = FAILED, f"{reason}（已嘗試 {row['attempts']} 次）"
+            else:
+                status, error = QUEUED, reason
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, worker_pid = NULL, finished_at = ? WHERE id = ?",
+                (status, error, time.time() if status != QUEUED else None, job_id),
+            )
+        if status == QUEUED:
+            logger.warning(f"任務 {job_id} 的執行中斷（{reason}），已放回佇列")
+        return status
+
+    def recover(self, max_attempts: int, node: Optional[str] = None) -> List[str]:
+        """
+        服務啟動時將本節點上次仍在執行中的任務放回佇列（其他節點的任務由心跳逾時處理），返回放回的任務 ID
+        """
+        node = node or node_name()
+        with self._connect() as conn:
+            job_ids = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND (worker_node = ? OR worker_node IS NULL)", (RUNNING, node)
+                )
+            ]
+        return [job_id for job_id in job_ids if self.requeue(job_id, "服務重新啟動", max_attempts) == QUEUED]
+
+    def requeue_stale(self, lease: float, max_attempts: int) -> List[str]:
+        """將超過 lease 秒沒有心跳的執行中任務放回佇列，返回放回的任務 ID"""
+        with self._connect() as conn:
+            job_ids = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND COALESCE(heartbeat_at, started_at) < ?",
+                    (RUNNING, time.time() - lease),
+                )
+            ]
+        return [job_id for job_id in job_ids if self.requeue(job_id, "worker 失去心跳", max_attempts) == QUEUED]
+
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        """
+        請求取消任務：排隊中的任務直接取消，執行中的任務由 worker 中止執行
+
+        Returns:
+            任務目前的狀態；任務不存在時返回 None
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == QUEUED:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                    (CANCELLED, time.time(), "已取消", job_id),
+                )
+                return CANCELLED
+            if row["status"] == RUNNING:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return row["status"]
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """最近的任務（不含需求文本）"""
+        columns = "id, status, tenant, priority, created_at, started_at, finished_at, attempts, worker_node, error"
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute(
+                    f"SELECT {columns} FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute(f"SELECT {columns} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, status: str) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def add_event(self, job_id: str, event: Dict) -> int:
+        """追加一個進度事件，返回其序號"""
+        with self._connect() as conn:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE job_id = ?", (job_id,)).fetchone()[0]
+            conn.execute(
+                "INSERT INTO events (job_id, seq, created_at, type, data) VALUES (?, ?, ?, ?, ?)",
+                (job_id, seq, time.time(), event.get("type", ""), json.dumps(event, ensure_ascii=False)),
+            )
+        return seq
+
+    def events(self, job_id: str, after: int = 0, limit: int = 500, types: Optional[List[str]] = None) -> List[Dict]:
+        """序號大於 after 的事件（每個事件加上 "seq" 欄位），types 指定時只返回這些類型"""
+        query, params = "SELECT seq, data FROM events WHERE job_id = ? AND seq > ?", [job_id, after]
+        if types:
+            query += f" AND type IN ({', '.join('?' for _ in types)})"
+            params.extend(types)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY seq LIMIT ?", params + [limit]).fetchall()
+        return [dict(json.loads(row["data"]), seq=row["seq"]) for row in rows]
+
+class _Transaction:
+    """以 BEGIN IMMEDIATE 開始的交易（多個程序同時領取任務時不會領到同一個）"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._conn.execute("BEGIN IMMEDIATE")
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self._conn.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        return False
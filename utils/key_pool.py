@@ -0,0 +1,251 @@
+"""
+API Key 池
+同一個提供者配置了多個 API Key 時（DEEPSEEK_API_KEYS / GOOGLE_API_KEYS），LLM 調用按輪替分配到各個 Key：
+- 每個 Key 使用各自的 LLM 實例（各自的 HTTP client），第一個 Key 為原本的實例
+- 被限流（429 rate limit）的 Key 冷卻一段時間，配額用盡（is_quota_exceeded_error）的 Key 暫停到配額重置，
+  調用立即改用下一個可用的 Key，執行不會因單一 Key 的配額用盡而失敗
+- 所有 Key 都在冷卻時等待最早恢復的 Key；所有 Key 都已配額用盡時才拋出配額用盡錯誤
+
+Key 的狀態只在程序內記錄；多個 worker 程序時各自追蹤（共用的限制由 utils.quota_ledger 協調）。
+共用配額帳本安裝在 Key 池之上，不區分 Key：帳本中提供者 / 模型的限制是所有 Key 合計的限制
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from .api_logger import get_provider_name
+from .cancellation import POLL_INTERVAL, close_llm_clients, get_cancel_token
+from .llm_hooks import install_call_hook
+from .retry_handler import is_overload_error, is_quota_exceeded_error
+
+logger = logging.getLogger(__name__)
+
+# 各提供者的 Key 環境變數：(單一 Key, 以逗號分隔的多個 Key)
+KEY_ENVS = {
+    "deepseek": ("DEEPSEEK_API_KEY", "DEEPSEEK_API_KEYS"),
+    "gemini": ("GOOGLE_API_KEY", "GOOGLE_API_KEYS"),
+}
+# 環境變數：被限流的 Key 的冷卻時間（秒）
+COOLDOWN_ENV = "KANO_KEY_COOLDOWN"
+DEFAULT_COOLDOWN = 60
+# 環境變數：配額用盡的 Key 暫停的時間（秒，未設定時暫停到本地時間的隔天零時）
+PARK_ENV = "KANO_KEY_PARK"
+
+def provider_keys(provider: str) -> List[str]:
+    """提供者配置的所有 API Key（單一 Key 在前，去除重複）"""
+    if provider not in KEY_ENVS:
+        return []
+    single_env, multi_env = KEY_ENVS[provider]
+    keys = [os.getenv(single_env, "")] + os.getenv(multi_env, "").split(",")
+    return list(dict.fromkeys(key.strip() for key in keys if key.strip()))
+
+def apply_primary_keys():
+    """只設定了多個 Key 時，以第一個 Key 作為單一 Key 的環境變數（建立 LLM 實例與檢查 API Key 時使用）"""
+    for provider, (single_env, _) in KEY_ENVS.items():
+        keys = provider_keys(provider)
+        if keys and not os.getenv(single_env):
+            os.environ[single_env] = keys[0]
+
+def _mask(key: str) -> str:
+    return f"…{key[-4:]}" if len(key) > 4 else "…"
+
+def _park_seconds() -> float:
+    try:
+        return float(os.environ[PARK_ENV])
+    except (KeyError, ValueError):
+        now = datetime.now()
+        return (datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds()
+
+class KeyState:
+    """單一 API Key 的使用狀態"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.label = _mask(key)
+        self.calls = 0
+        self.rate_limited = 0
+        self.quota_exceeded = 0
+        # 可再次使用的時間（time.monotonic），冷卻或暫停時大於現在
+        self.available_at = 0.0
+        self.parked = False
+
+class AllKeysExhaustedError(Exception):
+    """提供者的所有 API Key 都已配額用盡（訊息包含 429 / quota exceeded，RetryHandler 視為不可重試）"""
+
+class KeyPool:
+    """單一提供者的 API Key 池（輪替分配，並追蹤各 Key 的限流與配額狀態）"""
+
+    def __init__(self, provider: str, keys: List[str]):
+        self.provider = provider
+        self.keys = [KeyState(key) for key in keys]
+        self._next = 0
+        self._lock = threading.Lock()
+        try:
+            self.cooldown = float(os.getenv(COOLDOWN_ENV, DEFAULT_COOLDOWN))
+        except ValueError:
+            self.cooldown = DEFAULT_COOLDOWN
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _try_acquire(self, exclude: set) -> Optional[KeyState]:
+        now = time.monotonic()
+        with self._lock:
+            for offset in range(len(self.keys)):
+                state = self.keys[(self._next + offset) % len(self.keys)]
+                if state.key in exclude or state.available_at > now:
+                    continue
+                if state.parked:
+                    # 暫停時間已過，配額應已重置
+                    state.parked = False
+                    logger.info(f"✓ {self.provider} API Key {state.label} 的暫停時間已過，恢復使用")
+                self._next = (self._next + offset + 1) % len(self.keys)
+                state.calls += 1
+                return state
+        return None
+
+    def acquire(self, exclude: Optional[set] = None) -> Optional[KeyState]:
+        """
+        輪替取得下一個可用的 Key；所有 Key 都在冷卻時等待（可被取消）
+
+        Returns:
+            可用的 Key；exclude 以外沒有未暫停的 Key 時返回 None
+
+        Raises:
+            AllKeysExhaustedError: 池中所有 Key 都已配額用盡（只被限流的 Key 冷卻後仍可使用，不視為用盡）
+        """
+        exclude = exclude or set()
+        token = get_cancel_token()
+        waited = False
+        while True:
+            token.raise_if_cancelled()
+            state = self._try_acquire(exclude)
+            if state is not None:
+                return state
+            with self._lock:
+                if all(state.parked for state in self.keys):
+                    raise AllKeysExhaustedError(
+                        f"429 quota exceeded：{self.provider} 的 {len(self.keys)} 個 API Key 都已配額用盡"
+                    )
+                candidates = [state for state in self.keys if state.key not in exclude and not state.parked]
+                if not candidates:
+                    # 其餘的 Key 已在本次調用中試過（被限流），交由外層的重試在冷卻後再調用
+                    return None
+                wait = min(state.available_at for state in candidates) - time.monotonic()
+            if not waited:
+                logger.warning(f"⏳ {self.provider} 暫時沒有可用的 API Key（被限流或配額用盡），等待約 {max(wait, 0):.0f}s")
+                waited = True
+            time.sleep(min(POLL_INTERVAL, max(wait, 0)))
+
+    def report_error(self, state: KeyState, error: BaseException) -> bool:
+        """
+        記錄 Key 的調用錯誤：配額用盡時暫停到重置，被限流時冷卻
+
+        Returns:
+            是否應改用其他 Key 重新調用
+        """
+        message = str(error)
+        with self._lock:
+            if is_quota_exceeded_error(message):
+                seconds = _park_seconds()
+                state.quota_exceeded += 1
+                state.parked = True
+                state.available_at = time.monotonic() + seconds
+                logger.warning(f"⚠️  {self.provider} API Key {state.label} 配額用盡，暫停 {seconds / 3600:.1f} 小時")
+                return True
+            if "429" in message and is_overload_error(message):
+                state.rate_limited += 1
+                state.available_at = time.monotonic() + self.cooldown
+                logger.warning(f"⚠️  {self.provider} API Key {state.label} 被限流，冷卻 {self.cooldown:.0f}s")
+                return True
+        return False
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": state.label,
+                    "calls": state.calls,
+                    "rate_limited": state.rate_limited,
+                    "quota_exceeded": state.quota_exceeded,
+                    "parked": state.parked,
+                    "available_in": round(max(state.available_at - now, 0), 1),
+                }
+                for state in self.keys
+            ]
+
+# 全局實例（按提供者）
+_pools: Dict[str, KeyPool] = {}
+_pools_lock = threading.Lock()
+
+def get_key_pool(provider: str) -> Optional[KeyPool]:
+    """獲取提供者的 API Key 池（只配置了一個 Key 時返回 None）"""
+    with _pools_lock:
+        if provider not in _pools:
+            keys = provider_keys(provider)
+            if len(keys) < 2:
+                return None
+            _pools[provider] = KeyPool(provider, keys)
+            logger.info(f"✓ {provider} 使用 {len(keys)} 個 API Key 輪替")
+        return _pools[provider]
+
+def install_key_pool(
+    llm,
+    agent_key: str,
+    model: Optional[str],
+    llm_type: Optional[str],
+    factory: Callable[[str], object],
+) -> bool:
+    """
+    讓 LLM 實例的調用在提供者的多個 API Key 之間輪替（安裝在最內層，其他掛鉤包在外層）
+
+    Args:
+        llm: 以第一個 Key 建立的 LLM 實例
+        agent_key: Agent 名稱（用於日誌）
+        model: 模型名稱
+        llm_type: LLM 類型（local model 不使用 Key 池）
+        factory: 以指定 Key 建立同一模型的 LLM 實例的函數
+    """
+    if llm_type == "local" or not model:
+        return False
+    provider = get_provider_name(model, llm_type)
+    pool = get_key_pool(provider)
+    if pool is None:
+        return False
+    primary_key = pool.keys[0].key
+    instances: Dict[str, object] = {}
+    instances_lock = threading.Lock()
+
+    def instance_call(key: str, call_next: Callable) -> Callable:
+        if key == primary_key:
+            return call_next
+        with instances_lock:
+            if key not in instances:
+                instances[key] = factory(key)
+            instance = instances[key]
+        # 取消時同時關閉此 Key 的實例的連線
+        get_cancel_token().register_closer(lambda: close_llm_clients(instance), key=id(instance))
+        return getattr(instance, call_next.__name__)
+
+    def key_pool_hook(llm, call_next, *args, **kwargs):
+        tried = set()
+        last_error: Optional[BaseException] = None
+        while True:
+            state = pool.acquire(exclude=tried)
+            if state is None:
+                # 本次調用已試過所有 Key，交由外層的重試處理
+                raise last_error
+            try:
+                return instance_call(state.key, call_next)(*args, **kwargs)
+            except Exception as e:
+                if not pool.report_error(state, e):
+                    raise
+                logger.info(f"↻ {agent_key} 改用下一個 {provider} API Key 重新調用")
+                tried.add(state.key)
+                last_error = e
+
+    return install_call_hook(llm, key_pool_hook, "key_pool")
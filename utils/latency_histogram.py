@@ -0,0 +1,164 @@
+"""
+延遲直方圖
+HDR 風格的固定桶直方圖（log-linear 分桶，計數存放於 array 中），
+可計算 p50/p95/p99，並可跨程序合併
+"""
+from array import array
+from typing import Dict, Iterable, Optional
+
+# 每個 2 的冪次區間切分為 2^(SUB_BUCKET_BITS-1) 個子桶，相對誤差約 3%
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+# 記錄單位為毫秒，上限約 49 天（超過的值會被截斷到最後一個桶）
+MAX_VALUE_MS = (1 << 32) - 1
+
+def _bucket_index(value_ms: int) -> int:
+    """將毫秒值映射到桶索引"""
+    if value_ms < SUB_BUCKET_COUNT:
+        return value_ms
+    shift = value_ms.bit_length() - SUB_BUCKET_BITS
+    mantissa = value_ms >> shift
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (mantissa - SUB_BUCKET_HALF)
+
+def _bucket_bounds(index: int) -> tuple:
+    """返回桶索引對應的毫秒範圍 (lower, upper)，upper 為包含值"""
+    if index < SUB_BUCKET_COUNT:
+        return index, index
+    offset = index - SUB_BUCKET_COUNT
+    shift = offset // SUB_BUCKET_HALF + 1
+    mantissa = offset % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+BUCKET_COUNT = _bucket_index(MAX_VALUE_MS) + 1
+
+class LatencyHistogram:
+    """固定桶延遲直方圖（輸入單位：秒）"""
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * BUCKET_COUNT))
+        self.total_count = 0
+        self.total_seconds = 0.0
+        self.min_seconds: Optional[float] = None
+        self.max_seconds: Optional[float] = None
+
+    def record(self, seconds: float, count: int = 1):
+        """
+        記錄一個延遲值
+
+        Args:
+            seconds: 延遲時間（秒），負值會被視為 0
+            count: 該值出現的次數
+        """
+        seconds = max(0.0, float(seconds))
+        value_ms = min(int(round(seconds * 1000)), MAX_VALUE_MS)
+        self.counts[_bucket_index(value_ms)] += count
+        self.total_count += count
+        self.total_seconds += seconds * count
+        if self.min_seconds is None or seconds < self.min_seconds:
+            self.min_seconds = seconds
+        if self.max_seconds is None or seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def merge(self, other: "LatencyHistogram"):
+        """合併另一個直方圖（桶結構相同，直接逐桶相加）"""
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total_count += other.total_count
+        self.total_seconds += other.total_seconds
+        if other.min_seconds is not None:
+            self.min_seconds = other.min_seconds if self.min_seconds is None else min(self.min_seconds, other.min_seconds)
+        if other.max_seconds is not None:
+            self.max_seconds = other.max_seconds if self.max_seconds is None else max(self.max_seconds, other.max_seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        計算百分位數
+
+        Args:
+            q: 百分位（0-100）
+
+        Returns:
+            延遲（秒），沒有資料時返回 None
+        """
+        if self.total_count == 0:
+            return None
+        target = max(1, int(round(self.total_count * min(max(q, 0.0), 100.0) / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            if seen >= target:
+                lower, upper = _bucket_bounds(index)
+                value = (lower + upper) / 2000.0
+                # 以實際觀測到的極值夾住桶中點，避免超出範圍
+                return min(max(value, self.min_seconds), self.max_seconds)
+        return self.max_seconds
+
+    def count_at_or_below(self, seconds: float) -> int:
+        """返回小於等於指定值（以桶上界判斷）的樣本數，用於累積分桶輸出"""
+        value_ms = min(int(seconds * 1000), MAX_VALUE_MS)
+        total = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            if _bucket_bounds(index)[1] > value_ms:
+                break
+            total += count
+        return total
+
+    @property
+    def mean(self) -> Optional[float]:
+        """平均值（秒）"""
+        if self.total_count == 0:
+            return None
+        return self.total_seconds / self.total_count
+
+    def summary(self) -> Dict:
+        """返回摘要統計（秒）"""
+        return {
+            "count": self.total_count,
+            "mean": self.mean,
+            "min": self.min_seconds,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max_seconds,
+        }
+
+    def to_dict(self) -> Dict:
+        """序列化為可合併的字典（只保存非零桶）"""
+        return {
+            "sub_bucket_bits": SUB_BUCKET_BITS,
+            "counts": {str(i): c for i, c in enumerate(self.counts) if c},
+            "total_count": self.total_count,
+            "total_seconds": self.total_seconds,
+            "min": self.min_seconds,
+            "max": self.max_seconds,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LatencyHistogram":
+        """從 to_dict() 的結果還原直方圖"""
+        if data.get("sub_bucket_bits", SUB_BUCKET_BITS) != SUB_BUCKET_BITS:
+            raise ValueError(
+                f"直方圖分桶精度不一致：{data.get('sub_bucket_bits')} != {SUB_BUCKET_BITS}"
+            )
+        histogram = cls()
+        for index, count in data.get("counts", {}).items():
+            histogram.counts[int(index)] += int(count)
+        histogram.total_count = int(data.get("total_count", 0))
+        histogram.total_seconds = float(data.get("total_seconds", 0.0))
+        histogram.min_seconds = data.get("min")
+        histogram.max_seconds = data.get("max")
+        return histogram
+
+def merge_histograms(histograms: Iterable[LatencyHistogram]) -> LatencyHistogram:
+    """合併多個直方圖為一個新的直方圖"""
+    merged = LatencyHistogram()
+    for histogram in histograms:
+        merged.merge(histogram)
+    return merged
@@ -0,0 +1,64 @@
+"""
+LLM 調用掛鉤
+在單個 LLM 實例上包裝實際的調用方法，讓取消、排程、配額等橫切邏輯不必修改 CrewAI / LangChain 的類別
+"""
+import logging
+from functools import wraps
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# 依序嘗試的調用方法（CrewAI 原生 LLM 使用 call，LangChain 模型使用 invoke）
+CALL_METHODS = ("call", "invoke")
+
+# 已安裝的掛鉤名稱記錄在實例上，避免重複安裝
+_HOOKS_ATTR = "_kano_call_hooks"
+
+def _call_method(llm) -> str:
+    for name in CALL_METHODS:
+        if callable(getattr(llm, name, None)):
+            return name
+    return ""
+
+def installed_hooks(llm) -> List[str]:
+    """獲取 LLM 實例上已安裝的掛鉤名稱"""
+    return list(getattr(llm, "__dict__", {}).get(_HOOKS_ATTR, []))
+
+def install_call_hook(llm, hook: Callable, name: str) -> bool:
+    """
+    在 LLM 實例上安裝調用掛鉤
+
+    hook 的簽名為 hook(llm, call_next, *args, **kwargs)，必須調用 call_next(*args, **kwargs)
+    （或拋出異常）；後安裝的掛鉤在外層
+
+    Args:
+        llm: LLM 實例（字串形式的模型名稱會被忽略）
+        hook: 掛鉤函數
+        name: 掛鉤名稱（同名掛鉤只安裝一次）
+
+    Returns:
+        是否已安裝
+    """
+    if llm is None or isinstance(llm, str):
+        return False
+    method_name = _call_method(llm)
+    if not method_name:
+        return False
+    hooks = installed_hooks(llm)
+    if name in hooks:
+        return True
+
+    call_next = getattr(llm, method_name)
+
+    @wraps(call_next)
+    def hooked(*args, **kwargs):
+        return hook(llm, call_next, *args, **kwargs)
+
+    try:
+        # CrewAI / LangChain 的 LLM 都是 pydantic 模型，直接寫入實例字典以繞過欄位驗證
+        object.__setattr__(llm, method_name, hooked)
+        object.__setattr__(llm, _HOOKS_ATTR, hooks + [name])
+    except (AttributeError, TypeError) as e:
+        logger.debug(f"無法在 {type(llm).__name__} 上安裝調用掛鉤 {name}: {e}")
+        return False
+    return True
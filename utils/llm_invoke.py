@@ -0,0 +1,42 @@
+"""
+統一的 LLM 調用介面
+CrewAI 原生 LLM（call）與 LangChain 模型（invoke）的調用方式與返回值不同，這裡統一為「訊息 -> 文字」
+"""
+from typing import Any, Dict, List, Union
+
+Messages = Union[str, List[Dict[str, str]]]
+
+def _to_text(response: Any) -> str:
+    """將不同 LLM 的返回值轉為文字"""
+    if response is None:
+        return ""
+    if isinstance(response, str):
+        return response
+    content = getattr(response, "content", None)
+    if content is not None:
+        if isinstance(content, list):
+            return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+        return str(content)
+    return str(response)
+
+def invoke_llm(llm: Any, messages: Messages, **kwargs) -> str:
+    """
+    調用 LLM 並返回文字
+
+    Args:
+        llm: CrewAI LLM 或 LangChain 模型
+        messages: 提示文字，或 [{"role": ..., "content": ...}] 格式的訊息列表
+        **kwargs: 傳給 CrewAI call() 的額外參數（例如 from_task / from_agent）
+
+    Returns:
+        LLM 輸出文字
+    """
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    call = getattr(llm, "call", None)
+    if callable(call):
+        return _to_text(call(messages, **kwargs))
+    invoke = getattr(llm, "invoke", None)
+    if callable(invoke):
+        return _to_text(invoke(messages))
+    raise TypeError(f"不支援的 LLM 類型: {type(llm).__name__}")
@@ -0,0 +1,222 @@
+"""
+LLM 調用監控
+訂閱 CrewAI 事件匯流排，將每次實際的 LLM 調用（延遲、首 Token 延遲、錯誤）記錄到 APILogger，
+並將任務與 LLM 調用的時間區段寫入執行追蹤；串流模式下將逐 Token 輸出轉發到串流匯流排
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from .api_logger import get_api_logger
+from .cancellation import mark_call_progress
+from .stream_bus import get_stream_bus, TASK_START, CHUNK, TASK_END
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+def _crewai_events():
+    """延遲導入 CrewAI 事件模組（1.x 位於 crewai.events，舊版位於 crewai.utilities.events），不可用時返回 None"""
+    try:
+        import crewai.events as events
+    except ImportError:
+        try:
+            import crewai.utilities.events as events
+        except ImportError:
+            return None
+    return events
+
+def _event_time(event) -> float:
+    """取得事件發生時間（事件處理器可能在其他線程中延後執行）"""
+    timestamp = getattr(event, "timestamp", None)
+    if timestamp is not None:
+        try:
+            return timestamp.timestamp()
+        except Exception:
+            pass
+    return time.time()
+
+def _event_agent_role(event) -> Optional[str]:
+    """取得事件對應的 Agent role"""
+    role = getattr(event, "agent_role", None)
+    if role:
+        return role
+    agent = getattr(event, "from_agent", None)
+    return getattr(agent, "role", None) if agent is not None else None
+
+def _event_task_name(event) -> Optional[str]:
+    """取得事件對應的任務名稱"""
+    name = getattr(event, "task_name", None)
+    if name:
+        return name
+    task = getattr(event, "from_task", None) or getattr(event, "task", None)
+    return getattr(task, "name", None) if task is not None else None
+
+def _event_tokens(event) -> Optional[int]:
+    """取得事件中的 Token 使用量（不同版本的 CrewAI 欄位不同）"""
+    usage = getattr(event, "usage", None)
+    if isinstance(usage, dict):
+        return usage.get("total_tokens")
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+class LLMCallMonitor:
+    """將 CrewAI 的 LLM 事件轉換為 APILogger 記錄"""
+
+    def __init__(self):
+        # Agent role -> {"agent": 配置鍵, "model": 模型名稱, "type": "api"/"local"}
+        self.agents: Dict[str, Dict] = {}
+        # 進行中的調用：call key -> {"start": 開始時間, "first_token": 首 Token 時間}
+        self._inflight: Dict[tuple, Dict] = {}
+        # 進行中的任務：任務名稱 -> 開始時間
+        self._tasks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def set_agents(self, agent_models: Dict[str, Dict]):
+        """更新 Agent role 到配置的映射"""
+        with self._lock:
+            self.agents.update(agent_models)
+
+    def _call_key(self, event) -> tuple:
+        call_id = getattr(event, "call_id", None)
+        if call_id:
+            return ("id", call_id)
+        return (_event_agent_role(event), _event_task_name(event))
+
+    def _describe(self, event) -> Dict:
+        role = _event_agent_role(event)
+        info = self.agents.get(role, {})
+        return {
+            "agent_name": info.get("agent", role or "unknown"),
+            "model": info.get("model") or getattr(event, "model", None) or "unknown",
+            "llm_type": info.get("type", "api"),
+            "task": _event_task_name(event),
+        }
+
+    def on_started(self, event):
+        with self._lock:
+            self._inflight[self._call_key(event)] = {"start": _event_time(event), "first_token": None}
+
+    def on_chunk(self, event):
+        with self._lock:
+            call = self._inflight.get(self._call_key(event))
+            if call is not None and call["first_token"] is None:
+                call["first_token"] = _event_time(event)
+        chunk = getattr(event, "chunk", None)
+        if chunk:
+            # 事件在調用的線程中發出時，同時記錄該次調用的進展
+            mark_call_progress()
+            description = self._describe(event)
+            get_stream_bus().publish(CHUNK, description["agent_name"], description["task"], str(chunk))
+
+    def _finish(self, event) -> Optional[Dict]:
+        with self._lock:
+            call = self._inflight.pop(self._call_key(event), None)
+        if call is None:
+            return None
+        end = _event_time(event)
+        description = self._describe(event)
+        get_tracer().add_span(
+            f"LLM {description['agent_name']}", call["start"], end, cat="llm",
+            model=description["model"], task=description["task"],
+            ttft=call["first_token"] - call["start"] if call["first_token"] else None,
+        )
+        return {
+            "duration": max(0.0, end - call["start"]),
+            "ttft": call["first_token"] - call["start"] if call["first_token"] else None,
+        }
+
+    def _task_agent(self, event) -> Optional[str]:
+        """任務事件對應的 Agent 配置鍵"""
+        task = getattr(event, "task", None)
+        role = getattr(getattr(task, "agent", None), "role", None)
+        return self.agents.get(role, {}).get("agent", role)
+
+    def on_task_started(self, event):
+        name = _event_task_name(event) or "unknown"
+        with self._lock:
+            self._tasks[name] = _event_time(event)
+        get_stream_bus().publish(TASK_START, self._task_agent(event), name)
+
+    def on_task_finished(self, event):
+        name = _event_task_name(event) or "unknown"
+        with self._lock:
+            start = self._tasks.pop(name, None)
+        if start is not None:
+            get_tracer().add_span(
+                name, start, _event_time(event), cat="task",
+                status="failed" if getattr(event, "error", None) else "completed",
+            )
+        get_stream_bus().publish(TASK_END, self._task_agent(event), name)
+
+    def on_completed(self, event):
+        timing = self._finish(event)
+        if timing is None:
+            return
+        get_api_logger().log_call(
+            status="success",
+            tokens_used=_event_tokens(event),
+            duration=timing["duration"],
+            ttft=timing["ttft"],
+            **self._describe(event),
+        )
+
+    def on_failed(self, event):
+        timing = self._finish(event)
+        get_api_logger().log_call(
+            status="error",
+            error=str(getattr(event, "error", ""))[:500],
+            duration=timing["duration"] if timing else None,
+            ttft=timing["ttft"] if timing else None,
+            **self._describe(event),
+        )
+
+# 全局實例
+_llm_monitor: Optional[LLMCallMonitor] = None
+_handlers_registered = False
+
+def _safe(handler):
+    """事件處理器不應影響 Crew 執行"""
+    def wrapper(source, event):
+        try:
+            handler(event)
+        except Exception as e:
+            logger.debug(f"LLM 監控事件處理失敗: {e}")
+    return wrapper
+
+def get_llm_monitor() -> LLMCallMonitor:
+    """獲取全局 LLM 調用監控器實例"""
+    global _llm_monitor
+    if _llm_monitor is None:
+        _llm_monitor = LLMCallMonitor()
+    return _llm_monitor
+
+def register_llm_monitor(agent_models: Optional[Dict[str, Dict]] = None) -> LLMCallMonitor:
+    """
+    註冊 LLM 調用監控（重複調用只會更新 Agent 映射，不會重複訂閱事件）
+
+    Args:
+        agent_models: {agent role: {"agent": 配置鍵, "model": 模型, "type": "api"/"local"}}
+    """
+    global _handlers_registered
+    monitor = get_llm_monitor()
+    if agent_models:
+        monitor.set_agents(agent_models)
+
+    if _handlers_registered:
+        return monitor
+
+    events = _crewai_events()
+    if events is None:
+        logger.debug("CrewAI 事件匯流排不可用，無法記錄 LLM 調用延遲")
+        return monitor
+
+    bus = events.crewai_event_bus
+    bus.on(events.LLMCallStartedEvent)(_safe(monitor.on_started))
+    bus.on(events.LLMStreamChunkEvent)(_safe(monitor.on_chunk))
+    bus.on(events.LLMCallCompletedEvent)(_safe(monitor.on_completed))
+    bus.on(events.LLMCallFailedEvent)(_safe(monitor.on_failed))
+    bus.on(events.TaskStartedEvent)(_safe(monitor.on_task_started))
+    bus.on(events.TaskCompletedEvent)(_safe(monitor.on_task_finished))
+    bus.on(events.TaskFailedEvent)(_safe(monitor.on_task_finished))
+    _handlers_registered = True
+    return monitor
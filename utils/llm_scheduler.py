@@ -0,0 +1,431 @@
+"""
+LLM 調用排程
+多個執行（多個專案）共用同一個 API 配額與同一台 Ollama 時，在 LLM 調用路徑前排隊：
+- 每個提供者（deepseek / gemini / ollama ...）有各自的同時調用數上限
+- 同一提供者的等待請求按優先級（執行的優先級 + 階段的優先級）排序，同一優先級內按租戶權重做加權公平排隊（WFQ），
+  請求的成本以該 Agent 最近調用耗時的移動平均估計，短的階段因此自然排在長的生成之前
+- 等待過久的請求逐步提升優先級，批次執行不會被餓死
+- 批次模式（KANO_SCHED_LOCAL_BATCH=1）下 local model 的調用按模型分組：跨執行、同一模型的調用一起送出
+  （直到 Ollama 的並行數），目前模型的調用全部結束後才切換模型，模型保持載入且不在模型之間來回切換
+
+預設只在程序內排程；HTTP 任務服務（utils.job_service）在服務程序中提供共用的排程器，
+worker 程序透過 KANO_SCHEDULER_ADDRESS 連線，所有任務的調用在同一個佇列中排隊；
+號碼牌記錄所屬的 worker 程序，worker 異常結束或被停止時由程序池歸還其名額（utils.fleet）
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from typing import Dict, Optional, Tuple
+
+from .api_logger import get_api_logger, get_provider_name, METRIC_SCHEDULER_WAIT
+from .cancellation import POLL_INTERVAL, get_cancel_token
+from .llm_hooks import install_call_hook
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：設定為 1 時啟用 LLM 調用排程
+SCHEDULER_ENV = "KANO_SCHEDULER"
+# 環境變數：每個提供者的同時調用數上限（例如 deepseek=4,ollama=1）
+CONCURRENCY_ENV = "KANO_SCHED_CONCURRENCY"
+DEFAULT_CONCURRENCY = {"ollama": 1}
+DEFAULT_PROVIDER_CONCURRENCY = 4
+# 環境變數：租戶權重（例如 projA=3,projB=1，未列出的租戶權重為 1）
+TENANT_WEIGHTS_ENV = "KANO_SCHED_TENANT_WEIGHTS"
+# 環境變數：請求每等待多少秒提升一級優先級（0 表示不提升）
+AGING_ENV = "KANO_SCHED_AGING"
+DEFAULT_AGING = 60.0
+# 環境變數：設定為 1 時 local model（Ollama）的調用按模型分組批次送出
+LOCAL_BATCH_ENV = "KANO_SCHED_LOCAL_BATCH"
+# 環境變數：其他模型有請求等待時，目前模型最多連續分配的調用數
+BATCH_LIMIT_ENV = "KANO_SCHED_BATCH_LIMIT"
+DEFAULT_BATCH_LIMIT = 32
+# Ollama 服務端的並行數（批次模式下作為 ollama 的同時調用數，KANO_SCHED_CONCURRENCY 優先）
+OLLAMA_PARALLEL_ENV = "OLLAMA_NUM_PARALLEL"
+DEFAULT_OLLAMA_PARALLEL = 4
+BATCH_PROVIDERS = ("ollama",)
+# 環境變數：本程序執行的租戶與優先級（HTTP 任務服務按任務設定）
+TENANT_ENV = "KANO_TENANT"
+RUN_PRIORITY_ENV = "KANO_RUN_PRIORITY"
+# 環境變數：共用排程器的位址（host:port，由 HTTP 任務服務設定給 worker 程序）
+SCHEDULER_ADDRESS_ENV = "KANO_SCHEDULER_ADDRESS"
+
+DEFAULT_TENANT = "default"
+
+# 優先級（數值越小越優先）；請求的優先級 = 執行的優先級 + 階段（Agent）的優先級
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# 沒有耗時記錄時的調用成本估計（秒）與移動平均的權重
+DEFAULT_COST = 10.0
+COST_EMA_ALPHA = 0.3
+
+def is_local_batch_enabled() -> bool:
+    return os.getenv(LOCAL_BATCH_ENV, "0").lower() in ("1", "true", "yes")
+
+def is_scheduler_enabled() -> bool:
+    """KANO_SCHEDULER=1 或啟用 local model 批次模式時排程 LLM 調用"""
+    return os.getenv(SCHEDULER_ENV, "0").lower() in ("1", "true", "yes") or is_local_batch_enabled()
+
+def priority_value(name: Optional[str]) -> int:
+    return PRIORITIES.get((name or "normal").lower(), PRIORITIES["normal"])
+
+def _parse_mapping(value: Optional[str], cast) -> Dict:
+    """解析 key=value,key=value 格式的環境變數（無效項目忽略）"""
+    mapping = {}
+    for item in (value or "").split(","):
+        key, _, raw = item.partition("=")
+        try:
+            mapping[key.strip()] = cast(raw)
+        except ValueError:
+            continue
+    return mapping
+
+class _Request:
+    __slots__ = (
+        "ticket", "provider", "model", "tenant", "priority", "cost_key", "start", "finish", "enqueued_at", "granted", "owner",
+    )
+
+    def __init__(
+        self, ticket: int, provider: str, model: str, tenant: str, priority: int, cost_key: str, start: float, finish: float,
+        owner: Optional[int] = None,
+    ):
+        self.ticket = ticket
+        self.owner = owner
+        self.provider = provider
+        self.model = model
+        self.tenant = tenant
+        self.priority = priority
+        self.cost_key = cost_key
+        self.start = start
+        self.finish = finish
+        self.enqueued_at = time.time()
+        self.granted = False
+
+class _ProviderQueue:
+    def __init__(self, slots: int, batching: bool = False):
+        self.slots = slots
+        self.running: Dict[int, _Request] = {}
+        self.waiting: Dict[int, _Request] = {}
+        self.virtual_time = 0.0
+        # 租戶 -> 最後一個請求的虛擬完成時間
+        self.tenant_finish: Dict[str, float] = {}
+        # 批次模式：目前分配調用的模型與連續分配的調用數
+        self.batching = batching
+        self.resident: Optional[str] = None
+        self.batch_count = 0
+
+class LLMScheduler:
+    """
+    按提供者限制同時調用數的加權公平排隊
+
+    調用方以 enqueue() 取得號碼牌，wait() 等待獲得調用名額（可分段等待以便檢查取消），
+    調用結束（或放棄等待）時以 release() 歸還，並回報調用耗時以更新成本估計
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[Dict[str, int]] = None,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        aging: Optional[float] = None,
+        batch_providers: Optional[Tuple[str, ...]] = None,
+        batch_limit: Optional[int] = None,
+    ):
+        if batch_providers is None:
+            batch_providers = BATCH_PROVIDERS if is_local_batch_enabled() else ()
+        if concurrency is None:
+            defaults = dict(DEFAULT_CONCURRENCY)
+            if "ollama" in batch_providers:
+                # 批次模式讓同一模型的調用並行，用滿 Ollama 的並行數
+                try:
+                    defaults["ollama"] = int(os.getenv(OLLAMA_PARALLEL_ENV, DEFAULT_OLLAMA_PARALLEL))
+                except ValueError:
+                    defaults["ollama"] = DEFAULT_OLLAMA_PARALLEL
+            concurrency = dict(defaults, **_parse_mapping(os.getenv(CONCURRENCY_ENV), int))
+        if tenant_weights is None:
+            tenant_weights = _parse_mapping(os.getenv(TENANT_WEIGHTS_ENV), float)
+        if aging is None:
+            try:
+                aging = float(os.getenv(AGING_ENV, DEFAULT_AGING))
+            except ValueError:
+                aging = DEFAULT_AGING
+        self.concurrency = concurrency
+        self.tenant_weights = tenant_weights
+        self.aging = aging
+        self.batch_providers = tuple(batch_providers)
+        if batch_limit is None:
+            try:
+                batch_limit = int(os.getenv(BATCH_LIMIT_ENV, DEFAULT_BATCH_LIMIT))
+            except ValueError:
+                batch_limit = DEFAULT_BATCH_LIMIT
+        self.batch_limit = max(1, batch_limit)
+        # 成本鍵（提供者:Agent）-> 調用耗時的移動平均（秒）
+        self.costs: Dict[str, float] = {}
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._requests: Dict[int, _Request] = {}
+        self._next_ticket = 1
+        self._condition = threading.Condition()
+
+    def _queue(self, provider: str) -> _ProviderQueue:
+        queue = self._queues.get(provider)
+        if queue is None:
+            slots = self.concurrency.get(provider, DEFAULT_PROVIDER_CONCURRENCY)
+            queue = self._queues[provider] = _ProviderQueue(max(1, slots), provider in self.batch_providers)
+        return queue
+
+    def _effective_priority(self, request: _Request, now: float) -> int:
+        if self.aging <= 0:
+            return request.priority
+        return max(0, request.priority - int((now - request.enqueued_at) / self.aging))
+
+    def _pick(self, queue: _ProviderQueue, now: float) -> Optional[_Request]:
+        """
+        選出下一個獲得名額的請求；批次模式下返回 None 表示等待目前模型的調用結束後再切換模型
+
+        批次模式優先分配目前模型的請求，直到沒有該模型的請求、連續分配達到上限，
+        或其他模型有優先級更高的請求；連續分配的上限與切換前的等待只在有其他模型的請求排隊時生效，
+        切換模型前等待目前模型的調用全部結束
+        """
+        def order(item: _Request):
+            return (self._effective_priority(item, now), item.finish, item.ticket)
+
+        best = min(queue.waiting.values(), key=order)
+        if not queue.batching or queue.resident is None:
+            return best
+        same = [item for item in queue.waiting.values() if item.model == queue.resident]
+        others = [item for item in queue.waiting.values() if item.model != queue.resident]
+        if not others:
+            return best
+        if same:
+            best_same = min(same, key=order)
+            if queue.batch_count < self.batch_limit and order(best_same)[0] <= order(best)[0]:
+                return best_same
+        if queue.running:
+            return None
+        return min(others, key=order)
+
+    def _grant(self, queue: _ProviderQueue):
+        """把空出的名額分配給優先級最高、虛擬完成時間最早的等待請求"""
+        now = time.time()
+        granted = False
+        while queue.waiting and len(queue.running) < queue.slots:
+            request = self._pick(queue, now)
+            if request is None:
+                break
+            if request.model != queue.resident:
+                queue.resident, queue.batch_count = request.model, 0
+            queue.batch_count += 1
+            del queue.waiting[request.ticket]
+            queue.running[request.ticket] = request
+            request.granted = True
+            # 開始服務的請求的虛擬開始時間即為系統虛擬時間（start-time fair queuing）
+            queue.virtual_time = max(queue.virtual_time, request.start)
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def enqueue(
+        self,
+        provider: str,
+        tenant: str = DEFAULT_TENANT,
+        priority: int = PRIORITIES["normal"],
+        cost_key: str = "",
+        model: str = "",
+        owner: Optional[int] = None,
+    ) -> int:
+        """排入一個調用請求（model 用於批次模式的分組，owner 為調用方的程序 ID），返回號碼牌"""
+        with self._condition:
+            queue = self._queue(provider)
+            cost = self.costs.get(cost_key, DEFAULT_COST)
+            weight = max(self.tenant_weights.get(tenant, 1.0), 0.01)
+            start = max(queue.virtual_time, queue.tenant_finish.get(tenant, 0.0))
+            finish = start + cost / weight
+            queue.tenant_finish[tenant] = finish
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            request = _Request(ticket, provider, model, tenant, priority, cost_key, start, finish, owner)
+            self._requests[ticket] = request
+            queue.waiting[ticket] = request
+            self._grant(queue)
+            return ticket
+
+    def wait(self, ticket: int, timeout: Optional[float] = None) -> bool:
+        """等待獲得調用名額，返回是否已獲得（號碼牌不存在時返回 True，不阻擋調用）"""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: ticket not in self._requests or self._requests[ticket].granted, timeout
+            )
+            request = self._requests.get(ticket)
+            return request is None or request.granted
+
+    def release(self, ticket: int, elapsed: Optional[float] = None):
+        """歸還名額或放棄等待；elapsed 為實際調用耗時（秒），用於更新該 Agent 的成本估計"""
+        with self._condition:
+            request = self._requests.pop(ticket, None)
+            if request is None:
+                return
+            queue = self._queue(request.provider)
+            queue.running.pop(ticket, None)
+            queue.waiting.pop(ticket, None)
+            if elapsed is not None and request.granted:
+                previous = self.costs.get(request.cost_key)
+                self.costs[request.cost_key] = (
+                    elapsed if previous is None else previous + COST_EMA_ALPHA * (elapsed - previous)
+                )
+            self._grant(queue)
+
+    def release_owner(self, owner: int) -> int:
+        """歸還已結束的程序持有或等待中的所有號碼牌（不更新成本估計），返回歸還的數量"""
+        with self._condition:
+            tickets = [ticket for ticket, request in self._requests.items() if request.owner == owner]
+            providers = {self._requests[ticket].provider for ticket in tickets}
+            for ticket in tickets:
+                request = self._requests.pop(ticket)
+                queue = self._queue(request.provider)
+                queue.running.pop(ticket, None)
+                queue.waiting.pop(ticket, None)
+            for provider in providers:
+                self._grant(self._queue(provider))
+        if tickets:
+            logger.warning(f"已歸還已結束的程序 {owner} 的 {len(tickets)} 個 LLM 排程名額")
+        return len(tickets)
+
+    def stats(self) -> Dict[str, Dict]:
+        """各提供者的名額、執行中與等待中的請求數"""
+        with self._condition:
+            return {
+                provider: {
+                    "slots": queue.slots,
+                    "running": len(queue.running),
+                    "waiting": len(queue.waiting),
+                    "waiting_by_tenant": _count_by_tenant(queue.waiting.values()),
+                    "resident_model": queue.resident if queue.batching else None,
+                }
+                for provider, queue in self._queues.items()
+            }
+
+def _count_by_tenant(requests) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for request in requests:
+        counts[request.tenant] = counts.get(request.tenant, 0) + 1
+    return counts
+
+# ---------------------------------------------------------------------------
+# 跨程序共用（HTTP 任務服務）
+# ---------------------------------------------------------------------------
+
+# 全局實例（本程序的排程器、共用排程器的代理）
+_scheduler: Optional[LLMScheduler] = None
+_remote = None
+_remote_lock = threading.Lock()
+# 本程序提供的共用排程器位址（本程序內直接使用本地實例）
+_served_address: Optional[str] = None
+
+class _SchedulerManager(BaseManager):
+    pass
+
+def _local_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
+
+_SchedulerManager.register("get_scheduler", callable=_local_scheduler)
+
+def serve_scheduler(host: str = "127.0.0.1") -> str:
+    """
+    在本程序的背景線程中提供共用的排程器（worker 程序以 multiprocessing 的 authkey 驗證）
+
+    Returns:
+        位址（host:port），設定到 worker 程序的 KANO_SCHEDULER_ADDRESS
+    """
+    global _served_address
+    manager = _SchedulerManager(address=(host, 0), authkey=multiprocessing.current_process().authkey)
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, name="kano-scheduler", daemon=True).start()
+    address = _served_address = "%s:%d" % server.address
+    logger.info(f"✓ 共用 LLM 排程器已啟動：{address}")
+    return address
+
+def _connect_scheduler(address: str):
+    host, _, port = address.rpartition(":")
+    manager = _SchedulerManager(address=(host, int(port)), authkey=multiprocessing.current_process().authkey)
+    manager.connect()
+    return manager.get_scheduler()
+
+# ---------------------------------------------------------------------------
+# 執行上下文與調用掛鉤
+# ---------------------------------------------------------------------------
+
+_run_context: Optional[Tuple[str, str]] = None
+
+def get_llm_scheduler():
+    """獲取排程器（設定了 KANO_SCHEDULER_ADDRESS 時為共用排程器的代理）"""
+    global _remote
+    address = os.getenv(SCHEDULER_ADDRESS_ENV)
+    if not address or address == _served_address:
+        return _local_scheduler()
+    with _remote_lock:
+        if _remote is None:
+            _remote = _connect_scheduler(address)
+        return _remote
+
+def set_run_context(tenant: Optional[str] = None, priority: Optional[str] = None):
+    """設定本程序之後的調用所屬的租戶與執行優先級（未設定時使用 KANO_TENANT / KANO_RUN_PRIORITY）"""
+    global _run_context
+    _run_context = (tenant or os.getenv(TENANT_ENV) or DEFAULT_TENANT, priority or os.getenv(RUN_PRIORITY_ENV) or "normal")
+
+def get_run_context() -> Tuple[str, str]:
+    """（租戶, 執行優先級）"""
+    if _run_context is None:
+        set_run_context()
+    return _run_context
+
+def install_scheduler(llm, agent_key: str, model: Optional[str] = None, llm_type: Optional[str] = None, priority: str = "normal") -> bool:
+    """
+    讓 LLM 實例的調用經過排程器（KANO_SCHEDULER=1 時）
+
+    Args:
+        llm: LLM 實例
+        agent_key: Agent 配置鍵（成本估計按 Agent 分開記錄）
+        model / llm_type: 用於判斷提供者
+        priority: 階段（Agent）的優先級（high / normal / low）
+    """
+    if not is_scheduler_enabled():
+        return False
+    provider = get_provider_name(model, llm_type)
+    stage_priority = priority_value(priority)
+    cost_key = f"{provider}:{agent_key}"
+
+    def scheduler_hook(llm, call_next, *args, **kwargs):
+        tenant, run_priority = get_run_context()
+        try:
+            scheduler = get_llm_scheduler()
+            ticket = scheduler.enqueue(
+                provider, tenant, priority_value(run_priority) + stage_priority, cost_key, model or "", os.getpid(),
+            )
+        except Exception as e:
+            logger.warning(f"無法連線到 LLM 排程器，不排隊直接調用: {e}")
+            return call_next(*args, **kwargs)
+        started = None
+        try:
+            waited = time.time()
+            if not scheduler.wait(ticket, 0):
+                token = get_cancel_token()
+                with get_tracer().span("排程等待", cat="scheduler", agent=agent_key, provider=provider, tenant=tenant):
+                    while not scheduler.wait(ticket, POLL_INTERVAL):
+                        token.raise_if_cancelled()
+            get_api_logger().record_latency(
+                METRIC_SCHEDULER_WAIT, time.time() - waited, agent=agent_key, model=model, provider=provider,
+            )
+            started = time.time()
+            return call_next(*args, **kwargs)
+        finally:
+            try:
+                scheduler.release(ticket, time.time() - started if started is not None else None)
+            except Exception as e:
+                logger.debug(f"歸還 LLM 排程名額失敗: {e}")
+
+    return install_call_hook(llm, scheduler_hook, "scheduler")
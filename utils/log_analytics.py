@@ -0,0 +1,381 @@
+"""
+API 調用日誌分析
+以生成器管線串流讀取 api_calls.log（JSON lines）與 export_to_json() 導出的報告，
+常數記憶體完成聚合查詢，並可建立小型的磁碟索引供重複查詢使用
+
+使用方式：
+    python analyze_logs.py summary output/api_calls.log
+    python analyze_logs.py slowest --top 5 output/api_calls.log
+    python analyze_logs.py retry-rate --index output/api_calls.log
+"""
+import os
+import sys
+import json
+import heapq
+import argparse
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .latency_histogram import LatencyHistogram
+from .retry_handler import classify_error
+
+# 讀取導出 JSON 時的區塊大小
+CHUNK_SIZE = 1 << 16
+
+# 索引中每個 Agent 保留的最慢調用數量
+INDEX_TOP_N = 20
+
+INDEX_VERSION = 1
+
+# ============================================================================
+# 讀取（生成器）
+# ============================================================================
+
+def iter_jsonl(path: str, start_offset: int = 0) -> Iterator[tuple]:
+    """
+    逐行讀取 JSON lines 檔案
+
+    Yields:
+        (記錄, 該行結束後的檔案位移)
+    """
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        offset = start_offset
+        for raw in f:
+            # 最後一行可能仍在寫入中，沒有換行符號時不處理
+            if not raw.endswith(b"\n"):
+                break
+            offset += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line), offset
+            except json.JSONDecodeError:
+                continue
+
+def iter_export_calls(path: str) -> Iterator[Dict]:
+    """串流讀取 export_to_json() 報告中的 "calls" 陣列（不把整個檔案載入記憶體）"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        # 定位 "calls": [ 的位置
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+            key_index = buffer.find('"calls"')
+            if key_index < 0:
+                buffer = buffer[-8:]
+                continue
+            bracket_index = buffer.find("[", key_index)
+            if bracket_index < 0:
+                buffer = buffer[key_index:]
+                continue
+            buffer = buffer[bracket_index + 1:]
+            break
+
+        # 逐個解碼陣列元素
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+def _is_export_file(path: str) -> bool:
+    """判斷檔案是 export_to_json() 的報告還是 JSON lines"""
+    if path.endswith(".json"):
+        return True
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(64).lstrip()
+    return head.startswith("{") and '"calls"' in head
+
+def iter_calls(path: str) -> Iterator[Dict]:
+    """讀取任一格式的調用記錄"""
+    if _is_export_file(path):
+        yield from iter_export_calls(path)
+    else:
+        for record, _ in iter_jsonl(path):
+            yield record
+
+# ============================================================================
+# 管線處理
+# ============================================================================
+
+def enrich(records: Iterable[Dict]) -> Iterator[Dict]:
+    """補充衍生欄位：hour（YYYY-MM-DDTHH）與 error_class"""
+    for record in records:
+        record["hour"] = (record.get("timestamp") or "")[:13] or "unknown"
+        error = record.get("error")
+        record["error_class"] = classify_error(error) if error else None
+        yield record
+
+def filter_calls(records: Iterable[Dict], agent: Optional[str] = None, since: Optional[str] = None) -> Iterator[Dict]:
+    """按 Agent 與起始時間（ISO 格式字串比較）過濾"""
+    for record in records:
+        if agent and record.get("agent") != agent:
+            continue
+        if since and (record.get("timestamp") or "") < since:
+            continue
+        yield record
+
+class CallAggregates:
+    """可序列化的聚合結果（大小只與 Agent / 小時 / 任務的數量有關，與日誌大小無關）"""
+
+    def __init__(self, top_n: int = INDEX_TOP_N):
+        self.top_n = top_n
+        self.slowest: Dict[str, List] = defaultdict(list)   # agent -> 最小堆 [(duration, seq, 摘要)]
+        self.by_hour: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.by_task: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)       # "provider|error_class" -> 次數
+        self.latency: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self._seq = 0
+
+    def update(self, record: Dict):
+        status = record.get("status") or "unknown"
+        agent = record.get("agent") or "unknown"
+        hour_stats = self.by_hour[record.get("hour", "unknown")]
+        hour_stats["total"] += 1
+        hour_stats[status] += 1
+
+        task_stats = self.by_task[record.get("task") or "unknown"]
+        task_stats["calls"] += 1
+        task_stats["tokens"] += record.get("tokens_used") or 0
+
+        if record.get("error_class"):
+            provider = record.get("provider") or "unknown"
+            self.errors[f"{provider}|{record['error_class']}"] += 1
+
+        duration = record.get("duration")
+        if duration is not None and status in ("success", "error"):
+            self.latency[agent].record(duration)
+            self._seq += 1
+            entry = (duration, self._seq, {
+                "timestamp": record.get("timestamp"),
+                "model": record.get("model"),
+                "task": record.get("task"),
+                "status": status,
+            })
+            heap = self.slowest[agent]
+            if len(heap) < self.top_n:
+                heapq.heappush(heap, entry)
+            elif duration > heap[0][0]:
+                heapq.heapreplace(heap, entry)
+
+    def consume(self, records: Iterable[Dict]) -> "CallAggregates":
+        for record in records:
+            self.update(record)
+        return self
+
+    def to_dict(self) -> Dict:
+        return {
+            "top_n": self.top_n,
+            "slowest": {agent: [list(e) for e in heap] for agent, heap in self.slowest.items()},
+            "by_hour": {k: dict(v) for k, v in self.by_hour.items()},
+            "by_task": {k: dict(v) for k, v in self.by_task.items()},
+            "errors": dict(self.errors),
+            "latency": {agent: hist.to_dict() for agent, hist in self.latency.items()},
+            "seq": self._seq,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CallAggregates":
+        aggregates = cls(top_n=data.get("top_n", INDEX_TOP_N))
+        for agent, heap in data.get("slowest", {}).items():
+            aggregates.slowest[agent] = [tuple(e) for e in heap]
+            heapq.heapify(aggregates.slowest[agent])
+        for hour, stats in data.get("by_hour", {}).items():
+            aggregates.by_hour[hour].update(stats)
+        for task, stats in data.get("by_task", {}).items():
+            aggregates.by_task[task].update(stats)
+        aggregates.errors.update(data.get("errors", {}))
+        for agent, hist in data.get("latency", {}).items():
+            aggregates.latency[agent] = LatencyHistogram.from_dict(hist)
+        aggregates._seq = data.get("seq", 0)
+        return aggregates
+
+# ============================================================================
+# 磁碟索引
+# ============================================================================
+
+def index_path_for(path: str) -> str:
+    return path + ".idx.json"
+
+def load_or_build_index(path: str) -> CallAggregates:
+    """
+    讀取或建立索引
+
+    - JSON lines 日誌只會追加，索引記錄已處理的位移，下次只讀取新增部分
+    - 導出的 JSON 報告在大小或修改時間變化時重建
+    """
+    stat = os.stat(path)
+    index_file = index_path_for(path)
+    is_export = _is_export_file(path)
+    index = None
+    if os.path.exists(index_file):
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            index = None
+    if index and index.get("version") != INDEX_VERSION:
+        index = None
+
+    if is_export:
+        if index and index.get("size") == stat.st_size and index.get("mtime") == stat.st_mtime:
+            return CallAggregates.from_dict(index["aggregates"])
+        aggregates = CallAggregates().consume(enrich(iter_export_calls(path)))
+        offset = stat.st_size
+    else:
+        offset = 0
+        aggregates = CallAggregates()
+        # 檔案被截斷或旋轉時重建
+        if index and index.get("offset", 0) <= stat.st_size:
+            offset = index["offset"]
+            aggregates = CallAggregates.from_dict(index["aggregates"])
+        if offset == stat.st_size and index:
+            return aggregates
+
+        def records():
+            nonlocal offset
+            for record, end in iter_jsonl(path, offset):
+                offset = end
+                yield record
+        aggregates.consume(enrich(records()))
+
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": INDEX_VERSION,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "offset": offset,
+            "aggregates": aggregates.to_dict(),
+        }, f, ensure_ascii=False)
+    return aggregates
+
+# ============================================================================
+# 報表
+# ============================================================================
+
+def _fmt(value: Optional[float]) -> str:
+    return f"{value:.2f}s" if value is not None else "-"
+
+def report_slowest(aggregates: CallAggregates, top: int):
+    print(f"\n最慢的調用（每個 Agent 前 {top} 筆）:")
+    for agent, heap in sorted(aggregates.slowest.items()):
+        print(f"  {agent}:")
+        for duration, _, info in sorted(heap, key=lambda e: -e[0])[:top]:
+            print(f"    {duration:8.2f}s  {info.get('timestamp')}  {info.get('model')}  {info.get('task') or '-'}  {info.get('status')}")
+
+def report_retry_rate(aggregates: CallAggregates):
+    print("\n每小時重試率:")
+    print(f"  {'小時':<16} {'總數':>6} {'重試':>6} {'失敗':>6} {'重試率':>8}")
+    for hour, stats in sorted(aggregates.by_hour.items()):
+        total = stats.get("total", 0)
+        retry = stats.get("retry", 0)
+        rate = retry / total * 100 if total else 0.0
+        print(f"  {hour:<16} {total:>6} {retry:>6} {stats.get('error', 0):>6} {rate:>7.1f}%")
+
+def report_tokens(aggregates: CallAggregates):
+    print("\n各階段 Token 使用量:")
+    for task, stats in sorted(aggregates.by_task.items()):
+        print(f"  {task:<24} 調用 {stats.get('calls', 0):>5} 次  Tokens {stats.get('tokens', 0):>10}")
+
+def report_errors(aggregates: CallAggregates):
+    print("\n錯誤類型分佈:")
+    if not aggregates.errors:
+        print("  （無錯誤）")
+    for key, count in sorted(aggregates.errors.items(), key=lambda item: -item[1]):
+        provider, error_class = key.split("|", 1)
+        print(f"  {provider:<12} {error_class:<18} {count:>6}")
+
+def report_latency(aggregates: CallAggregates):
+    print("\n調用延遲（p50 / p95 / p99 / max）:")
+    for agent, hist in sorted(aggregates.latency.items()):
+        summary = hist.summary()
+        print(
+            f"  {agent:<24} n={summary['count']:<6} {_fmt(summary['p50'])} / {_fmt(summary['p95'])} / "
+            f"{_fmt(summary['p99'])} / {_fmt(summary['max'])}"
+        )
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="分析 KanoAgent 的 API 調用日誌（api_calls.log / api_calls.json）")
+    parser.add_argument(
+        "query",
+        choices=["summary", "slowest", "retry-rate", "tokens", "errors", "latency"],
+        help="查詢類型",
+    )
+    parser.add_argument("files", nargs="*", default=["output/api_calls.log"], help="日誌檔案（可多個）")
+    parser.add_argument("--top", type=int, default=10, help="slowest 查詢顯示的筆數")
+    parser.add_argument("--agent", help="只分析指定的 Agent")
+    parser.add_argument("--since", help="只分析此時間之後的記錄（ISO 格式，例如 2025-01-01T08）")
+    parser.add_argument("--index", action="store_true", help="建立或使用 <檔案>.idx.json 索引（不可與過濾條件同時使用）")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_intermixed_args(argv)
+    use_index = args.index and not (args.agent or args.since)
+    if args.index and not use_index:
+        print("⚠️  索引不包含過濾條件，本次將直接串流讀取日誌", file=sys.stderr)
+
+    merged = CallAggregates(top_n=max(args.top, INDEX_TOP_N) if use_index else args.top)
+    for path in args.files:
+        if not os.path.exists(path):
+            print(f"❌ 找不到檔案: {path}", file=sys.stderr)
+            return 1
+        if use_index:
+            part = load_or_build_index(path)
+        else:
+            part = CallAggregates(top_n=args.top).consume(
+                filter_calls(enrich(iter_calls(path)), agent=args.agent, since=args.since)
+            )
+        _merge_into(merged, part)
+
+    reports = {
+        "slowest": lambda: report_slowest(merged, args.top),
+        "retry-rate": lambda: report_retry_rate(merged),
+        "tokens": lambda: report_tokens(merged),
+        "errors": lambda: report_errors(merged),
+        "latency": lambda: report_latency(merged),
+    }
+    if args.query == "summary":
+        for report in reports.values():
+            report()
+    else:
+        reports[args.query]()
+    return 0
+
+def _merge_into(target: CallAggregates, source: CallAggregates):
+    """合併多個檔案的聚合結果"""
+    for agent, heap in source.slowest.items():
+        for duration, _, info in heap:
+            target._seq += 1
+            entry = (duration, target._seq, info)
+            bucket = target.slowest[agent]
+            if len(bucket) < target.top_n:
+                heapq.heappush(bucket, entry)
+            elif duration > bucket[0][0]:
+                heapq.heapreplace(bucket, entry)
+    for hour, stats in source.by_hour.items():
+        for key, value in stats.items():
+            target.by_hour[hour][key] += value
+    for task, stats in source.by_task.items():
+        for key, value in stats.items():
+            target.by_task[task][key] += value
+    for key, value in source.errors.items():
+        target.errors[key] += value
+    for agent, hist in source.latency.items():
+        target.latency[agent].merge(hist)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,44 +1,116 @@
 """
 日誌配置模組
 配置統一的日誌系統，將所有日誌寫入 KanoAgent.log
+
+所有 logger 只掛載 QueueHandler，實際的檔案與控制台輸出由背景的 QueueListener 線程完成，
+避免 Agent 執行路徑上的日誌調用被磁碟 I/O、終端輸出或日誌旋轉阻塞
 """
+import atexit
+import json
 import logging
 import os
+import queue
+import threading
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Set
 
 # 日誌文件路徑
 LOG_FILE = "KanoAgent.log"
 LOG_DIR = "logs"
 
-def setup_logger(name: str = "KanoAgent", log_level: int = logging.INFO) -> logging.Logger:
-    """
-    設置統一的日誌記錄器
-    
-    Args:
-        name: Logger 名稱
-        log_level: 日誌級別（默認 INFO）
-    
-    Returns:
-        配置好的 Logger 實例
-    """
+# 環境變數：日誌格式（"text" 或 "json"，json 為每行一個 JSON 物件）
+LOG_FORMAT_ENV = "KANO_LOG_FORMAT"
+# 環境變數：按模組採樣 INFO 及以下級別的日誌，例如 "crew_advanced=0.2,KanoAgent=1"
+LOG_SAMPLING_ENV = "KANO_LOG_SAMPLING"
+
+# LogRecord 的標準屬性（JSON 輸出時，其餘屬性視為 extra 結構化欄位）
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonLinesFormatter(logging.Formatter):
+    """將日誌格式化為單行 JSON（包含 logger.info(..., extra={...}) 傳入的欄位）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """按比例保留 INFO 及以下級別的日誌（WARNING 及以上一律保留）"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = min(max(rate, 0.0), 1.0)
+        self._credit = 0.0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        # 以累積額度代替隨機數，使採樣結果均勻且可預期
+        with self._lock:
+            self._credit += self.rate
+            if self._credit >= 1.0:
+                self._credit -= 1.0
+                return True
+        return False
+
+def get_sampling_rates() -> Dict[str, float]:
+    """從環境變數讀取各模組的採樣比例"""
+    rates = {}
+    for item in os.getenv(LOG_SAMPLING_ENV, "").split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+# 控制台暫時不輸出的線程名稱（例如問卷填寫期間的背景預熱；日誌仍寫入檔案）
+_muted_console_threads: Set[str] = set()
+
+class MutedThreadFilter(logging.Filter):
+    """過濾暫時不在控制台輸出的線程的日誌"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.threadName not in _muted_console_threads
+
+def mute_console_thread(thread_name: str, muted: bool = True):
+    """暫停 / 恢復指定線程的日誌在控制台輸出（例如避免與終端問卷的輸入提示交錯）"""
+    if muted:
+        _muted_console_threads.add(thread_name)
+    else:
+        _muted_console_threads.discard(thread_name)
+
+# 全局日誌隊列與監聽線程
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+
+def _create_sink_handlers(log_level: int):
+    """創建實際輸出的 handlers（只由監聽線程調用）"""
     # 確保日誌目錄存在
     os.makedirs(LOG_DIR, exist_ok=True)
-    
-    # 創建 logger
-    logger = logging.getLogger(name)
-    logger.setLevel(log_level)
-    
-    # 避免重複添加 handler
-    if logger.handlers:
-        return logger
-    
+
     # 創建格式器
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    
+    file_formatter = JsonLinesFormatter() if os.getenv(LOG_FORMAT_ENV, "text").lower() == "json" else formatter
+
     # 文件 handler（旋轉日誌，最大10MB，保留5個備份）
     log_file_path = os.path.join(LOG_DIR, LOG_FILE)
     file_handler = RotatingFileHandler(
@@ -48,17 +120,81 @@ def setup_logger(name: str = "KanoAgent", log_level: int = logging.INFO) -> logg
         encoding='utf-8'
     )
     file_handler.setLevel(log_level)
-    file_handler.setFormatter(formatter)
-    
-    # 控制台 handler（只顯示 INFO 及以上級別）
+    file_handler.setFormatter(file_formatter)
+
+    # 控制台 handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(log_level)
     console_handler.setFormatter(formatter)
-    
-    # 添加 handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+    console_handler.addFilter(MutedThreadFilter())
+
+    return file_handler, console_handler
+
+def _ensure_listener(log_level: int):
+    """
+    啟動背景日誌監聽線程（只啟動一次）
+
+    監聽線程已啟動時，若要求的級別較低則降低檔案與控制台 handler 的級別
+    （各 logger 仍按自身的級別過濾，較低的 handler 級別只影響要求了該級別的 logger）
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            for handler in _listener.handlers:
+                if handler.level > log_level:
+                    handler.setLevel(log_level)
+            return
+        _listener = QueueListener(
+            _log_queue,
+            *_create_sink_handlers(log_level),
+            respect_handler_level=True,
+        )
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """停止監聽線程並寫出隊列中剩餘的日誌"""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def setup_logger(name: str = "KanoAgent", log_level: int = logging.INFO) -> logging.Logger:
+    """
+    設置統一的日誌記錄器
+
+    Args:
+        name: Logger 名稱
+        log_level: 日誌級別（默認 INFO）
+
+    Returns:
+        配置好的 Logger 實例
+    """
+    # 創建 logger
+    logger = logging.getLogger(name)
+    logger.setLevel(log_level)
+
+    _ensure_listener(log_level)
+
+    # 避免重複添加 handler（重複設置時更新隊列 handler 的級別）
+    if logger.handlers:
+        for handler in logger.handlers:
+            if isinstance(handler, QueueHandler):
+                handler.setLevel(log_level)
+        return logger
+
+    # 只掛載 QueueHandler，調用方只需把記錄放入隊列
+    queue_handler = QueueHandler(_log_queue)
+    queue_handler.setLevel(log_level)
+    rate = get_sampling_rates().get(name)
+    if rate is not None:
+        queue_handler.addFilter(SamplingFilter(rate))
+    logger.addHandler(queue_handler)
+
     return logger
 
 def get_logger(name: str = "KanoAgent") -> logging.Logger:
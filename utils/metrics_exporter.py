@@ -0,0 +1,174 @@
+"""
+監控指標導出
+以 Prometheus 文字格式在程序內提供 /metrics 端點（基於 APILogger 的聚合數據，不依賴外部服務）
+
+延遲直方圖按各維度分別聚合，每個維度導出為獨立的指標（例如 kano_llm_call_latency_seconds 為全部調用，
+kano_llm_call_latency_by_agent_seconds{agent="..."} 按 Agent），同一指標內的序列不重複計算同一次調用
+"""
+import os
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from .api_logger import (
+    APILogger,
+    get_api_logger,
+    LATENCY_DIMENSIONS,
+    METRIC_CALL_LATENCY,
+    METRIC_TTFT,
+    METRIC_BACKOFF_WAIT,
+    METRIC_SCHEDULER_WAIT,
+)
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：設定後自動啟動 /metrics 端點
+METRICS_PORT_ENV = "KANO_METRICS_PORT"
+METRICS_HOST_ENV = "KANO_METRICS_HOST"
+
+# Prometheus 直方圖的累積分桶邊界（秒）
+PROMETHEUS_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+
+# 直方圖指標名稱
+HISTOGRAM_METRICS = {
+    METRIC_CALL_LATENCY: ("kano_llm_call_latency_seconds", "LLM 調用端到端延遲"),
+    METRIC_TTFT: ("kano_llm_time_to_first_token_seconds", "LLM 首 Token 延遲"),
+    METRIC_BACKOFF_WAIT: ("kano_llm_backoff_wait_seconds", "重試退避等待時間"),
+    METRIC_SCHEDULER_WAIT: ("kano_llm_scheduler_wait_seconds", "在 LLM 排程器中等待調用名額的時間"),
+}
+
+def _escape(value) -> str:
+    """轉義 Prometheus 標籤值"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(**labels) -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels.items() if value is not None]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def render_prometheus(api_logger: Optional[APILogger] = None) -> str:
+    """
+    將 APILogger 的聚合數據渲染為 Prometheus 文字格式
+
+    Args:
+        api_logger: API 日誌記錄器（預設使用全局實例）
+
+    Returns:
+        Prometheus exposition format 文字
+    """
+    api_logger = api_logger or get_api_logger()
+    counters = api_logger.get_counters()
+    lines: List[str] = []
+
+    lines.append("# HELP kano_llm_requests_total LLM 調用次數（按狀態）")
+    lines.append("# TYPE kano_llm_requests_total counter")
+    for (agent, model, provider, status), count in sorted(counters["requests"].items(), key=str):
+        if status == "initialized":
+            # 建立 LLM 實例的記錄，不是調用
+            continue
+        lines.append(f"kano_llm_requests_total{_labels(agent=agent, model=model, provider=provider, status=status)} {count}")
+
+    lines.append("# HELP kano_llm_errors_total LLM 錯誤次數（按錯誤類型）")
+    lines.append("# TYPE kano_llm_errors_total counter")
+    for (provider, error_class), count in sorted(counters["errors"].items(), key=str):
+        lines.append(f"kano_llm_errors_total{_labels(provider=provider, error_class=error_class)} {count}")
+
+    lines.append("# HELP kano_llm_tokens_total LLM Token 使用量")
+    lines.append("# TYPE kano_llm_tokens_total counter")
+    for (agent, model, provider), count in sorted(counters["tokens"].items(), key=str):
+        lines.append(f"kano_llm_tokens_total{_labels(agent=agent, model=model, provider=provider)} {count}")
+
+    gauges: Dict[str, float] = counters["gauges"]
+    for name, help_text in (("active_crews", "執行中的 Crew 數量"), ("queue_depth", "等待執行的任務數量")):
+        lines.append(f"# HELP kano_{name} {help_text}")
+        lines.append(f"# TYPE kano_{name} gauge")
+        lines.append(f"kano_{name} {gauges.get(name, 0)}")
+
+    histograms = api_logger.get_latency_histograms()
+    for metric, (metric_name, help_text) in HISTOGRAM_METRICS.items():
+        by_dimension = histograms.get(metric)
+        if not by_dimension:
+            continue
+        for dimension in ("all",) + LATENCY_DIMENSIONS:
+            by_label = by_dimension.get(dimension)
+            if not by_label:
+                continue
+            if dimension == "all":
+                name, help_suffix = metric_name, ""
+            else:
+                name, help_suffix = metric_name.replace("_seconds", f"_by_{dimension}_seconds"), f"（按 {dimension}）"
+            lines.append(f"# HELP {name} {help_text}{help_suffix}")
+            lines.append(f"# TYPE {name} histogram")
+            for label, hist in sorted(by_label.items()):
+                base = {} if dimension == "all" else {dimension: label}
+                for bound in PROMETHEUS_BUCKETS:
+                    lines.append(f"{name}_bucket{_labels(**base, le=bound)} {hist.count_at_or_below(bound)}")
+                lines.append(f"{name}_bucket{_labels(**base, le='+Inf')} {hist.total_count}")
+                lines.append(f"{name}_sum{_labels(**base)} {hist.total_seconds}")
+                lines.append(f"{name}_count{_labels(**base)} {hist.total_count}")
+
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """/metrics 請求處理器"""
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        try:
+            body = render_prometheus().encode("utf-8")
+        except Exception as e:
+            logger.error(f"渲染監控指標失敗: {e}")
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取請求很頻繁，不寫入主日誌
+        logger.debug("metrics: " + format % args)
+
+# 全局實例
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    在背景線程中啟動 /metrics 端點（重複調用返回同一個服務）
+
+    Args:
+        port: 監聽埠
+        host: 監聽位址（預設只監聽本機）
+    """
+    global _metrics_server
+    if _metrics_server is not None:
+        return _metrics_server
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="kano-metrics", daemon=True)
+    thread.start()
+    _metrics_server = server
+    logger.info(f"監控指標端點已啟動：http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+def start_metrics_server_from_env() -> Optional[ThreadingHTTPServer]:
+    """如果設定了 KANO_METRICS_PORT，則啟動 /metrics 端點"""
+    port = os.getenv(METRICS_PORT_ENV)
+    if not port:
+        return None
+    try:
+        return start_metrics_server(int(port), os.getenv(METRICS_HOST_ENV, "127.0.0.1"))
+    except (ValueError, OSError) as e:
+        logger.warning(f"無法啟動監控指標端點（{METRICS_PORT_ENV}={port}）: {e}")
+        return None
+
+def stop_metrics_server():
+    """停止 /metrics 端點"""
+    global _metrics_server
+    if _metrics_server is not None:
+        _metrics_server.shutdown()
+        _metrics_server.server_close()
+        _metrics_server = None
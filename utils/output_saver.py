@@ -3,9 +3,86 @@
 自動保存每個 Agent 任務的輸出到單獨的文件
 """
 import os
-from typing import Dict, Any
+import json
+import threading
+from typing import Dict, Any, Optional
 from datetime import datetime
 
+from .tracing import traced
+from .stream_bus import TASK_START, CHUNK, TASK_END
+
+# 各階段任務的輸出名稱（依 Crew 任務順序）
+TASK_OUTPUT_NAMES = [
+    "01_需求澄清文檔",
+    "02_PRD需求規格書",
+    "03_UIUX設計方案",
+    "04_系統設計文件",
+    "05_程式碼實作",
+    "06_代碼評審報告",
+    "07_測試報告",
+]
+
+def _task_filename(task_name: str, output_dir: str, suffix: str = ".md") -> str:
+    """生成任務輸出檔案路徑（清理特殊字符）"""
+    safe_task_name = task_name.replace(" ", "_").replace("/", "_").replace("\\", "_")
+    return f"{output_dir}/{safe_task_name}{suffix}"
+
+def _output_header(task_name: str, agent_name: str) -> str:
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return f"""# {task_name}
+
+**Agent:** {agent_name}
+**生成時間:** {timestamp}
+
+---
+
+"""
+
+class PartialOutputWriter:
+    """
+    串流匯流排的訂閱者：在任務執行期間把 LLM 輸出逐段追加到 <任務名稱>.partial.md
+
+    任務完成後由 save_task_output() 寫出正式檔案並刪除對應的 partial 檔案
+    """
+
+    def __init__(self, output_dir: str = "output"):
+        self.output_dir = output_dir
+        self._files: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _open(self, task_name: str, agent_name: str):
+        os.makedirs(self.output_dir, exist_ok=True)
+        f = open(_task_filename(task_name, self.output_dir, ".partial.md"), "w", encoding="utf-8")
+        f.write(_output_header(task_name, agent_name or "Unknown"))
+        f.flush()
+        self._files[task_name] = f
+        return f
+
+    def __call__(self, event: Dict):
+        task_name = event.get("task")
+        if not task_name:
+            return
+        with self._lock:
+            if event["type"] == TASK_START:
+                if task_name not in self._files:
+                    self._open(task_name, event.get("agent"))
+            elif event["type"] == CHUNK:
+                f = self._files.get(task_name) or self._open(task_name, event.get("agent"))
+                f.write(event["text"])
+                f.flush()
+            elif event["type"] == TASK_END:
+                f = self._files.pop(task_name, None)
+                if f:
+                    f.close()
+
+    def close(self):
+        """關閉所有未完成的 partial 檔案（保留內容以便排查中斷的任務）"""
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+@traced(cat="output", arg_names=("task_name",))
 def save_task_output(task_name: str, agent_name: str, output: Any, output_dir: str = "output"):
     """
     保存任務輸出到文件
@@ -19,25 +96,18 @@ def save_task_output(task_name: str, agent_name: str, output: Any, output_dir: s
     os.makedirs(output_dir, exist_ok=True)
     
     # 生成文件名（使用任務名稱，清理特殊字符）
-    safe_task_name = task_name.replace(" ", "_").replace("/", "_").replace("\\", "_")
-    filename = f"{output_dir}/{safe_task_name}.md"
-    
-    # 添加時間戳和 Agent 信息
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    header = f"""# {task_name}
-
-**Agent:** {agent_name}
-**生成時間:** {timestamp}
-
----
-
-"""
+    filename = _task_filename(task_name, output_dir)
     
-    # 寫入文件
+    # 寫入文件（添加時間戳和 Agent 信息）
     with open(filename, "w", encoding="utf-8") as f:
-        f.write(header)
+        f.write(_output_header(task_name, agent_name))
         f.write(str(output))
     
+    # 正式輸出已保存，移除串流過程中的 partial 檔案
+    partial_file = _task_filename(task_name, output_dir, ".partial.md")
+    if os.path.exists(partial_file):
+        os.remove(partial_file)
+    
     return filename
 
 def save_all_task_outputs(crew_result: Any, output_dir: str = "output"):
@@ -80,6 +150,7 @@ def save_all_task_outputs(crew_result: Any, output_dir: str = "output"):
     
     return saved_files
 
+@traced(cat="output")
 def extract_and_save_task_outputs(crew_result: Any, crew: Any = None, output_dir: str = "output") -> Dict[str, str]:
     """
     從 Crew 結果中提取任務輸出並保存
@@ -96,15 +167,7 @@ def extract_and_save_task_outputs(crew_result: Any, crew: Any = None, output_dir
     
     # 方式 1: 從 crew 對象提取任務輸出（最可靠）
     if crew and hasattr(crew, 'tasks'):
-        task_names = [
-            "01_需求澄清文檔",
-            "02_PRD需求規格書",
-            "03_UIUX設計方案",
-            "04_系統設計文件",
-            "05_程式碼實作",
-            "06_代碼評審報告",
-            "07_測試報告",
-        ]
+        task_names = TASK_OUTPUT_NAMES
         
         for i, task in enumerate(crew.tasks):
             if hasattr(task, 'output') and task.output:
@@ -154,3 +217,22 @@ def extract_and_save_task_outputs(crew_result: Any, crew: Any = None, output_dir
         saved_outputs["Final_Result"] = filename
     
     return saved_outputs
+
+def save_checkpoint(crew: Any, output_dir: str = "output", reason: Optional[str] = None) -> Dict[str, str]:
+    """
+    保存已完成任務的輸出與檢查點摘要（執行被取消或中斷時調用）
+    
+    未完成任務的串流內容保留在 <任務名稱>.partial.md 中
+    
+    Returns:
+        Dict[str, str]: 已保存的 {task_name: file_path}
+    """
+    saved_outputs = extract_and_save_task_outputs(None, crew=crew, output_dir=output_dir) if crew else {}
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "checkpoint.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": datetime.now().isoformat(),
+            "reason": reason,
+            "completed_tasks": list(saved_outputs),
+        }, f, ensure_ascii=False, indent=2)
+    return saved_outputs
@@ -0,0 +1,47 @@
+"""
+有界並行執行
+在固定大小的線程池中並行執行多個 LLM 調用（例如分塊 Code Review 的 map 階段），
+每個工作保留調用方的 contextvars（取消與逾時監控依賴它），取消時不再啟動尚未開始的工作
+"""
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Callable, List, Sequence, TypeVar
+
+from .cancellation import get_cancel_token
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+def run_parallel(func: Callable[[T], R], items: Sequence[T], max_workers: int = 2, name: str = "worker") -> List[R]:
+    """
+    並行執行 func(item)，按輸入順序返回結果
+
+    任一工作拋出異常時取消尚未開始的工作並重新拋出該異常
+
+    Args:
+        func: 工作函數
+        items: 輸入列表
+        max_workers: 最大並行數
+        name: 線程名稱前綴（顯示於追蹤與日誌）
+    """
+    token = get_cancel_token()
+
+    def run(item):
+        token.raise_if_cancelled()
+        return func(item)
+
+    if max_workers <= 1 or len(items) <= 1:
+        return [run(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix=name) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, run, item) for item in items]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        return [future.result() for future in futures]
@@ -0,0 +1,168 @@
+"""
+問卷類別的預先摘要
+問卷各類別（業務背景、用戶需求、功能需求、非功能需求……）彼此獨立，
+使用者完成一個類別後立即在背景以廉價模型將其整理為需求澄清文檔的對應章節，與使用者繼續作答並行；
+需求澄清階段只需合併已完成的各類別章節並補充跨類別的分析，
+大部分的階段 0 延遲因此隱藏在使用者作答的時間內
+"""
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancelledError, get_cancel_token
+from .context_budget import split_sections
+from .llm_invoke import invoke_llm
+from .retry_handler import RetryHandler
+from .run_cache import content_hash
+from .tracing import get_tracer
+from .user_interaction import format_category_for_agent
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：設定為 1 時啟用問卷類別的預先摘要
+DIGEST_ENV = "KANO_PRESALES_DIGEST"
+# 環境變數：摘要使用的模型（未設定時依序使用 KANO_CONTEXT_SUMMARY_MODEL、售前顧問的模型）
+DIGEST_MODEL_ENV = "KANO_PRESALES_DIGEST_MODEL"
+# 環境變數：同時進行的摘要數
+DIGEST_WORKERS_ENV = "KANO_PRESALES_DIGEST_WORKERS"
+DEFAULT_DIGEST_WORKERS = 2
+
+_DIGEST_PROMPT = """你是資深售前顧問。客戶剛完成需求問卷中「{name}」類別的回答：
+
+{answers}
+
+請將這個類別整理為需求澄清文檔中的一個章節：
+- 以「## {name}」為章節標題，按要點整理客戶的需求
+- 對於不清楚或缺失的部分，根據上下文進行合理推斷，並標註「（推斷）」
+- 列出本類別中的模糊點與需要向客戶確認的問題
+只輸出該章節的內容，不要加入其他說明。"""
+
+def is_digest_enabled() -> bool:
+    return os.getenv(DIGEST_ENV, "0").lower() in ("1", "true", "yes")
+
+def _section_key(section: str) -> Tuple[str, str]:
+    """類別章節的鍵：（類別名稱, 內容雜湊），與 run_cache.requirement_category_hashes 一致"""
+    heading, body = split_sections(section)[0]
+    return heading.lstrip("#").strip(), content_hash(body.strip())
+
+class PresalesDigester:
+    """在背景線程池中逐類別摘要問卷回答，相同內容的類別只摘要一次"""
+
+    def __init__(self, workers: Optional[int] = None):
+        if workers is None:
+            try:
+                workers = int(os.getenv(DIGEST_WORKERS_ENV, DEFAULT_DIGEST_WORKERS))
+            except ValueError:
+                workers = DEFAULT_DIGEST_WORKERS
+        self.workers = max(1, workers)
+        self.llm_factory: Optional[Callable[[], object]] = None
+        self._llm = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return self.llm_factory is not None
+
+    def set_llm_factory(self, factory: Optional[Callable[[], object]]):
+        """設定建立摘要模型的函數（None 表示停用預先摘要）"""
+        with self._lock:
+            self.llm_factory = factory
+            self._llm = None
+
+    def _get_llm(self):
+        with self._lock:
+            if self._llm is None:
+                self._llm = self.llm_factory()
+            return self._llm
+
+    def _digest(self, name: str, section: str) -> str:
+        with get_tracer().span("售前類別摘要", cat="map", category=name):
+            handler = RetryHandler(max_retries=2, agent_name="presales_digest")
+            digest = handler.execute(invoke_llm, self._get_llm(), _DIGEST_PROMPT.format(name=name, answers=section.strip()))
+        digest = (digest or "").strip()
+        if not digest.startswith("#"):
+            digest = f"## {name}\n\n{digest}"
+        logger.info(f"✓ 已預先整理需求類別：{name}")
+        return digest
+
+    def submit(self, section: str) -> Optional[Future]:
+        """
+        在背景摘要一個類別（## 類別名稱 + 問答），內容相同的類別不重複摘要
+
+        Returns:
+            摘要的 Future；未配置摘要模型時返回 None
+        """
+        if not self.configured or not section.strip():
+            return None
+        key = _section_key(section)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="presales-digest")
+                future = self._executor.submit(self._digest, key[0], section)
+                self._futures[key] = future
+        return future
+
+    def submit_category(self, category_key: str, category_data: Dict) -> Optional[Future]:
+        """問卷完成一個類別時的回調（collect_user_requirements / RequirementsUI 的 on_category_complete）"""
+        if not category_data.get("answers"):
+            return None
+        return self.submit(format_category_for_agent(category_data))
+
+    def _wait(self, future: Future) -> str:
+        """等待摘要完成（可被取消）"""
+        token = get_cancel_token()
+        while True:
+            token.raise_if_cancelled()
+            try:
+                return future.result(timeout=0.5)
+            except FutureTimeoutError:
+                continue
+
+    def collect(self, requirements_text: str) -> List[Tuple[str, str]]:
+        """
+        取得需求文本中每個類別的摘要（按原順序；尚未摘要或內容已修改的類別現在摘要）
+
+        摘要失敗的類別以原始問答代替
+
+        Returns:
+            [(類別名稱, 摘要)]；未配置摘要模型時返回空列表
+        """
+        if not self.configured:
+            return []
+        sections = [
+            heading + "\n" + body
+            for heading, body in split_sections(requirements_text or "")
+            if heading.startswith("## ") and body.strip()
+        ]
+        futures = [(section, self.submit(section)) for section in sections]
+        digests = []
+        for section, future in futures:
+            name = _section_key(section)[0]
+            try:
+                digests.append((name, self._wait(future)))
+            except CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"需求類別「{name}」摘要失敗，改用原始回答: {e}")
+                # 移除失敗的記錄，下次收集時重新摘要
+                with self._lock:
+                    if self._futures.get(_section_key(section)) is future:
+                        del self._futures[_section_key(section)]
+                digests.append((name, section.strip()))
+        return digests
+
+# 全局實例
+_digester: Optional[PresalesDigester] = None
+
+def get_presales_digester() -> PresalesDigester:
+    """獲取全局問卷預先摘要器"""
+    global _digester
+    if _digester is None:
+        _digester = PresalesDigester()
+    return _digester
@@ -0,0 +1,146 @@
+"""
+執行進度回報
+把 Crew 的任務開始（串流匯流排上的 task_start 事件）、step_callback 與 task_callback
+轉換為 GUI / 調用方的進度回調與結構化的階段計時事件
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .api_logger import get_api_logger
+from .llm_monitor import get_llm_monitor
+from .stream_bus import get_stream_bus, TASK_START
+
+logger = logging.getLogger(__name__)
+
+# 階段事件類型（on_stage_event 收到的 dict 中的 "event" 欄位）
+STAGE_START = "stage_start"
+STAGE_STEP = "stage_step"
+STAGE_END = "stage_end"
+
+class ProgressReporter:
+    """
+    Crew 執行進度回報器
+
+    階段事件為 dict：
+        {"event": stage_start / stage_step / stage_end, "task": 任務名稱, "index": 序號（從 1 開始）,
+         "total": 任務總數, "agent": Agent 配置鍵, "elapsed": 已耗時（秒）, "steps": 步數,
+         "calls" / "tokens" / "errors" / "retries": 本階段的 LLM 調用統計（僅 stage_end）}
+    """
+
+    def __init__(
+        self,
+        task_names: List[str],
+        on_agent_start: Optional[Callable] = None,
+        on_agent_end: Optional[Callable] = None,
+        on_task_start: Optional[Callable] = None,
+        on_task_end: Optional[Callable] = None,
+        on_stage_event: Optional[Callable[[Dict], None]] = None,
+    ):
+        self.task_names = list(task_names)
+        self.on_agent_start = on_agent_start
+        self.on_agent_end = on_agent_end
+        self.on_task_start = on_task_start
+        self.on_task_end = on_task_end
+        self.on_stage_event = on_stage_event
+        # 已開始的階段：任務名稱 -> {"start", "agent", "steps"}
+        self._stages: Dict[str, Dict] = {}
+        self._current: Optional[str] = None
+        self._lock = threading.Lock()
+        self._unsubscribe = None
+
+    @property
+    def total(self) -> int:
+        return len(self.task_names)
+
+    def _index(self, task_name: str) -> int:
+        return self.task_names.index(task_name) + 1 if task_name in self.task_names else 0
+
+    def _emit(self, callback: Optional[Callable], *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.debug(f"進度回調失敗: {e}")
+
+    def _agent_display(self, agent_key: Optional[str]) -> str:
+        """Agent 配置鍵對應的 role 名稱"""
+        for role, info in get_llm_monitor().agents.items():
+            if info.get("agent") == agent_key:
+                return role
+        return agent_key or "unknown"
+
+    def attach(self):
+        """訂閱串流匯流排上的任務開始事件（執行開始前調用）"""
+        if self._unsubscribe is None:
+            self._unsubscribe = get_stream_bus().subscribe(self._on_stream_event)
+        return self
+
+    def detach(self):
+        """取消訂閱（執行結束後調用）"""
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+    def _on_stream_event(self, event: Dict):
+        if event["type"] == TASK_START:
+            self.stage_started(event["task"], event["agent"])
+
+    def stage_started(self, task_name: str, agent_key: Optional[str] = None):
+        """階段開始"""
+        now = time.time()
+        with self._lock:
+            if task_name in self._stages:
+                return
+            self._stages[task_name] = {"start": now, "agent": agent_key, "steps": 0}
+            self._current = task_name
+        index = self._index(task_name)
+        self._emit(self.on_agent_start, self._agent_display(agent_key), agent_key)
+        self._emit(self.on_task_start, task_name, index, self.total)
+        self._emit(self.on_stage_event, {
+            "event": STAGE_START, "task": task_name, "index": index, "total": self.total,
+            "agent": agent_key, "elapsed": 0.0, "steps": 0,
+        })
+
+    def step_callback(self, *_args, **_kwargs):
+        """Crew step_callback：每個 Agent 步驟（思考 / 工具調用）完成後調用"""
+        now = time.time()
+        with self._lock:
+            task_name = self._current
+            stage = self._stages.get(task_name) if task_name else None
+            if stage is None:
+                return
+            stage["steps"] += 1
+            payload = {
+                "event": STAGE_STEP, "task": task_name, "index": self._index(task_name), "total": self.total,
+                "agent": stage["agent"], "elapsed": now - stage["start"], "steps": stage["steps"],
+            }
+        self._emit(self.on_stage_event, payload)
+
+    def task_callback(self, task_output=None, *_args, **_kwargs):
+        """Crew task_callback：任務完成後調用（參數為 TaskOutput）"""
+        task_name = getattr(task_output, "name", None) or self._current
+        if not task_name:
+            return
+        now = time.time()
+        with self._lock:
+            stage = self._stages.get(task_name) or {"start": now, "agent": None, "steps": 0}
+            if self._current == task_name:
+                self._current = None
+        agent_key = stage["agent"]
+        if agent_key is None:
+            role = getattr(task_output, "agent", None)
+            agent_key = get_llm_monitor().agents.get(role, {}).get("agent", role)
+        index = self._index(task_name)
+        api_logger = get_api_logger()
+        api_logger.set_stage_status(task_name, "completed")
+        usage = api_logger.get_task_usage(task_name)
+        self._emit(self.on_task_end, task_name, index, self.total)
+        self._emit(self.on_agent_end, self._agent_display(agent_key), agent_key)
+        self._emit(self.on_stage_event, dict(
+            {"event": STAGE_END, "task": task_name, "index": index, "total": self.total,
+             "agent": agent_key, "elapsed": now - stage["start"], "steps": stage["steps"]},
+            **usage,
+        ))
@@ -0,0 +1,247 @@
+"""
+共用配額帳本
+多個 worker 程序（或共用同一目錄的多台機器）同時執行時，以 SQLite 帳本協調各提供者 / 模型的配額：
+- 每次 LLM 調用前在帳本中預留一筆（請求數與估計的 Token 數），最近 60 秒的請求數（RPM）、Token 數（TPM）
+  或當日請求數超過限制時，等待最早的記錄移出時間窗後再預留
+- 調用結束後以實際的 Token 數（提示 + 輸出的估計）更新該筆記錄
+- 當日配額用盡時拋出配額用盡錯誤（不可重試），不等待到隔天
+
+帳本只負責不超過限制；調用失敗的重試仍由各 worker 的 RetryHandler 自行處理，重試的調用同樣經過帳本。
+掛鉤安裝在 Key 池之上、續寫與停滯監控之內，續寫、停滯後的重試與備援模型的每次請求都各自預留；
+帳本不區分 API Key，配置了多個 Key（utils.key_pool）時限制為所有 Key 合計的吞吐量
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .api_logger import get_provider_name
+from .cancellation import POLL_INTERVAL, get_cancel_token, mark_call_progress
+from .context_budget import estimate_tokens
+from .job_store import connect_sqlite
+from .llm_hooks import install_call_hook
+from .llm_invoke import _to_text
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：帳本資料庫路徑（HTTP 任務服務 / worker fleet 預設為任務目錄下的 quota.db）
+LEDGER_ENV = "KANO_QUOTA_LEDGER"
+DEFAULT_LEDGER = os.path.join("output", "quota.db")
+# 環境變數：按提供者或模型的限制（例如 deepseek=60,gemini/gemini-2.0-flash=15），設定任一項即啟用帳本
+RPM_ENV = "KANO_QUOTA_RPM"
+TPM_ENV = "KANO_QUOTA_TPM"
+DAILY_ENV = "KANO_QUOTA_DAILY"
+
+WINDOW = 60.0
+# 預留記錄保留的時間（超過後刪除）
+RETENTION = 2 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    node TEXT
+);
+CREATE INDEX IF NOT EXISTS usage_provider ON usage (provider, ts);
+CREATE INDEX IF NOT EXISTS usage_model ON usage (model, ts);
+"""
+
+class QuotaExceededError(Exception):
+    """當日配額已用盡（訊息包含 429 / quota exceeded，RetryHandler 視為不可重試）"""
+
+def _parse_limits(value: Optional[str]) -> Dict[str, int]:
+    limits = {}
+    for item in (value or "").split(","):
+        key, _, raw = item.rpartition("=")
+        try:
+            limits[key.strip()] = int(raw)
+        except ValueError:
+            continue
+    return {key: limit for key, limit in limits.items() if key and limit > 0}
+
+def is_ledger_enabled() -> bool:
+    return any(os.getenv(name) for name in (RPM_ENV, TPM_ENV, DAILY_ENV))
+
+class QuotaLedger:
+    """以 SQLite 記錄各提供者 / 模型調用的共用配額帳本"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        rpm: Optional[Dict[str, int]] = None,
+        tpm: Optional[Dict[str, int]] = None,
+        daily: Optional[Dict[str, int]] = None,
+    ):
+        self.db_path = db_path or os.getenv(LEDGER_ENV) or DEFAULT_LEDGER
+        self.rpm = rpm if rpm is not None else _parse_limits(os.getenv(RPM_ENV))
+        self.tpm = tpm if tpm is not None else _parse_limits(os.getenv(TPM_ENV))
+        self.daily = daily if daily is not None else _parse_limits(os.getenv(DAILY_ENV))
+        self.node = socket.gethostname()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect_sqlite(self.db_path)
+        return conn
+
+    def _scopes(self, provider: str, model: str) -> List[Tuple[str, str]]:
+        """有配置限制的範圍：[(欄位, 值)]，模型與提供者的限制同時生效"""
+        scopes = []
+        for column, value in (("model", model), ("provider", provider)):
+            if any(value in limits for limits in (self.rpm, self.tpm, self.daily)):
+                scopes.append((column, value))
+        return scopes
+
+    def has_limits(self, provider: str, model: str) -> bool:
+        return bool(self._scopes(provider, model))
+
+    def try_reserve(self, provider: str, model: str, tokens: int) -> Tuple[Optional[int], float]:
+        """
+        在限制內時預留一筆調用
+
+        Returns:
+            (記錄 ID, 0)；超過 RPM / TPM 時返回 (None, 建議等待秒數)
+
+        Raises:
+            QuotaExceededError: 當日配額已用盡
+        """
+        now = time.time()
+        day = datetime.now().strftime("%Y-%m-%d")
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM usage WHERE ts < ?", (now - RETENTION,))
+            wait = 0.0
+            for column, value in self._scopes(provider, model):
+                daily_limit = self.daily.get(value)
+                if daily_limit:
+                    used_today = conn.execute(
+                        f"SELECT COUNT(*) FROM usage WHERE {column} = ? AND day = ?", (value, day)
+                    ).fetchone()[0]
+                    if used_today >= daily_limit:
+                        raise QuotaExceededError(
+                            f"429 quota exceeded：{value} 今日已使用 {used_today} 次（共用配額帳本的每日上限 {daily_limit}）"
+                        )
+                count, used_tokens, oldest = conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(tokens), 0), MIN(ts) FROM usage WHERE {column} = ? AND ts > ?",
+                    (value, now - WINDOW),
+                ).fetchone()
+                rpm_limit, tpm_limit = self.rpm.get(value), self.tpm.get(value)
+                # 單次調用超過 TPM 時只在時間窗內沒有其他調用時放行，避免永遠等待
+                over_tpm = tpm_limit and count and used_tokens + tokens > tpm_limit
+                if (rpm_limit and count >= rpm_limit) or over_tpm:
+                    wait = max(wait, oldest + WINDOW - now, POLL_INTERVAL)
+            if wait:
+                conn.execute("ROLLBACK")
+                return None, wait
+            cursor = conn.execute(
+                "INSERT INTO usage (provider, model, ts, day, tokens, node) VALUES (?, ?, ?, ?, ?, ?)",
+                (provider, model, now, day, tokens, self.node),
+            )
+            conn.execute("COMMIT")
+            return cursor.lastrowid, 0.0
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def reserve(self, provider: str, model: str, tokens: int) -> int:
+        """預留一筆調用，超過 RPM / TPM 時等待（可被取消）"""
+        token = get_cancel_token()
+        waited = 0.0
+        while True:
+            token.raise_if_cancelled()
+            entry_id, wait = self.try_reserve(provider, model, tokens)
+            if entry_id is not None:
+                if waited:
+                    logger.info(f"✓ 配額帳本：{model} 等待 {waited:.1f}s 後取得配額")
+                return entry_id
+            if not waited:
+                logger.info(f"⏳ 配額帳本：{model} 已達每分鐘限制，等待約 {wait:.1f}s")
+            with get_tracer().span("配額等待", cat="quota", provider=provider, model=model):
+                deadline = time.time() + wait
+                while time.time() < deadline:
+                    token.raise_if_cancelled()
+                    # 等待配額不算停滯（帳本位於停滯監控之內）
+                    mark_call_progress()
+                    time.sleep(min(POLL_INTERVAL, max(deadline - time.time(), 0)))
+            waited += wait
+
+    def settle(self, entry_id: int, tokens: int):
+        """以實際的 Token 數更新預留的記錄"""
+        conn = self._conn()
+        conn.execute("UPDATE usage SET tokens = ? WHERE id = ?", (tokens, entry_id))
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """各限制範圍最近 60 秒的請求數 / Token 數與當日請求數"""
+        now = time.time()
+        day = datetime.now().strftime("%Y-%m-%d")
+        conn = self._conn()
+        summary = {}
+        for key in sorted(set(self.rpm) | set(self.tpm) | set(self.daily)):
+            count, tokens = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM usage WHERE (provider = ? OR model = ?) AND ts > ?",
+                (key, key, now - WINDOW),
+            ).fetchone()
+            today = conn.execute(
+                "SELECT COUNT(*) FROM usage WHERE (provider = ? OR model = ?) AND day = ?", (key, key, day)
+            ).fetchone()[0]
+            summary[key] = {"rpm": count, "tpm": tokens, "today": today}
+        return summary
+
+def _messages_text(messages: Any) -> str:
+    if isinstance(messages, str):
+        return messages
+    if isinstance(messages, list):
+        return "\n".join(
+            str(message.get("content", "")) if isinstance(message, dict) else _to_text(message) for message in messages
+        )
+    return _to_text(messages)
+
+# 全局實例
+_ledger: Optional[QuotaLedger] = None
+_ledger_lock = threading.Lock()
+
+def get_quota_ledger() -> QuotaLedger:
+    """獲取全局配額帳本"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = QuotaLedger()
+        return _ledger
+
+def install_quota_ledger(llm, agent_key: str, model: Optional[str] = None, llm_type: Optional[str] = None) -> bool:
+    """
+    讓 LLM 實例的調用經過共用配額帳本（設定了 KANO_QUOTA_RPM / TPM / DAILY 且該提供者或模型有限制時）
+
+    須在 install_key_pool() 之後、install_cancellation() / install_continuation() 之前安裝，每次提供者請求都預留一筆
+    """
+    if not is_ledger_enabled() or not model:
+        return False
+    provider = get_provider_name(model, llm_type)
+    if not get_quota_ledger().has_limits(provider, model):
+        return False
+
+    def quota_hook(llm, call_next, *args, **kwargs):
+        ledger = get_quota_ledger()
+        prompt_tokens = estimate_tokens(_messages_text(args[0] if args else kwargs.get("messages")), model)
+        entry_id = ledger.reserve(provider, model, prompt_tokens)
+        result = call_next(*args, **kwargs)
+        try:
+            ledger.settle(entry_id, prompt_tokens + estimate_tokens(_to_text(result), model))
+        except Exception as e:
+            logger.debug(f"{agent_key} 更新配額帳本失敗: {e}")
+        return result
+
+    return install_call_hook(llm, quota_hook, "quota_ledger")
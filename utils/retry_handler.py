@@ -2,11 +2,13 @@
 API 重試與延遲處理機制
 支援指數退避、自動降級、智能重試
 """
-import time
 import logging
 from typing import Callable, Any, Optional
 from functools import wraps
 
+from .tracing import get_tracer
+from .cancellation import CancelledError, get_cancel_token
+
 logger = logging.getLogger(__name__)
 
 # API 過載相關錯誤碼（可重試）
@@ -44,6 +46,37 @@ def is_quota_exceeded_error(error_msg: str) -> bool:
     error_msg_lower = error_msg.lower()
     return "429" in error_msg and any(indicator in error_msg_lower for indicator in QUOTA_EXHAUSTED_INDICATORS)
 
+def classify_error(error_msg: str) -> str:
+    """
+    分類錯誤類型（GUI 錯誤提示與監控指標共用）
+    
+    Returns:
+        quota_exceeded / api_overload / model_not_found / auth_error / network_error / unknown
+    """
+    error_lower = error_msg.lower()
+    
+    # 配額用盡錯誤
+    if "429" in error_msg and ("quota exceeded" in error_lower or "resource_exhausted" in error_lower):
+        return "quota_exceeded"
+    
+    # API 過載錯誤
+    if "503" in error_msg or ("429" in error_msg and "rate limit" in error_lower):
+        return "api_overload"
+    
+    # 模型不存在
+    if "404" in error_msg or "not_found" in error_lower:
+        return "model_not_found"
+    
+    # 認證錯誤
+    if "401" in error_msg or "unauthorized" in error_lower or "invalid api key" in error_lower:
+        return "auth_error"
+    
+    # 網絡錯誤
+    if "connection" in error_lower or "timeout" in error_lower or "network" in error_lower:
+        return "network_error"
+    
+    return "unknown"
+
 def calculate_retry_delay(attempt: int, base_delay: float, backoff: float, max_delay: float = 60.0) -> float:
     """
     計算重試延遲時間（指數退避）
@@ -60,6 +93,14 @@ def calculate_retry_delay(attempt: int, base_delay: float, backoff: float, max_d
     delay = base_delay * (backoff ** attempt)
     return min(delay, max_delay)
 
+def _record_backoff(seconds: float, agent_name: Optional[str] = None, model: Optional[str] = None):
+    """將退避等待時間記錄到 API 日誌的延遲直方圖"""
+    try:
+        from .api_logger import get_api_logger
+        get_api_logger().record_backoff(seconds, agent=agent_name, model=model)
+    except Exception as e:
+        logger.debug(f"無法記錄退避等待時間: {e}")
+
 def retry_with_delay(
     max_retries: int = 3,
     delay: float = 2.0,
@@ -89,6 +130,8 @@ def retry_with_delay(
             for attempt in range(max_retries + 1):
                 try:
                     return func(*args, **kwargs)
+                except CancelledError:
+                    raise
                 except exceptions as e:
                     last_exception = e
                     error_msg = str(e)
@@ -111,7 +154,10 @@ def retry_with_delay(
                                 f"   錯誤: {error_msg[:100]}...\n"
                                 f"   等待 {actual_delay:.1f} 秒後重試..."
                             )
-                            time.sleep(actual_delay)
+                            with get_tracer().span("重試退避", cat="retry", delay=f"{actual_delay:.1f}s"):
+                                # 可被取消中斷的等待
+                                get_cancel_token().sleep(actual_delay)
+                            _record_backoff(actual_delay)
                         else:
                             # 其他錯誤（如 404）不重試
                             logger.error(f"❌ 不可重試的錯誤: {error_msg[:200]}")
@@ -138,12 +184,17 @@ class RetryHandler:
         backoff: float = 1.5,
         max_delay: float = 60.0,
         jitter: bool = True,
+        agent_name: Optional[str] = None,
+        model: Optional[str] = None,
     ):
         self.max_retries = max_retries
         self.delay = delay
         self.backoff = backoff
         self.max_delay = max_delay
         self.jitter = jitter
+        # 用於延遲直方圖的分組（可選）
+        self.agent_name = agent_name
+        self.model = model
     
     def execute(
         self,
@@ -159,6 +210,8 @@ class RetryHandler:
         for attempt in range(self.max_retries + 1):
             try:
                 return func(*args, **kwargs)
+            except CancelledError:
+                raise
             except exceptions as e:
                 last_exception = e
                 error_msg = str(e)
@@ -182,7 +235,12 @@ class RetryHandler:
                             f"   錯誤: {error_msg[:100]}...\n"
                             f"   等待 {actual_delay:.1f} 秒後重試..."
                         )
-                        time.sleep(actual_delay)
+                        with get_tracer().span(
+                            "重試退避", cat="retry", agent=self.agent_name, delay=f"{actual_delay:.1f}s"
+                        ):
+                            # 可被取消中斷的等待
+                            get_cancel_token().sleep(actual_delay)
+                        _record_backoff(actual_delay, self.agent_name, self.model)
                     else:
                         logger.error(f"❌ 不可重試的錯誤: {error_msg[:200]}")
                         raise
@@ -0,0 +1,182 @@
+"""
+增量重跑
+記錄每個階段的輸入指紋（任務描述、模型、實際傳入的上下文與影響輸出的配置的雜湊）與輸出，
+下次執行時只重跑輸入真正改變的階段，其餘直接重用上次的輸出：
+- 問卷回答嵌入需求澄清任務的描述中，修改任一類別的回答只會先使需求澄清階段失效
+- 下游階段只在其上下文（上游輸出、檢索的前序章節，經過 Token 預算壓縮後的文字）改變時才重跑
+- 上下文預算、檢索章節數與分片 / 分塊等執行設定（STAGE_SETTING_ENVS）改變時同樣重跑
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .context_budget import split_sections
+from .output_saver import _task_filename
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：設定為 0 / false 可停用增量重跑（每次都重新生成所有階段）
+INCREMENTAL_ENV = "KANO_INCREMENTAL"
+
+MANIFEST_VERSION = 1
+
+# 影響階段輸出的執行設定（環境變數），納入輸入指紋
+STAGE_SETTING_ENVS = (
+    "KANO_REVIEW_WORKERS",
+    "KANO_REVIEW_CHUNK_TOKENS",
+    "KANO_DEV_WORKERS",
+    "KANO_PRD_PARALLEL",
+    "KANO_PRD_WORKERS",
+    "KANO_PRESALES_DIGEST",
+    "KANO_PRESALES_DIGEST_MODEL",
+    "KANO_CONTEXT_SUMMARY_MODEL",
+    "KANO_MAX_CONTINUATIONS",
+)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def requirement_category_hashes(requirements_text: Optional[str]) -> Dict[str, str]:
+    """問卷需求文本中各類別（## 類別名稱）內容的雜湊"""
+    hashes = {}
+    for heading, body in split_sections(requirements_text or ""):
+        if heading.startswith("## "):
+            hashes[heading[3:].strip()] = content_hash(body.strip())
+    return hashes
+
+class RunCache:
+    """按階段輸入指紋重用上次輸出的快取（output/.cache/）"""
+
+    def __init__(self, output_dir: str = "output", enabled: Optional[bool] = None):
+        if enabled is None:
+            enabled = os.getenv(INCREMENTAL_ENV, "1").lower() not in ("0", "false", "no")
+        self.enabled = enabled
+        self.cache_dir = os.path.join(output_dir, ".cache")
+        self.manifest_file = os.path.join(self.cache_dir, "run_manifest.json")
+        self.manifest: Dict = {"version": MANIFEST_VERSION, "categories": {}, "stages": {}}
+        self.reused: List[str] = []
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_file):
+            return
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"無法讀取增量重跑記錄，將重新生成所有階段: {e}")
+            return
+        if manifest.get("version") == MANIFEST_VERSION:
+            self.manifest = manifest
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.manifest_file)
+
+    def update_requirements(self, requirements_text: Optional[str]) -> List[str]:
+        """
+        記錄本次問卷各類別的雜湊
+
+        Returns:
+            與上次相比有變更（新增、修改或刪除）的類別名稱
+        """
+        current = requirement_category_hashes(requirements_text)
+        with self._lock:
+            previous = self.manifest.get("categories", {})
+            changed = sorted(name for name in set(current) | set(previous) if current.get(name) != previous.get(name))
+            self.manifest["categories"] = current
+        if changed and previous:
+            logger.info(f"📝 需求類別有變更：{'、'.join(changed)}（需求澄清階段將重新生成）")
+        return changed
+
+    def input_hash(
+        self,
+        task,
+        model: Optional[str] = None,
+        context: Optional[str] = None,
+        settings: Optional[Dict] = None,
+    ) -> str:
+        """
+        階段輸入指紋
+
+        Args:
+            task: 任務（描述、預期輸出與上游輸出）
+            model: 模型名稱
+            context: Crew 實際傳入的上下文（包含檢索的前序章節，經過 Token 預算壓縮）
+            settings: 影響輸出的 Agent 配置（例如上下文預算、檢索章節數）
+        """
+        upstream = [
+            content_hash(context_task.output.raw)
+            for context_task in (task.context if isinstance(task.context, list) else [])
+            if getattr(context_task, "output", None) is not None
+        ]
+        env = {name: os.getenv(name) for name in STAGE_SETTING_ENVS if os.getenv(name) is not None}
+        knobs = json.dumps([settings or {}, env], sort_keys=True, default=str)
+        return content_hash("\n".join(
+            [task.description or "", task.expected_output or "", model or "", content_hash(str(context or "")), knobs] + upstream
+        ))
+
+    def _output_file(self, task_name: str) -> str:
+        return _task_filename(task_name, self.cache_dir)
+
+    def lookup(self, task, input_hash: str) -> Optional[str]:
+        """輸入指紋與上次相同時返回上次的輸出"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            stage = self.manifest["stages"].get(task.name)
+        if not stage or stage.get("input_hash") != input_hash:
+            return None
+        try:
+            with open(self._output_file(task.name), "r", encoding="utf-8") as f:
+                output = f.read()
+        except OSError:
+            return None
+        if content_hash(output) != stage.get("output_hash"):
+            return None
+        with self._lock:
+            self.reused.append(task.name)
+        logger.info(f"♻️ {task.name} 的輸入未改變，重用上次的輸出")
+        return output
+
+    def store(self, task, input_hash: str, output: str):
+        """記錄階段的輸入指紋與輸出"""
+        if not self.enabled or not isinstance(output, str):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._output_file(task.name), "w", encoding="utf-8") as f:
+            f.write(output)
+        with self._lock:
+            previous = self.manifest["stages"].get(task.name, {})
+            output_hash = content_hash(output)
+            self.manifest["stages"][task.name] = {
+                "input_hash": input_hash,
+                "output_hash": output_hash,
+                "changed": previous.get("output_hash") != output_hash,
+                "timestamp": datetime.now().isoformat(),
+            }
+            self._save()
+
+# 全局實例
+_run_cache: Optional[RunCache] = None
+
+def get_run_cache() -> RunCache:
+    """獲取全局增量重跑快取"""
+    global _run_cache
+    if _run_cache is None:
+        _run_cache = RunCache()
+    return _run_cache
+
+def reset_run_cache(output_dir: str = "output") -> RunCache:
+    """建立新的增量重跑快取（每次執行開始時調用）"""
+    global _run_cache
+    _run_cache = RunCache(output_dir)
+    return _run_cache
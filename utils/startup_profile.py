@@ -0,0 +1,163 @@
+"""
+啟動耗時分析
+記錄從 main.py 開始執行到第一次互動（問卷第一個問題 / GUI 視窗顯示）的耗時；
+設定 KANO_STARTUP_PROFILE=1 時同時記錄每個模組的導入耗時（類似 python -X importtime），
+並在第一次互動時打印分階段耗時與最慢導入的報告
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：設定為 1 時記錄模組導入耗時並打印啟動報告
+PROFILE_ENV = "KANO_STARTUP_PROFILE"
+
+def is_profile_enabled() -> bool:
+    return os.getenv(PROFILE_ENV, "0").lower() in ("1", "true", "yes")
+
+class _TimedLoader:
+    """包裝模組的 loader，記錄 exec_module 的耗時"""
+
+    def __init__(self, loader, timer: "ImportTimer"):
+        self._loader = loader
+        self._timer = timer
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # 執行模組程式碼前還原原本的 loader（模組內可能使用 __loader__ 讀取資源）
+        module.__loader__ = self._loader
+        if getattr(module, "__spec__", None) is not None:
+            module.__spec__.loader = self._loader
+        self._timer.run(module.__name__, self._loader.exec_module, module)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+class ImportTimer:
+    """sys.meta_path 上的 finder：為每個新導入的模組記錄累計與自身耗時（微秒）"""
+
+    def __init__(self):
+        self.records: Dict[str, Tuple[int, int]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+            find_spec = getattr(finder, "find_spec", None)
+            if find_spec is None:
+                continue
+            spec = find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def run(self, name: str, exec_module, module):
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0)
+        started = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            cumulative = int((time.perf_counter() - started) * 1_000_000)
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            with self._lock:
+                self.records[name] = (cumulative, cumulative - children)
+
+    def slowest(self, limit: int = 15) -> List[Tuple[str, int, int]]:
+        """累計耗時最長的導入：[(模組, 累計 μs, 自身 μs)]"""
+        with self._lock:
+            items = [(name, cumulative, own) for name, (cumulative, own) in self.records.items()]
+        return sorted(items, key=lambda item: item[1], reverse=True)[:limit]
+
+class StartupProfile:
+    """啟動階段耗時與第一次互動時間"""
+
+    def __init__(self, started: Optional[float] = None):
+        # 開始時間（time.perf_counter()，入口腳本可設定為其第一行執行的時間）
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.first_interaction: Optional[Tuple[str, float]] = None
+        self.import_timer: Optional[ImportTimer] = None
+        self._lock = threading.Lock()
+
+    def enable_import_timing(self) -> bool:
+        """KANO_STARTUP_PROFILE=1 時開始記錄模組導入耗時（應在導入其他模組之前調用）"""
+        if self.import_timer is not None or not is_profile_enabled():
+            return False
+        self.import_timer = ImportTimer()
+        sys.meta_path.insert(0, self.import_timer)
+        return True
+
+    @contextmanager
+    def phase(self, name: str):
+        """記錄一個啟動階段的耗時"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.phases.append((name, elapsed))
+            if self.import_timer is not None:
+                logger.info(f"⏱️ 啟動階段「{name}」耗時 {elapsed:.2f}s")
+
+    def mark_first_interaction(self, label: str) -> Optional[float]:
+        """
+        記錄第一次互動的時間（只有第一次調用有效）
+
+        Returns:
+            從開始執行到第一次互動的秒數；已記錄過時返回 None
+        """
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            if self.first_interaction is not None:
+                return None
+            self.first_interaction = (label, elapsed)
+        logger.debug(f"啟動至第一次互動（{label}）耗時 {elapsed:.2f}s")
+        if self.import_timer is not None:
+            print(self.report(), file=sys.stderr)
+        return elapsed
+
+    def report(self, limit: int = 15) -> str:
+        """啟動耗時報告（分階段耗時與最慢的導入）"""
+        lines = ["", "=" * 70, "啟動耗時報告", "=" * 70]
+        if self.first_interaction is not None:
+            label, elapsed = self.first_interaction
+            lines.append(f"第一次互動（{label}）：{elapsed:.3f}s")
+        with self._lock:
+            phases = list(self.phases)
+        if phases:
+            lines.append("\n階段：")
+            lines.extend(f"  {name:<40} {elapsed:>8.3f}s" for name, elapsed in phases)
+        if self.import_timer is not None:
+            lines.append(f"\n最慢的導入（共 {len(self.import_timer.records)} 個模組）：")
+            lines.append(f"  {'累計 (μs)':>12} | {'自身 (μs)':>12} | 模組")
+            for name, cumulative, own in self.import_timer.slowest(limit):
+                lines.append(f"  {cumulative:>12} | {own:>12} | {name}")
+        lines.append("=" * 70)
+        return "\n".join(lines)
+
+# 全局實例
+_startup_profile: Optional[StartupProfile] = None
+
+def get_startup_profile() -> StartupProfile:
+    """獲取全局啟動耗時記錄"""
+    global _startup_profile
+    if _startup_profile is None:
+        _startup_profile = StartupProfile()
+    return _startup_profile
@@ -0,0 +1,97 @@
+"""
+串流輸出匯流排
+將 LLM 逐 Token 的輸出（由 llm_monitor 從 CrewAI 事件轉發）分發給控制台、GUI 與輸出檔案，
+讓使用者在 crew.kickoff() 返回之前就能看到各 Agent 正在生成的內容
+"""
+import os
+import sys
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：設定為 0 / false 可停用串流（LLM 改回一次性返回）
+STREAMING_ENV = "KANO_STREAMING"
+
+# 串流事件類型
+TASK_START = "task_start"
+CHUNK = "chunk"
+TASK_END = "task_end"
+
+def is_streaming_enabled() -> bool:
+    """是否啟用串流模式"""
+    return os.getenv(STREAMING_ENV, "1").lower() not in ("0", "false", "no")
+
+class StreamBus:
+    """
+    簡單的進程內發佈/訂閱匯流排
+
+    事件為 dict：{"type": task_start / chunk / task_end, "agent": ..., "task": ..., "text": ...}
+    訂閱者在發佈者的線程中同步調用，應只做輕量工作（寫入隊列、追加檔案）
+    """
+
+    def __init__(self):
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> Callable[[], None]:
+        """
+        訂閱串流事件
+
+        Returns:
+            取消訂閱的函數
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def publish(self, event_type: str, agent: Optional[str] = None, task: Optional[str] = None, text: str = ""):
+        """發佈串流事件（訂閱者的錯誤不會影響 LLM 調用）"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        event = {"type": event_type, "agent": agent, "task": task, "text": text}
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.debug(f"串流訂閱者處理失敗: {e}")
+
+class ConsoleStreamPrinter:
+    """將串流輸出直接打印到控制台（命令行模式）"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._current = None
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Dict):
+        with self._lock:
+            if event["type"] == CHUNK:
+                key = (event["agent"], event["task"])
+                if key != self._current:
+                    self._current = key
+                    self.stream.write(f"\n\n>>> [{event['agent']}] {event['task'] or ''}\n")
+                self.stream.write(event["text"])
+                self.stream.flush()
+            elif event["type"] == TASK_END:
+                self._current = None
+                self.stream.write("\n")
+                self.stream.flush()
+
+# 全局實例
+_stream_bus: Optional[StreamBus] = None
+
+def get_stream_bus() -> StreamBus:
+    """獲取全局串流匯流排實例"""
+    global _stream_bus
+    if _stream_bus is None:
+        _stream_bus = StreamBus()
+    return _stream_bus
@@ -0,0 +1,174 @@
+"""
+執行追蹤
+記錄每次執行的階層式時間區段（Crew 建立、任務、LLM 調用、重試等待、輸出保存），
+並導出為 Chrome trace-event JSON（可用 chrome://tracing 或 Perfetto 開啟）
+"""
+import os
+import json
+import time
+import inspect
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 環境變數：設定為 0 / false 可停用追蹤
+TRACE_ENV = "KANO_TRACE"
+
+# 由 CrewAI 事件產生的區段（任務、LLM 調用）放在獨立的虛擬線程上，便於按時間巢狀顯示
+CREW_TRACK = "crew"
+
+class RunTracer:
+    """Chrome trace-event 格式的執行追蹤器"""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        if enabled is None:
+            enabled = os.getenv(TRACE_ENV, "1").lower() not in ("0", "false", "no")
+        self.enabled = enabled
+        self.events: List[Dict] = []
+        self.pid = os.getpid()
+        self._perf_origin = time.perf_counter()
+        self._wall_origin = time.time()
+        self._tids: Dict[object, int] = {}
+        self._lock = threading.Lock()
+
+    def _tid(self, track=None) -> int:
+        """將線程或虛擬線程映射為小整數 tid，並寫入線程名稱 metadata"""
+        key = track if track is not None else threading.get_ident()
+        with self._lock:
+            if key not in self._tids:
+                tid = len(self._tids) + 1
+                self._tids[key] = tid
+                name = track if track is not None else threading.current_thread().name
+                self.events.append({
+                    "name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                    "args": {"name": str(name)},
+                })
+            return self._tids[key]
+
+    def _perf_to_us(self, perf: float) -> float:
+        return (perf - self._perf_origin) * 1e6
+
+    def _wall_to_us(self, wall: float) -> float:
+        return (wall - self._wall_origin) * 1e6
+
+    def _append(self, event: Dict):
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "run", **args):
+        """
+        記錄一個時間區段（同一線程中的巢狀 span 會自動形成階層）
+
+        Args:
+            name: 區段名稱
+            cat: 分類（setup / task / llm / retry / output ...）
+            **args: 附加資訊（顯示在追蹤檢視器的 Args 中）
+        """
+        if not self.enabled:
+            yield
+            return
+        tid = self._tid()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._append({
+                "name": name, "cat": cat, "ph": "X", "pid": self.pid, "tid": tid,
+                "ts": self._perf_to_us(start), "dur": (end - start) * 1e6,
+                "args": {k: str(v) for k, v in args.items() if v is not None},
+            })
+
+    def add_span(self, name: str, start_wall: float, end_wall: float, cat: str = "run",
+                 track: Optional[str] = CREW_TRACK, **args):
+        """
+        以牆上時鐘時間補記一個區段（用於事件回調中測得的開始/結束時間）
+
+        Args:
+            start_wall / end_wall: time.time() 格式的開始與結束時間
+            track: 虛擬線程名稱（None 表示當前線程）
+        """
+        if not self.enabled:
+            return
+        self._append({
+            "name": name, "cat": cat, "ph": "X", "pid": self.pid, "tid": self._tid(track),
+            "ts": self._wall_to_us(start_wall), "dur": max(0.0, end_wall - start_wall) * 1e6,
+            "args": {k: str(v) for k, v in args.items() if v is not None},
+        })
+
+    def instant(self, name: str, cat: str = "run", **args):
+        """記錄一個瞬間事件（例如取消、逾時）"""
+        if not self.enabled:
+            return
+        self._append({
+            "name": name, "cat": cat, "ph": "i", "s": "p", "pid": self.pid, "tid": self._tid(),
+            "ts": self._perf_to_us(time.perf_counter()),
+            "args": {k: str(v) for k, v in args.items() if v is not None},
+        })
+
+    def save(self, output_file: str) -> Optional[str]:
+        """導出為 Chrome trace-event JSON"""
+        if not self.enabled:
+            return None
+        os.makedirs(os.path.dirname(output_file) if os.path.dirname(output_file) else ".", exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return output_file
+
+def traced(cat: str = "run", arg_names: tuple = ()):
+    """
+    裝飾器：將函數調用記錄為一個區段
+
+    Args:
+        cat: 分類
+        arg_names: 要記錄到 span args 中的參數名稱
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            span_args = {}
+            if arg_names:
+                try:
+                    bound = signature.bind_partial(*args, **kwargs)
+                    span_args = {k: bound.arguments[k] for k in arg_names if k in bound.arguments}
+                except TypeError:
+                    pass
+            with get_tracer().span(func.__name__, cat=cat, **span_args):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# 全局實例
+_tracer: Optional[RunTracer] = None
+
+def get_tracer() -> RunTracer:
+    """獲取全局執行追蹤器實例"""
+    global _tracer
+    if _tracer is None:
+        _tracer = RunTracer()
+    return _tracer
+
+def reset_tracer():
+    """重置執行追蹤器（每次執行開始時調用，避免混入上一次的區段）"""
+    global _tracer
+    _tracer = None
+
+def save_run_trace(output_dir: str = "output") -> Optional[str]:
+    """將本次執行的追蹤保存到輸出目錄（trace.json）"""
+    try:
+        trace_file = get_tracer().save(os.path.join(output_dir, "trace.json"))
+        if trace_file:
+            logger.info(f"執行追蹤已保存至: {trace_file}（可用 chrome://tracing 或 https://ui.perfetto.dev 開啟）")
+        return trace_file
+    except Exception as e:
+        logger.warning(f"無法保存執行追蹤: {e}")
+        return None
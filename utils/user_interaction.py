@@ -3,7 +3,7 @@
 提供命令行界面讓客戶回答售前顧問的問題
 """
 import sys
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
 def print_header(title: str):
     """打印標題"""
@@ -28,10 +28,16 @@ def get_user_input(prompt: str = "請輸入您的回答（直接按 Enter 跳過
         print("\n\n⚠️  用戶中斷輸入")
         return None
 
-def collect_user_requirements() -> Dict[str, List[Dict[str, str]]]:
+def collect_user_requirements(
+    on_category_complete: Optional[Callable[[str, Dict], None]] = None,
+) -> Dict[str, List[Dict[str, str]]]:
     """
     收集用戶需求
     返回結構化的需求字典
+
+    Args:
+        on_category_complete: 每完成一個類別時調用 on_category_complete(category_key, category_data)
+            （可選，例如在背景預先摘要該類別）
     """
     from config.presales_questions import PRESALES_QUESTION_CATEGORIES
     
@@ -83,6 +89,8 @@ def collect_user_requirements() -> Dict[str, List[Dict[str, str]]]:
                 "category_name": category_name,
                 "answers": category_answers
             }
+            if on_category_complete:
+                on_category_complete(category_key, user_requirements[category_key])
     
     return user_requirements
 
@@ -94,19 +102,23 @@ def format_requirements_for_agent(user_requirements: Dict) -> str:
     formatted += "以下是客戶對各類問題的回答：\n\n"
     
     for category_key, category_data in user_requirements.items():
-        category_name = category_data["category_name"]
-        answers = category_data["answers"]
-        
-        formatted += f"## {category_name}\n\n"
-        
-        for answer_data in answers:
-            formatted += f"**問題：** {answer_data['question']}\n"
-            formatted += f"**回答：** {answer_data['answer']}\n\n"
-        
-        formatted += "\n"
+        formatted += format_category_for_agent(category_data)
     
     return formatted
 
+def format_category_for_agent(category_data: Dict) -> str:
+    """
+    將單個類別的回答格式化為文本（## 類別名稱 + 問答）
+    """
+    formatted = f"## {category_data['category_name']}\n\n"
+    
+    for answer_data in category_data["answers"]:
+        formatted += f"**問題：** {answer_data['question']}\n"
+        formatted += f"**回答：** {answer_data['answer']}\n\n"
+    
+    formatted += "\n"
+    return formatted
+
 def save_requirements_to_file(user_requirements: Dict, filename: str = "output/user_requirements.md"):
     """保存用戶需求到文件"""
     import os
@@ -119,13 +131,16 @@ def save_requirements_to_file(user_requirements: Dict, filename: str = "output/u
     
     return filename
 
-def interactive_requirements_collection() -> str:
+def interactive_requirements_collection(on_category_complete: Optional[Callable[[str, Dict], None]] = None) -> str:
     """
     交互式收集用戶需求
     返回格式化後的需求文本（供 Agent 使用）
+    
+    Args:
+        on_category_complete: 每完成一個類別時的回調（見 collect_user_requirements）
     """
     try:
-        user_requirements = collect_user_requirements()
+        user_requirements = collect_user_requirements(on_category_complete)
         
         if not user_requirements:
             print("\n⚠️  未收集到任何需求信息")
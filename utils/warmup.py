@@ -0,0 +1,149 @@
+"""
+啟動預熱
+使用者填寫問卷的同時，在背景線程中先完成 Crew 的準備工作（Ollama 探測、LLM 與 Agent 建立）、
+預先建立 API 連線並把 local model 載入 Ollama，問卷完成後直接取用準備好的結果，
+Crew 開始執行時第一個 LLM 調用即可立即發出
+
+預熱線程的日誌在取用結果（問卷結束）前只寫入日誌檔案，不在控制台輸出，避免與問卷的輸入提示交錯
+"""
+import logging
+import os
+import threading
+from typing import Any, Callable, Optional
+
+import requests
+
+from .logger_config import mute_console_thread
+
+logger = logging.getLogger(__name__)
+
+WARMUP_THREAD_NAME = "kano-warmup"
+
+# 環境變數：設定為 0 / false 可停用啟動預熱（問卷完成後才建立 Crew）
+WARMUP_ENV = "KANO_WARMUP"
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+
+# 預熱後 local model 在 Ollama 中保留的時間（涵蓋填寫問卷的時間）
+OLLAMA_KEEP_ALIVE = "30m"
+
+def is_warmup_enabled() -> bool:
+    return os.getenv(WARMUP_ENV, "1").lower() not in ("0", "false", "no")
+
+def prewarm_connection(llm, timeout: float = 5.0) -> bool:
+    """
+    預先建立 LLM 客戶端的 HTTP 連線（TLS 握手、連線池）
+
+    OpenAI 相容客戶端（OpenAI / DeepSeek）以一次 models.list() 請求建立連線，
+    with_options() 返回的副本與原客戶端共用同一個連線池；其他客戶端不處理
+    """
+    client = getattr(llm, "client", None) or getattr(llm, "root_client", None)
+    with_options = getattr(client, "with_options", None)
+    if not callable(with_options):
+        return False
+    try:
+        with_options(timeout=timeout, max_retries=0).models.list()
+        return True
+    except Exception as e:
+        logger.debug(f"預先建立連線失敗（不影響執行）: {e}")
+        return False
+
+def preload_ollama_model(model: str, timeout: float = 120.0) -> bool:
+    """將 local model 載入 Ollama（不生成內容），避免第一個調用等待模型載入"""
+    if model.startswith("ollama/"):
+        model = model[len("ollama/"):]
+    try:
+        response = requests.post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=timeout,
+        )
+        if response.status_code == 200:
+            logger.debug(f"✓ 已預先載入 local model: {model}")
+            return True
+        logger.debug(f"預先載入 local model {model} 失敗: HTTP {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        logger.debug(f"預先載入 local model {model} 失敗: {e}")
+    return False
+
+class Warmup:
+    """
+    背景準備工作
+
+    start() 在背景線程中執行準備函數，take() 取用結果；
+    準備時的配置指紋與取用時不同（例如 GUI 中修改了模型配置）時不取用，由調用方重新建立
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+        self._fingerprint: Optional[str] = None
+        self._result: Any = None
+
+    def start(self, prepare: Callable[[], Any], fingerprint: str) -> bool:
+        """
+        在背景線程中執行 prepare()
+
+        Returns:
+            是否啟動了新的預熱（相同指紋的預熱已在進行或已完成時不重複啟動）
+        """
+        with self._lock:
+            if self._thread is not None and self._fingerprint == fingerprint:
+                return False
+            done = threading.Event()
+            self._done, self._fingerprint, self._result = done, fingerprint, None
+
+            def run():
+                try:
+                    result = prepare()
+                except Exception as e:
+                    logger.warning(f"背景預熱失敗，將在開始執行時重新建立: {e}")
+                    result = None
+                with self._lock:
+                    if self._done is done:
+                        self._result = result
+                done.set()
+
+            mute_console_thread(WARMUP_THREAD_NAME)
+            self._thread = threading.Thread(target=run, name=WARMUP_THREAD_NAME, daemon=True)
+            self._thread.start()
+        logger.debug("🔥 已在背景開始預熱 Crew（LLM 建立、連線與 local model 載入）")
+        return True
+
+    def is_ready(self, fingerprint: str) -> bool:
+        """是否有指紋相符且已完成、尚未取用的預熱結果"""
+        with self._lock:
+            return self._thread is not None and self._fingerprint == fingerprint and self._done.is_set() and self._result is not None
+
+    def take(self, fingerprint: str, timeout: Optional[float] = None) -> Any:
+        """
+        取用預熱結果（等待進行中的預熱完成），每個結果只能取用一次；調用後預熱線程的日誌恢復在控制台輸出
+
+        Returns:
+            預熱結果；沒有預熱、指紋不符、預熱失敗或等待逾時時返回 None
+        """
+        mute_console_thread(WARMUP_THREAD_NAME, muted=False)
+        with self._lock:
+            if self._thread is None or self._fingerprint != fingerprint:
+                return None
+            done = self._done
+        if not done.wait(timeout):
+            logger.warning("等待背景預熱逾時，將重新建立")
+            return None
+        with self._lock:
+            if self._done is not done:
+                return None
+            result, self._result = self._result, None
+            self._thread, self._fingerprint = None, None
+        return result
+
+# 全局實例
+_warmup: Optional[Warmup] = None
+
+def get_warmup() -> Warmup:
+    """獲取全局預熱實例"""
+    global _warmup
+    if _warmup is None:
+        _warmup = Warmup()
+    return _warmup
@@ -0,0 +1,195 @@
+"""
+階段逾時與停滯監控
+- task_timeout：每個任務（階段）的牆鐘時間上限，超過後中止並在報告中標記為 timed_out
+- stall_timeout：單次 LLM 調用沒有任何進展（串流輸出）的上限，超過後關閉該請求並重試，仍停滯則降級到備用模型
+兩者均按 Role 配置（config.DEFAULT_LLM_CONFIG / 環境變數），0 表示不限制
+
+進展按每次調用記錄（並行的分片 / 章節調用互不掩蓋）；不以串流方式調用的模型（例如 Gemini、Ollama 或 KANO_STREAMING=0）
+沒有中途進展可觀察，不檢查停滯，只由 request_timeout 限制單個請求
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .api_logger import get_api_logger
+from .cancellation import abort_call, supervise_calls, track_call_progress
+from .continuation import is_stream_recorded
+from .llm_hooks import install_call_hook
+from .llm_invoke import invoke_llm
+from .stream_bus import get_stream_bus, TASK_START, TASK_END
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+class StageTimeoutError(Exception):
+    """階段超過 task_timeout"""
+
+class StallTimeoutError(Exception):
+    """LLM 調用超過 stall_timeout 沒有進展"""
+
+class StageWatchdog:
+    """按 Agent 配置的階段逾時與停滯監控"""
+
+    def __init__(self):
+        # Agent 配置鍵 -> {"task_timeout": 秒, "stall_timeout": 秒}
+        self.limits: Dict[str, Dict[str, float]] = {}
+        self._deadlines: Dict[str, float] = {}      # 任務名稱 -> 截止時間
+        self._current_task: Dict[str, str] = {}     # Agent 配置鍵 -> 進行中的任務
+        self._timed_out = set()
+        self._lock = threading.Lock()
+
+    def configure(self, agent_key: str, task_timeout: float = 0, stall_timeout: float = 0):
+        """設定 Agent 的逾時限制（秒，0 表示不限制）"""
+        with self._lock:
+            self.limits[agent_key] = {"task_timeout": task_timeout or 0, "stall_timeout": stall_timeout or 0}
+
+    def on_stream_event(self, event: Dict):
+        """串流匯流排訂閱者：任務開始時設定截止時間，任務結束時清除"""
+        agent_key, task_name = event.get("agent"), event.get("task")
+        now = time.time()
+        with self._lock:
+            if event["type"] == TASK_START and task_name:
+                timeout = self.limits.get(agent_key, {}).get("task_timeout", 0)
+                if timeout:
+                    self._deadlines[task_name] = now + timeout
+                self._timed_out.discard(task_name)
+                if agent_key:
+                    self._current_task[agent_key] = task_name
+            elif event["type"] == TASK_END and task_name:
+                self._deadlines.pop(task_name, None)
+                if agent_key and self._current_task.get(agent_key) == task_name:
+                    self._current_task.pop(agent_key, None)
+
+    def current_task(self, agent_key: str) -> Optional[str]:
+        with self._lock:
+            return self._current_task.get(agent_key)
+
+    def is_timed_out(self, task_name: str) -> bool:
+        with self._lock:
+            return task_name in self._timed_out
+
+    def _mark_timed_out(self, task_name: str, detail: str):
+        with self._lock:
+            if task_name in self._timed_out:
+                return
+            self._timed_out.add(task_name)
+        get_api_logger().set_stage_status(task_name, "timed_out", detail)
+        get_tracer().instant("階段逾時", cat="timeout", task=task_name, detail=detail)
+
+    def check_deadline(self, task_name: Optional[str]):
+        """任務超過截止時間時拋出 StageTimeoutError"""
+        if not task_name:
+            return
+        with self._lock:
+            deadline = self._deadlines.get(task_name)
+        if deadline is not None and time.time() > deadline:
+            detail = "超過任務時間上限 task_timeout"
+            self._mark_timed_out(task_name, detail)
+            raise StageTimeoutError(f"階段 {task_name} 逾時：{detail}")
+
+    def check_all_deadlines(self, *_args, **_kwargs):
+        """Crew step_callback：檢查所有進行中任務的截止時間"""
+        with self._lock:
+            tasks = list(self._deadlines)
+        for task_name in tasks:
+            self.check_deadline(task_name)
+
+    def check_call(self, agent_key: str, task_name: Optional[str], progress: Optional[Dict] = None):
+        """
+        進行中調用的定期檢查（由 supervise_calls 在等待期間調用）
+
+        Args:
+            progress: 該次調用的進展記錄（track_call_progress），None 表示不檢查停滯
+        """
+        self.check_deadline(task_name)
+        if progress is None:
+            return
+        stall_timeout = self.limits.get(agent_key, {}).get("stall_timeout", 0)
+        if not stall_timeout:
+            return
+        idle = time.time() - progress["last"]
+        if idle > stall_timeout:
+            # 關閉停滯的請求，避免背景線程中的 HTTP 請求繼續佔用連線
+            abort_call(progress)
+            raise StallTimeoutError(f"LLM 調用 {idle:.0f} 秒沒有進展（stall_timeout={stall_timeout:g}s）")
+
+# 全局實例
+_watchdog: Optional[StageWatchdog] = None
+_watchdog_lock = threading.Lock()
+
+def get_watchdog() -> StageWatchdog:
+    """獲取全局階段監控實例（首次調用時訂閱串流匯流排）"""
+    global _watchdog
+    with _watchdog_lock:
+        if _watchdog is None:
+            _watchdog = StageWatchdog()
+            get_stream_bus().subscribe(_watchdog.on_stream_event)
+        return _watchdog
+
+def _task_name_from_kwargs(kwargs: Dict) -> Optional[str]:
+    task = kwargs.get("from_task")
+    return getattr(task, "name", None) if task is not None else None
+
+def install_watchdog(
+    llm,
+    agent_key: str,
+    model: str = "unknown",
+    llm_type: str = "api",
+    stall_retries: int = 1,
+    fallback_factory: Optional[Callable[[], object]] = None,
+) -> bool:
+    """
+    為 LLM 實例安裝逾時監控
+
+    必須在 install_cancellation() / install_continuation() 之後安裝（外層），監控檢查才會在可中斷的等待中執行；
+    只有以串流方式調用、且串流經由包裝的 client 記錄進展的實例才檢查停滯
+
+    Args:
+        llm: LLM 實例
+        agent_key: Agent 配置鍵（對應 StageWatchdog.configure）
+        model / llm_type: 用於 API 日誌記錄
+        stall_retries: 停滯後重試的次數
+        fallback_factory: 重試後仍停滯時建立備用 LLM 的函數（可選，只會建立一次）
+    """
+    watchdog = get_watchdog()
+    fallback = {}
+    check_stall = is_stream_recorded(llm)
+
+    def watchdog_hook(llm, call_next, *args, **kwargs):
+        task_name = _task_name_from_kwargs(kwargs) or watchdog.current_task(agent_key)
+        for attempt in range(stall_retries + 1):
+            watchdog.check_deadline(task_name)
+            started = time.time()
+            try:
+                with track_call_progress() as progress, \
+                        supervise_calls(lambda: watchdog.check_call(agent_key, task_name, progress if check_stall else None)):
+                    return call_next(*args, **kwargs)
+            except StallTimeoutError as e:
+                get_api_logger().log_call(
+                    agent_name=agent_key, model=model, llm_type=llm_type, status="retry",
+                    error=str(e), duration=time.time() - started, task=task_name,
+                )
+                get_tracer().instant("調用停滯", cat="timeout", agent=agent_key, task=task_name)
+                if attempt < stall_retries:
+                    logger.warning(f"⏱️ {agent_key} {e}，中止並重試（{attempt + 1}/{stall_retries}）")
+                    continue
+                if fallback_factory is None:
+                    raise
+                last_error = e
+
+        # 重試後仍停滯：降級到備用模型（只檢查截止時間，不套用主模型的停滯限制）
+        if "llm" not in fallback:
+            fallback["llm"] = fallback_factory()
+        logger.warning(f"⏱️ {agent_key} 重試後仍停滯，降級到備用模型")
+        messages = args[0] if args else kwargs.get("messages")
+        started = time.time()
+        try:
+            with supervise_calls(lambda: watchdog.check_call(agent_key, task_name)):
+                return invoke_llm(fallback["llm"], messages)
+        except StageTimeoutError:
+            raise
+        except Exception as e:
+            raise StallTimeoutError(f"{last_error}；備用模型調用失敗: {e}") from e
+
+    return install_call_hook(llm, watchdog_hook, "watchdog")